@@ -0,0 +1,311 @@
+"""
+Giới hạn số request được dùng database cùng lúc (admission control), để khi
+MySQL chậm đi các request không dồn lại chờ pool tới khi hết giờ.
+
+- `AdmissionMiddleware` gắn cho mỗi request một `Ticket` theo đường dẫn: lớp
+  ưu tiên (giỏ hàng/thanh toán/đăng nhập > tài khoản/quản trị > xem hàng >
+  xuất/nhập dữ liệu) và giới hạn riêng của route nếu có.
+- Request chỉ xin suất ở lần `run_db`/`run_db_read` đầu tiên và giữ suất tới
+  khi gửi xong response; trang lấy từ cache không tốn suất nào.
+- Mỗi lớp chỉ được dùng một phần của giới hạn chung (`share`), phần còn lại
+  để dành cho lớp ưu tiên cao hơn. Không còn suất thì chờ trong hàng đợi có
+  giới hạn (lớp cao được gọi trước); chờ quá lâu, hoặc hàng đợi đầy mà không
+  có request nào ưu tiên thấp hơn để bỏ, thì ném `Overloaded` và route trả
+  503 + Retry-After ngay.
+- Giới hạn chung tự điều chỉnh theo AIMD: mỗi `ADMISSION_WINDOW` giây, nếu
+  thời gian trung bình của một lần gọi DB (gồm cả chờ thread và chờ pool)
+  vượt `ADMISSION_LATENCY_TARGET` hoặc có lần hết giờ chờ pool thì nhân giới
+  hạn với `ADMISSION_DECREASE`; nếu giới hạn đã được dùng gần hết mà DB vẫn
+  nhanh thì tăng thêm 1.
+
+Khi vừa phải từ chối request (`degraded`), trang catalog trong page_cache dù
+đã cũ vẫn được gửi thay vì truy vấn lại.
+
+Mọi trạng thái chỉ được đọc/ghi trên event loop nên không cần khóa.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_INITIAL_LIMIT = float(os.getenv("ADMISSION_INITIAL_LIMIT", "20"))
+ADMISSION_MIN_LIMIT = float(os.getenv("ADMISSION_MIN_LIMIT", "2"))
+ADMISSION_MAX_LIMIT = float(os.getenv("ADMISSION_MAX_LIMIT", "200"))
+# Thời gian trung bình (giây) của một lần gọi DB mà trên đó coi là DB đang quá tải
+ADMISSION_LATENCY_TARGET = float(os.getenv("ADMISSION_LATENCY_TARGET", "0.1"))
+ADMISSION_WINDOW = float(os.getenv("ADMISSION_WINDOW", "1"))
+ADMISSION_DECREASE = float(os.getenv("ADMISSION_DECREASE", "0.7"))
+ADMISSION_QUEUE_MAX = int(os.getenv("ADMISSION_QUEUE_MAX", "100"))
+# Thời gian chờ suất tối đa (giây) của lớp 'critical'; các lớp khác chờ ít hơn
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "2"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+# Sau lần từ chối gần nhất, coi là đang quá tải trong bao lâu (giây)
+ADMISSION_DEGRADED_SECONDS = float(os.getenv("ADMISSION_DEGRADED_SECONDS", "5"))
+
+# lớp -> (độ ưu tiên, phần giới hạn chung được dùng, hệ số thời gian chờ)
+CLASSES = {
+    "critical": (0, 1.0, 1.0),
+    "account": (1, 0.9, 0.5),
+    "browse": (2, 0.75, 0.25),
+    "bulk": (3, 0.25, 0.1),
+}
+
+# (tiền tố đường dẫn, lớp hoặc None nếu không giới hạn, số request đồng thời tối đa của route)
+# Dòng đầu tiên khớp được dùng; "/" chỉ khớp đúng trang chủ, còn lại rơi vào "browse"
+ROUTES = [
+    ("/static", None, None),
+    ("/health", None, None),
+    ("/metrics", None, None),
+    ("/checkout", "critical", None),
+    ("/cart", "critical", None),
+    ("/api/cart", "critical", None),
+    ("/login", "critical", None),
+    ("/register", "critical", None),
+    ("/api/products/export", "bulk", 2),
+    ("/admin/orders/export", "bulk", 2),
+    ("/admin", "account", None),
+    ("/profile", "account", None),
+    ("/edit_profile", "account", None),
+    ("/products", "browse", None),
+    ("/product", "browse", None),
+    ("/img", "browse", None),
+]
+
+
+class Overloaded(Exception):
+    """Không nhận thêm request dùng DB lúc này; route trả 503 + Retry-After."""
+
+    def __init__(self, retry_after=ADMISSION_RETRY_AFTER):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    __slots__ = ("route", "cls", "priority", "share", "max_wait", "route_limit", "admitted", "finished", "waiter")
+
+    def __init__(self, route, cls, route_limit, max_wait=ADMISSION_MAX_WAIT):
+        self.route = route
+        self.cls = cls
+        self.priority, self.share, wait_factor = CLASSES[cls]
+        self.max_wait = max_wait * wait_factor
+        self.route_limit = route_limit
+        self.admitted = False
+        # Response đã gửi xong; task nền còn giữ ticket trong context không xin suất nữa
+        self.finished = False
+        self.waiter = None
+
+
+def classify(path):
+    """Ticket cho một đường dẫn, None nếu không giới hạn (file tĩnh, health)."""
+    for prefix, cls, route_limit in ROUTES:
+        if path.startswith(prefix):
+            return Ticket(prefix, cls, route_limit) if cls else None
+    return Ticket(path if path == "/" else "other", "browse", None)
+
+
+class AdmissionController:
+    def __init__(self, initial_limit=ADMISSION_INITIAL_LIMIT, min_limit=ADMISSION_MIN_LIMIT,
+                 max_limit=ADMISSION_MAX_LIMIT, latency_target=ADMISSION_LATENCY_TARGET,
+                 window=ADMISSION_WINDOW, decrease=ADMISSION_DECREASE, queue_max=ADMISSION_QUEUE_MAX):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.window = window
+        self.decrease = decrease
+        self.queue_max = queue_max
+
+        self._in_flight = 0
+        self._by_route = {}  # route -> số request đang giữ suất
+        self._waiters = [deque() for _ in CLASSES]  # theo độ ưu tiên
+        self._queued = 0
+
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+        self._window_seconds = 0.0
+        self._window_timeouts = 0
+        self._window_peak = 0
+
+        self._admitted = 0
+        self._waited = 0
+        self._rejected = {cls: 0 for cls in CLASSES}
+        self._shed = 0
+        self._increases = 0
+        self._decreases = 0
+        self._last_rejection = None
+
+    # ----- suất -----
+
+    def _fits(self, ticket):
+        if self._in_flight >= max(1, int(self.limit * ticket.share)):
+            return False
+        if ticket.route_limit is not None and self._by_route.get(ticket.route, 0) >= ticket.route_limit:
+            return False
+        return True
+
+    def _take(self, ticket):
+        ticket.admitted = True
+        self._in_flight += 1
+        self._by_route[ticket.route] = self._by_route.get(ticket.route, 0) + 1
+        self._window_peak = max(self._window_peak, self._in_flight)
+        self._admitted += 1
+
+    def _reject(self, ticket):
+        self._rejected[ticket.cls] += 1
+        self._last_rejection = time.monotonic()
+        return Overloaded()
+
+    def _dispatch(self):
+        """Trao suất vừa trống cho các request đang chờ, lớp ưu tiên cao trước."""
+        for waiters in self._waiters:
+            for ticket in list(waiters):
+                if ticket.waiter.done():
+                    continue
+                if not self._fits(ticket):
+                    continue
+                waiters.remove(ticket)
+                self._queued -= 1
+                self._take(ticket)
+                ticket.waiter.set_result(None)
+
+    def _dequeue(self, ticket):
+        try:
+            self._waiters[ticket.priority].remove(ticket)
+        except ValueError:
+            return
+        self._queued -= 1
+
+    def _lowest_waiter(self):
+        for waiters in reversed(self._waiters):
+            if waiters:
+                return waiters[-1]
+        return None
+
+    async def admit(self, ticket):
+        """Chờ tới khi có suất cho `ticket`; ném Overloaded nếu không được nhận."""
+        if ticket.admitted or ticket.finished:
+            return
+        # Không chen trước request cùng lớp hoặc lớp cao hơn đang chờ
+        ahead = any(self._waiters[priority] for priority in range(ticket.priority + 1))
+        if not ahead and self._fits(ticket):
+            self._take(ticket)
+            return
+
+        if self._queued >= self.queue_max:
+            lowest = self._lowest_waiter()
+            if lowest is None or lowest.priority <= ticket.priority:
+                raise self._reject(ticket)
+            # Bỏ request ưu tiên thấp nhất đang chờ để nhường chỗ
+            self._dequeue(lowest)
+            if not lowest.waiter.done():
+                self._shed += 1
+                lowest.waiter.set_exception(self._reject(lowest))
+
+        ticket.waiter = asyncio.get_running_loop().create_future()
+        self._waiters[ticket.priority].append(ticket)
+        self._queued += 1
+        self._waited += 1
+        try:
+            await asyncio.wait_for(ticket.waiter, ticket.max_wait)
+        except asyncio.TimeoutError:
+            raise self._reject(ticket) from None
+        finally:
+            if not ticket.admitted:
+                self._dequeue(ticket)
+
+    def release(self, ticket):
+        ticket.finished = True
+        if not ticket.admitted:
+            return
+        ticket.admitted = False
+        self._in_flight -= 1
+        remaining = self._by_route[ticket.route] - 1
+        if remaining:
+            self._by_route[ticket.route] = remaining
+        else:
+            del self._by_route[ticket.route]
+        self._dispatch()
+
+    # ----- điều chỉnh giới hạn (AIMD) -----
+
+    def record(self, seconds, timed_out=False):
+        """Gọi sau mỗi lần run_db của một request có ticket: thời gian từ lúc gọi tới lúc xong (giây)."""
+        self._window_calls += 1
+        self._window_seconds += seconds
+        if timed_out:
+            self._window_timeouts += 1
+
+        now = time.monotonic()
+        if now - self._window_start < self.window:
+            return
+        average = self._window_seconds / self._window_calls
+        if self._window_timeouts or average > self.latency_target:
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            self._decreases += 1
+        elif self._window_peak >= int(self.limit * CLASSES["browse"][1]):
+            # Đã dùng gần hết giới hạn mà DB vẫn nhanh: thử nhận thêm
+            self.limit = min(self.max_limit, self.limit + 1)
+            self._increases += 1
+            self._dispatch()
+        self._window_start = now
+        self._window_calls = 0
+        self._window_seconds = 0.0
+        self._window_timeouts = 0
+        self._window_peak = self._in_flight
+
+    @property
+    def degraded(self):
+        return (self._last_rejection is not None
+                and time.monotonic() - self._last_rejection < ADMISSION_DEGRADED_SECONDS)
+
+    def stats(self):
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "limit": round(self.limit, 2),
+            "in_flight": self._in_flight,
+            "in_flight_by_route": dict(self._by_route),
+            "queued": self._queued,
+            "degraded": self.degraded,
+            "admitted": self._admitted,
+            "waited": self._waited,
+            "rejected": dict(self._rejected),
+            "shed": self._shed,
+            "increases": self._increases,
+            "decreases": self._decreases,
+        }
+
+
+admission = AdmissionController()
+current_ticket = ContextVar("admission_ticket", default=None)
+
+
+async def admit_current():
+    """
+    Xin suất cho request hiện tại ngay (vd. trước khi bắt đầu gửi một trang
+    theo luồng, để Overloaded xảy ra trước khi header đã đi).
+    """
+    ticket = current_ticket.get()
+    if ticket is not None and not ticket.admitted:
+        await admission.admit(ticket)
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI thuần: gắn Ticket cho request và trả suất khi response đã gửi xong."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        ticket = classify(scope["path"])
+        token = current_ticket.set(ticket)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_ticket.reset(token)
+            if ticket is not None:
+                admission.release(ticket)
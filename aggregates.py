@@ -0,0 +1,331 @@
+"""
+Số liệu bán hàng cho trang /admin, lưu trong các bảng thongke_* (migrations/003)
+nên mọi worker đọc cùng một số liệu.
+
+Đơn hàng là các dòng giohang đã rời trạng thái 'Đang mua' (giỏ đang giữ hàng
+chờ thanh toán vẫn tính là "đang trong giỏ"). Thay vì quét toàn bộ lịch sử
+đơn mỗi lần mở dashboard, các bộ đếm được cộng dồn ngay trong giao dịch ghi:
+
+- `record_order(cursor, lines, status)` khi một giỏ được chốt thành đơn
+  (checkout.confirm_order): doanh thu theo giá bán đã ghi trên từng dòng
+  (chitietgiohang.donGia), số lượng bán theo sản phẩm/danh mục/thương hiệu,
+  số đơn theo trạng thái;
+- thêm vào giỏ cộng thẳng vào thongke_giohang (cart.add_cart_item); các thao
+  tác không biết chênh lệch (sửa/xóa dòng, hủy thanh toán) chỉ đánh dấu
+  `cart_changed()` và phần "đang trong giỏ" được sửa ở chu kỳ sau (chỉ quét
+  giỏ đang mua).
+
+`reconcile(db)` tính lại từ lịch sử theo chu kỳ để sửa sai lệch (vd. đơn bị
+sửa tay trong DB). Lịch sử và bộ đếm được đọc trong cùng một snapshot, phần
+lệch được *cộng* vào bộ đếm nên các đơn chốt trong lúc quét không bị ghi đè;
+khóa tên `AGGREGATES_LOCK` giữ cho chỉ một worker sửa tại một thời điểm.
+`snapshot(db)` chỉ đọc vài dòng đầu theo index nên thời gian không phụ thuộc
+số đơn; sắp hết hàng đọc thẳng từ sanpham qua idx_sanpham_soluong.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from cart import NOT_ORDER_STATUSES
+
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+DASHBOARD_TOP_N = int(os.getenv("DASHBOARD_TOP_N", "10"))
+AGGREGATES_LOCK = os.getenv("AGGREGATES_LOCK", "thongke_banhang")
+
+# Nhóm trong thongke_banhang; sản phẩm chưa có danh mục/thương hiệu ghi mã 0
+GROUP_PRODUCT = "sanpham"
+GROUP_CATEGORY = "danhmuc"
+GROUP_BRAND = "thuonghieu"
+
+_ADD_SALES = """
+    INSERT INTO thongke_banhang (nhom, ma, soLuong, doanhThu)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE soLuong  = soLuong + VALUES(soLuong),
+                            doanhThu = doanhThu + VALUES(doanhThu)
+"""
+
+_ADD_ORDERS = """
+    INSERT INTO thongke_donhang (trangThai, soDon)
+    VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE soDon = soDon + VALUES(soDon)
+"""
+
+_ADD_CART_UNITS = """
+    INSERT INTO thongke_giohang (maSP, soLuong)
+    VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE soLuong = soLuong + VALUES(soLuong)
+"""
+
+
+def _sales_keys(product_id, category_id, brand_id):
+    return ((GROUP_PRODUCT, product_id), (GROUP_CATEGORY, category_id or 0), (GROUP_BRAND, brand_id or 0))
+
+
+def _drift(actual, counted):
+    """Phần phải cộng vào bộ đếm để khớp số tính lại: {khóa: tuple chênh lệch khác 0}."""
+    drift = {}
+    for key in actual.keys() | counted.keys():
+        have = counted.get(key)
+        want = actual.get(key)
+        width = len(want if want is not None else have)
+        delta = tuple((want[i] if want else 0) - (have[i] if have else 0) for i in range(width))
+        if any(delta):
+            drift[key] = delta
+    return drift
+
+
+class SalesAggregates:
+    def __init__(self, low_stock_threshold=LOW_STOCK_THRESHOLD):
+        self.low_stock_threshold = low_stock_threshold
+        self._lock = threading.Lock()
+        self._cart_stale = True
+        self._reconciled_at = None
+        self._last_drift = None
+        self._skipped = 0
+        self._incremental_updates = 0
+
+    # ----- cộng dồn (trong giao dịch của thao tác ghi) -----
+
+    def record_order(self, cursor, lines, status):
+        """
+        Cộng một giỏ vừa được chốt thành đơn với trạng thái `status`; gọi trước
+        khi commit giao dịch chốt đơn.
+        lines: [{"maSP", "maDM", "maTH", "soLuong", "gia"}], gia là giá bán của dòng.
+        """
+        sales = {}
+        for line in lines:
+            units = line['soLuong']
+            revenue = units * line['gia']
+            for key in _sales_keys(line['maSP'], line['maDM'], line['maTH']):
+                total = sales.setdefault(key, [0, 0])
+                total[0] += units
+                total[1] += revenue
+        # Theo thứ tự khóa: hai đơn đồng thời khóa các dòng thongke cùng một thứ tự
+        cursor.executemany(_ADD_SALES, [(group, key, units, revenue)
+                                        for (group, key), (units, revenue) in sorted(sales.items())])
+        cursor.execute(_ADD_ORDERS, (status, 1))
+        cursor.executemany("UPDATE thongke_giohang SET soLuong = soLuong - %s WHERE maSP = %s",
+                           [(line['soLuong'], line['maSP']) for line in sorted(lines, key=lambda line: line['maSP'])])
+        with self._lock:
+            self._incremental_updates += 1
+
+    def record_order_status(self, cursor, old_status, new_status):
+        """Một đơn đổi trạng thái; gọi trong giao dịch đổi trạng thái."""
+        cursor.execute("UPDATE thongke_donhang SET soDon = soDon - 1 WHERE trangThai = %s AND soDon > 0",
+                       (old_status,))
+        cursor.execute(_ADD_ORDERS, (new_status, 1))
+        with self._lock:
+            self._incremental_updates += 1
+
+    def cart_changed(self):
+        """Giỏ hàng đổi mà không biết chênh lệch: sửa ở lần làm mới sau."""
+        self._cart_stale = True
+
+    # ----- sửa lệch từ database -----
+
+    @property
+    def cart_stale(self):
+        return self._cart_stale
+
+    @staticmethod
+    @contextmanager
+    def _exclusive(db):
+        """Khóa tên MySQL (GET_LOCK); worker khác đang giữ thì trả về False ngay, không chờ."""
+        cursor = db.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (AGGREGATES_LOCK,))
+        acquired = cursor.fetchone()[0] == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (AGGREGATES_LOCK,))
+                cursor.fetchone()
+            cursor.close()
+
+    @staticmethod
+    def _apply(db, statement, rows):
+        """Cộng phần lệch bằng câu upsert cộng dồn, theo thứ tự khóa như lúc ghi."""
+        if not rows:
+            return
+        cursor = db.cursor()
+        cursor.executemany(statement, sorted(rows))
+        db.commit()
+        cursor.close()
+
+    def _cart_drift(self, db):
+        cursor = db.cursor()
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        cursor.execute("""
+                       SELECT ctgh.maSP, SUM(ctgh.soLuong)
+                       FROM giohang gh
+                                JOIN chitietgiohang ctgh ON ctgh.maGH = gh.maGH
+                       WHERE gh.trangThai IN (%s, %s)
+                       GROUP BY ctgh.maSP
+                       """, NOT_ORDER_STATUSES)
+        actual = {product_id: (int(units),) for product_id, units in cursor.fetchall()}
+        cursor.execute("SELECT maSP, soLuong FROM thongke_giohang")
+        counted = {product_id: (units,) for product_id, units in cursor.fetchall()}
+        cursor.close()
+        db.rollback()
+        return _drift(actual, counted)
+
+    def _refresh_cart_units(self, db):
+        drift = self._cart_drift(db)
+        self._apply(db, _ADD_CART_UNITS, [(product_id, units) for product_id, (units,) in drift.items()])
+        cursor = db.cursor()
+        cursor.execute("DELETE FROM thongke_giohang WHERE soLuong = 0")
+        db.commit()
+        cursor.close()
+
+    def refresh_cart_units(self, db):
+        """Sửa số lượng đang trong giỏ theo các giỏ đang mua/chờ thanh toán (không quét lịch sử)."""
+        self._cart_stale = False
+        with self._exclusive(db) as acquired:
+            if not acquired:
+                # Worker khác đang sửa, có thể từ snapshot trước thay đổi của worker này
+                self._cart_stale = True
+                return
+            self._refresh_cart_units(db)
+
+    def reconcile(self, db):
+        """Đối soát với lịch sử đơn (chạy nền theo chu kỳ), cộng phần lệch vào bộ đếm và ghi lại độ lệch."""
+        with self._exclusive(db) as acquired:
+            if not acquired:
+                with self._lock:
+                    self._skipped += 1
+                return
+
+            cursor = db.cursor()
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+            cursor.execute("SELECT trangThai, COUNT(*) FROM giohang WHERE trangThai NOT IN (%s, %s) GROUP BY trangThai",
+                           NOT_ORDER_STATUSES)
+            orders_actual = {status: (count,) for status, count in cursor.fetchall()}
+            cursor.execute("SELECT trangThai, soDon FROM thongke_donhang")
+            orders_counted = {status: (count,) for status, count in cursor.fetchall()}
+
+            cursor.execute("""
+                           SELECT ctgh.maSP, sp.maDM, sp.maTH,
+                                  SUM(ctgh.soLuong), SUM(ctgh.soLuong * ctgh.donGia)
+                           FROM giohang gh
+                                    JOIN chitietgiohang ctgh ON ctgh.maGH = gh.maGH
+                                    LEFT JOIN sanpham sp ON sp.maSP = ctgh.maSP
+                           WHERE gh.trangThai NOT IN (%s, %s)
+                           GROUP BY ctgh.maSP, sp.maDM, sp.maTH
+                           """, NOT_ORDER_STATUSES)
+            sales_actual = {}
+            for product_id, category_id, brand_id, units, revenue in cursor.fetchall():
+                for key in _sales_keys(product_id, category_id, brand_id):
+                    have = sales_actual.get(key, (0, 0))
+                    sales_actual[key] = (have[0] + int(units or 0), have[1] + (revenue or 0))
+            cursor.execute("SELECT nhom, ma, soLuong, doanhThu FROM thongke_banhang")
+            sales_counted = {(group, key): (units, revenue) for group, key, units, revenue in cursor.fetchall()}
+            cursor.close()
+            db.rollback()
+
+            orders_drift = _drift(orders_actual, orders_counted)
+            sales_drift = _drift(sales_actual, sales_counted)
+            self._apply(db, _ADD_ORDERS, [(status, count) for status, (count,) in orders_drift.items()])
+            self._apply(db, _ADD_SALES, [(group, key, units, revenue)
+                                         for (group, key), (units, revenue) in sales_drift.items()])
+            self._refresh_cart_units(db)
+            self._cart_stale = False
+
+        category_drift = [delta for (group, _), delta in sales_drift.items() if group == GROUP_CATEGORY]
+        with self._lock:
+            self._last_drift = {
+                "revenue": float(sum(delta[1] for delta in category_drift)),
+                "units": sum(delta[0] for delta in category_drift),
+                "orders": sum(delta[0] for delta in orders_drift.values()),
+            }
+            self._reconciled_at = time.time()
+
+    # ----- đọc -----
+
+    @staticmethod
+    def _rows(rows, labels):
+        return [{"id": key, "label": labels.get(key) or (f"#{key}" if key else "(chưa phân loại)"),
+                 "units": units,
+                 "revenue": revenue} for key, units, revenue in rows]
+
+    def snapshot(self, db, categories, brands, top_n=DASHBOARD_TOP_N):
+        """Dữ liệu cho dashboard; categories/brands: {mã: tên} để hiển thị."""
+        cursor = db.cursor()
+        cursor.execute("SELECT trangThai, soDon FROM thongke_donhang WHERE soDon > 0 ORDER BY trangThai")
+        orders_by_status = dict(cursor.fetchall())
+        cursor.execute("""
+                       SELECT COALESCE(SUM(soLuong), 0), COALESCE(SUM(doanhThu), 0)
+                       FROM thongke_banhang
+                       WHERE nhom = %s
+                       """, (GROUP_CATEGORY,))
+        units, revenue = cursor.fetchone()
+
+        top = {}
+        for group in (GROUP_PRODUCT, GROUP_CATEGORY, GROUP_BRAND):
+            cursor.execute("""
+                           SELECT ma, soLuong, doanhThu
+                           FROM thongke_banhang
+                           WHERE nhom = %s
+                             AND soLuong > 0
+                           ORDER BY soLuong DESC LIMIT %s
+                           """, (group, top_n))
+            top[group] = cursor.fetchall()
+
+        cursor.execute("""
+                       SELECT maSP, soLuong
+                       FROM thongke_giohang
+                       WHERE soLuong > 0
+                       ORDER BY soLuong DESC LIMIT %s
+                       """, (top_n,))
+        in_carts = cursor.fetchall()
+        cursor.execute("SELECT COALESCE(SUM(soLuong), 0) FROM thongke_giohang WHERE soLuong > 0")
+        in_carts_total = cursor.fetchone()[0]
+
+        cursor.execute("SELECT maSP, soLuong FROM sanpham WHERE soLuong <= %s ORDER BY soLuong",
+                       (self.low_stock_threshold,))
+        low_stock = cursor.fetchall()
+
+        product_ids = {row[0] for row in top[GROUP_PRODUCT]} | {row[0] for row in in_carts} \
+            | {row[0] for row in low_stock}
+        names = {}
+        if product_ids:
+            cursor.execute("SELECT maSP, ten FROM sanpham WHERE maSP IN ("
+                           + ", ".join(["%s"] * len(product_ids)) + ")", list(product_ids))
+            names = dict(cursor.fetchall())
+        cursor.close()
+
+        return {
+            "revenue": revenue,
+            "units": int(units),
+            "orders": sum(orders_by_status.values()),
+            "orders_by_status": orders_by_status,
+            "top_products": self._rows(top[GROUP_PRODUCT], names),
+            "top_categories": self._rows(top[GROUP_CATEGORY], categories),
+            "top_brands": self._rows(top[GROUP_BRAND], brands),
+            "in_carts": [{"id": product_id, "label": names.get(product_id) or f"#{product_id}",
+                          "units": units} for product_id, units in in_carts],
+            "in_carts_total": int(in_carts_total),
+            "low_stock": [{"id": product_id, "label": names.get(product_id) or f"#{product_id}",
+                           "stock": stock} for product_id, stock in low_stock],
+            "low_stock_threshold": self.low_stock_threshold,
+        }
+
+    def order_statuses(self, db):
+        cursor = db.cursor()
+        cursor.execute("SELECT trangThai FROM thongke_donhang WHERE soDon > 0 ORDER BY trangThai")
+        statuses = [status for status, in cursor.fetchall()]
+        cursor.close()
+        return statuses
+
+    def stats(self):
+        with self._lock:
+            return {
+                "incremental_updates": self._incremental_updates,
+                "cart_stale": self._cart_stale,
+                "reconciled_at": self._reconciled_at,
+                "reconcile_skipped": self._skipped,
+                "last_drift": self._last_drift,
+            }
+
+
+sales_aggregates = SalesAggregates()
@@ -0,0 +1,258 @@
+"""
+Đóng gói file tĩnh: tên file kèm hash nội dung, bản nén sẵn gzip/brotli và
+manifest.
+
+    python assets.py            # build static/ -> static/dist/ + static/dist/manifest.json
+    python assets.py --clean    # xóa các bản build cũ không còn trong manifest
+
+serve.py tự build khi khởi động master. Trong template vẫn viết
+`url_for('static', path='css/style.css')`: `url_for` ở đây trả về
+`/static/dist/css/style.<hash>.css` nếu file có trong manifest, ngược lại giữ
+nguyên đường dẫn gốc. `AssetFiles` phục vụ file đã hash với
+`Cache-Control: immutable` và chọn bản .br/.gz theo Accept-Encoding.
+
+Bản build cũ được giữ lại (trừ khi --clean) để trang đã render bởi worker
+cũ vẫn tải được CSS/JS trong lúc restart lần lượt.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+
+from jinja2 import pass_context
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn: không có thì chỉ build bản gzip
+    brotli = None
+
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+ASSETS_DIST = "dist"
+ASSETS_MANIFEST = "manifest.json"
+# "0" = bỏ qua manifest, dùng file gốc (chế độ --reload khi phát triển)
+ASSETS_FINGERPRINT = os.getenv("ASSETS_FINGERPRINT", "1") == "1"
+
+# Chỉ các loại file giao diện; ảnh sản phẩm không đi qua pipeline này
+ASSET_EXTENSIONS = (".css", ".js", ".svg", ".ico", ".png", ".gif", ".webp", ".woff", ".woff2")
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".ico")
+# File nhỏ hơn thế này nén xong thường không nhỏ hơn
+COMPRESS_MIN_BYTES = 256
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ENCODING_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _hashed_name(path, content):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def _write_atomic(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(content)
+    os.replace(path + ".tmp", path)
+
+
+def _source_files(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir):
+            dirs[:] = [d for d in dirs if d != ASSETS_DIST]
+        for name in sorted(files):
+            if name.endswith(ASSET_EXTENSIONS):
+                full_path = os.path.join(root, name)
+                yield os.path.relpath(full_path, static_dir).replace(os.sep, "/"), full_path
+
+
+def build(static_dir=STATIC_DIR, clean=False):
+    """Build mọi asset trong `static_dir` vào `static_dir/dist`, trả về manifest."""
+    dist_dir = os.path.join(static_dir, ASSETS_DIST)
+    assets = {}
+    for path, full_path in _source_files(static_dir):
+        with open(full_path, "rb") as f:
+            content = f.read()
+        hashed = _hashed_name(path, content)
+        target = os.path.join(dist_dir, hashed)
+        encodings = []
+        if path.endswith(COMPRESSIBLE_EXTENSIONS) and len(content) >= COMPRESS_MIN_BYTES:
+            variants = [("gzip", ".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+            if brotli is not None:
+                variants.insert(0, ("br", ".br", lambda data: brotli.compress(data, quality=11)))
+            for encoding, suffix, compress in variants:
+                if not os.path.exists(target + suffix):
+                    compressed = compress(content)
+                    if len(compressed) >= len(content):
+                        continue
+                    _write_atomic(target + suffix, compressed)
+                encodings.append(encoding)
+        if not os.path.exists(target):
+            _write_atomic(target, content)
+        assets[path] = {"file": f"{ASSETS_DIST}/{hashed}", "encodings": encodings}
+
+    manifest = {"assets": assets}
+    _write_atomic(os.path.join(dist_dir, ASSETS_MANIFEST),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+    if clean:
+        keep = {ASSETS_MANIFEST}
+        for entry in assets.values():
+            name = entry["file"][len(ASSETS_DIST) + 1:]
+            keep.add(name)
+            keep.update(name + suffix for encoding, suffix in ENCODING_SUFFIXES)
+        for root, _, files in os.walk(dist_dir):
+            for name in files:
+                rel = os.path.relpath(os.path.join(root, name), dist_dir).replace(os.sep, "/")
+                if rel not in keep:
+                    os.unlink(os.path.join(root, name))
+    return manifest
+
+
+class AssetManifest:
+    """Manifest đã build, nạp lại khi file manifest thay đổi."""
+
+    def __init__(self, static_dir=STATIC_DIR, enabled=ASSETS_FINGERPRINT):
+        self.static_dir = static_dir
+        self.enabled = enabled
+        self.path = os.path.join(static_dir, ASSETS_DIST, ASSETS_MANIFEST)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._assets = {}
+        self._encodings = {}  # "dist/css/style.<hash>.css" -> ["br", "gzip"]
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            assets = {}
+            if mtime is not None:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        assets = json.load(f)["assets"]
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error loading asset manifest: {e}")
+            self._assets = assets
+            self._encodings = {entry["file"]: entry["encodings"] for entry in assets.values()}
+            self._mtime = mtime
+
+    def resolve(self, path):
+        """Đường dẫn (trong /static) nên dùng cho `path`."""
+        if not self.enabled:
+            return path
+        self._refresh()
+        entry = self._assets.get(path.lstrip("/"))
+        return entry["file"] if entry else path
+
+    def encodings(self, path):
+        """Các bản nén sẵn của một file đã hash; None nếu `path` không phải file đã hash."""
+        self._refresh()
+        return self._encodings.get(path)
+
+    def stats(self):
+        self._refresh()
+        return {"enabled": self.enabled, "assets": len(self._assets),
+                "precompressed": sum(1 for e in self._encodings.values() if e)}
+
+
+asset_manifest = AssetManifest()
+
+
+@pass_context
+def url_for(context, name, **path_params):
+    """
+    Thay cho `url_for` của Jinja2Templates: file tĩnh trỏ tới bản đã hash.
+    Chỉ trả đường dẫn (không có scheme/host): URL tuyệt đối lấy host từ header
+    Host của request, và trang nằm trong page_cache được gửi cho mọi người.
+    """
+    if name == "static" and "path" in path_params:
+        path_params["path"] = asset_manifest.resolve(path_params["path"])
+    return context["request"].url_for(name, **path_params).path
+
+
+def accepted_encodings(accept_encoding):
+    """Tập coding trong header Accept-Encoding có q > 0."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+class AssetFiles(StaticFiles):
+    """
+    StaticFiles cho /static: file đã hash được gửi với cache immutable và bản
+    nén sẵn phù hợp Accept-Encoding; các file khác phục vụ như cũ.
+    """
+
+    def __init__(self, *args, manifest=asset_manifest, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = manifest
+        self._root = os.path.realpath(self.directory)
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        rel = os.path.relpath(full_path, self._root).replace(os.sep, "/")
+        encodings = self.manifest.encodings(rel)
+        if encodings is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        path = full_path
+        if encodings:
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers.get("accept-encoding"))
+            for encoding, suffix in ENCODING_SUFFIXES:
+                if encoding in encodings and encoding in accepted:
+                    try:
+                        stat_result = os.stat(full_path + suffix)
+                    except OSError:
+                        continue
+                    path = full_path + suffix
+                    headers["Content-Encoding"] = encoding
+                    break
+
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        response = FileResponse(path, status_code=status_code, headers=headers, media_type=media_type,
+                                stat_result=stat_result, method=scope["method"])
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed static assets")
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    parser.add_argument("--clean", action="store_true", help="xóa các bản build không còn trong manifest")
+    args = parser.parse_args()
+    manifest = build(args.static_dir, clean=args.clean)
+    for path, entry in sorted(manifest["assets"].items()):
+        print(f"   {path} -> {entry['file']} {' '.join(entry['encodings'])}")
+    if brotli is None:
+        print("   (brotli chưa được cài: chỉ tạo bản .gz)")
+
+
+if __name__ == "__main__":
+    main()
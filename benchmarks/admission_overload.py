@@ -0,0 +1,125 @@
+"""
+Quá tải có kiểm soát (admission.py): rất nhiều người xem sản phẩm cùng lúc với
+một nhóm nhỏ đang dùng giỏ hàng, trên một pool DB nhỏ. Chạy cùng tải hai lần,
+tắt rồi bật ADMISSION_ENABLED, và in cho từng route số request, số 503, số lỗi
+khác (hết giờ/5xx) và p50/p99.
+
+Khi tắt, mọi request chờ pool tới DB_POOL_TIMEOUT rồi mới lỗi, giỏ hàng chậm
+như xem hàng. Khi bật, request xem hàng vượt giới hạn bị trả 503 ngay (hoặc
+nhận trang cũ trong cache) còn giỏ hàng vẫn có suất.
+
+    python benchmarks/admission_overload.py
+    python benchmarks/admission_overload.py --browsers 400 --shoppers 20 --pool 4 --duration 30
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datagen import generate, load_mysql  # noqa: E402
+from loadtest import ROOT, SCENARIO_FUNCTIONS, Client, percentile, wait_until_up  # noqa: E402
+from mysql_sandbox import MySQLSandbox  # noqa: E402
+
+
+def run_groups(args, ctx):
+    """Nhóm xem hàng và nhóm giỏ hàng chạy song song; trả route -> [(giây, status)]."""
+    record_after = time.monotonic() + args.warmup
+    deadline = record_after + args.duration
+    per_client = []
+
+    def worker(scenario, seed):
+        rng = random.Random(seed)
+        samples = {}
+        per_client.append(samples)
+        client = Client("127.0.0.1", args.port, args.timeout, samples, record_after)
+        try:
+            while time.monotonic() < deadline:
+                SCENARIO_FUNCTIONS[scenario](client, rng, ctx)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=("browse", i), daemon=True) for i in range(args.browsers)]
+    threads += [threading.Thread(target=worker, args=("cart", 10_000 + i), daemon=True)
+                for i in range(args.shoppers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    merged = {}
+    for samples in per_client:
+        for route, values in samples.items():
+            merged.setdefault(route, []).extend(values)
+    return merged
+
+
+def print_routes(title, routes):
+    print(f"\n== {title} ==")
+    print(f"{'route':<28}{'số req':>8}{'503':>7}{'lỗi':>7}{'p50':>9}{'p99':>9}")
+    for route, values in sorted(routes.items()):
+        latencies = [elapsed * 1000 for elapsed, _ in values]
+        shed = sum(1 for _, status in values if status == 503)
+        errors = sum(1 for _, status in values if status == 0 or (status >= 500 and status != 503))
+        print(f"{route:<28}{len(values):>8}{shed:>7}{errors:>7}"
+              f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 99):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--browsers", type=int, default=200, help="số người xem sản phẩm đồng thời")
+    parser.add_argument("--shoppers", type=int, default=10, help="số người dùng giỏ hàng đồng thời")
+    parser.add_argument("--pool", type=int, default=4, help="DB_POOL_MAX của server")
+    parser.add_argument("--pool-timeout", type=float, default=5)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    sandbox = db = None
+    try:
+        import mysql.connector
+
+        sandbox = MySQLSandbox().start()
+        db = mysql.connector.connect(host="127.0.0.1", port=sandbox.port, user="root", password="",
+                                     database=sandbox.database, charset="utf8mb4")
+        print("Nạp dữ liệu giả")
+        load_mysql(db, generate(args.products, args.users, 0, 0, 42), 2000, schema=True)
+        ctx = {"max_product_id": args.products, "users": args.users}
+
+        for enabled in ("0", "1"):
+            env = dict(os.environ, **sandbox.env())
+            env.update({
+                "ADMISSION_ENABLED": enabled,
+                "DB_POOL_MAX": str(args.pool),
+                "DB_POOL_TIMEOUT": str(args.pool_timeout),
+                "SESSION_SECRET": "admission-bench",
+            })
+            server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                       "--port", str(args.port), "--backlog", "2048", "--log-level", "warning"],
+                                      cwd=ROOT, env=env)
+            try:
+                wait_until_up("127.0.0.1", args.port)
+                routes = run_groups(args, ctx)
+            finally:
+                server.terminate()
+                server.wait()
+            print_routes(f"ADMISSION_ENABLED={enabled}: {args.browsers} xem hàng + {args.shoppers} giỏ hàng, "
+                         f"pool {args.pool}", routes)
+    finally:
+        if db is not None:
+            db.close()
+        if sandbox is not None:
+            sandbox.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Đo tốc độ nhập sản phẩm hàng loạt (importer.py), tính bằng dòng/giây.
+
+    python benchmarks/bulk_import.py --rows 200000
+    python benchmarks/bulk_import.py --rows 200000 --format json --batch 1000
+    python benchmarks/bulk_import.py --rows 50000 --mysql    # ghi thật vào database trong db.py
+
+Không có `--mysql`, kết nối chỉ ghi nhận các câu lệnh (đo phần đọc file,
+kiểm tra dòng và chia lô). Với `--mysql`, các dòng được INSERT thật vào
+bảng sanpham; danh mục/thương hiệu trong file lấy từ database.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importer  # noqa: E402
+from refdata import reference_data  # noqa: E402
+
+CATEGORIES = {1: "Áo", 2: "Quần", 3: "Váy đầm", 4: "Giày dép", 5: "Phụ kiện"}
+BRANDS = {1: "Coolmate", 2: "Routine", 3: "Yody", 4: "Owen", 5: "Canifa"}
+
+
+class RecordingCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+
+    def execute(self, query, params=()):
+        if "FROM danhmuc" in query:
+            self.rows = [{"maDM": k, "ten": v} for k, v in CATEGORIES.items()]
+        elif "FROM thuonghieu" in query:
+            self.rows = [{"maTH": k, "ten": v} for k, v in BRANDS.items()]
+        else:
+            self.connection.statements += 1
+            self.rows = []
+
+    def executemany(self, query, seq):
+        self.connection.statements += 1
+        self.rowcount = len(seq)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+
+    def cursor(self, **kwargs):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def generate_records(count, categories, brands, error_rate, seed=7):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        record = {
+            "ten": f"Áo thun cổ tròn mẫu {i}",
+            "gia": str(rng.randrange(100, 2000) * 1000),
+            "soLuong": str(rng.randrange(0, 200)),
+            "danhmuc": rng.choice(categories),
+            "thuonghieu": rng.choice(brands),
+            "moTa": "Chất liệu cotton, form rộng",
+            "hinhAnh": f"mau-{i}.jpg",
+        }
+        if rng.random() < error_rate:
+            record["gia"] = "liên hệ"
+        yield record
+
+
+def write_file(path, fmt, records):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = None
+            for record in records:
+                if writer is None:
+                    writer = csv.DictWriter(f, fieldnames=list(record))
+                    writer.writeheader()
+                writer.writerow(record)
+        elif fmt == "ndjson":
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            f.write("[")
+            for i, record in enumerate(records):
+                f.write(("," if i else "") + json.dumps(record, ensure_ascii=False))
+            f.write("]")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--format", choices=importer.IMPORT_FORMATS, default="csv")
+    parser.add_argument("--batch", type=int, default=importer.IMPORT_BATCH_ROWS)
+    parser.add_argument("--commit", type=int, default=importer.IMPORT_COMMIT_ROWS)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    parser.add_argument("--mysql", action="store_true")
+    args = parser.parse_args()
+
+    if args.mysql:
+        from db import pool
+        context = pool.connection()
+        db = context.__enter__()
+        categories = list(reference_data.categories(db).values()) or [None]
+        brands = list(reference_data.brands(db).values()) or [None]
+    else:
+        context = None
+        db = RecordingConnection()
+        categories, brands = list(CATEGORIES.values()), list(BRANDS.values())
+
+    fd, path = tempfile.mkstemp(suffix="." + args.format)
+    os.close(fd)
+    try:
+        write_file(path, args.format, generate_records(args.rows, categories, brands, args.error_rate))
+        size = os.path.getsize(path)
+
+        job = importer.ImportJob(os.path.basename(path), args.format)
+        with open(path, "rb") as stream:
+            started = time.perf_counter()
+            importer.run_import(db, job, stream, batch_rows=args.batch, commit_rows=args.commit)
+            elapsed = time.perf_counter() - started
+    finally:
+        os.unlink(path)
+        if context is not None:
+            context.__exit__(None, None, None)
+
+    print(f"file: {args.format}, {size / 1e6:.1f} MB, {args.rows} dòng; lô {args.batch}, commit mỗi {args.commit}")
+    print(f"trạng thái: {job.status} {job.message or ''}")
+    print(f"đã thêm {job.inserted}, lỗi {job.failed} trong {elapsed:.2f}s -> {args.rows / elapsed:,.0f} dòng/giây")
+    if not args.mysql:
+        print(f"câu lệnh: {db.statements}, commit: {db.commits}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Flash sale: hàng nghìn người cùng bấm "Thanh toán" một sản phẩm còn ít hàng
+(checkout.py). Dựng MySQL tạm bằng mysql_sandbox.py, nạp dữ liệu giả, cho mỗi
+khách một giỏ chứa 1 sản phẩm flash sale rồi gửi đồng thời POST /checkout
+cho tất cả, sau đó kiểm tra:
+
+1. không bán quá: tồn kho không âm, số giỏ giữ hàng thành công không vượt tồn
+   kho ban đầu và khớp đúng với số hàng đã trừ;
+2. không bán hụt: nếu không request nào lỗi/503, toàn bộ tồn kho đã được giữ;
+3. xác nhận một nửa số giỏ giữ được thì daBan tăng đúng bằng số đó;
+4. phần còn lại hết hạn giữ thì được trả về kho và giỏ trở lại 'Đang mua'.
+
+    python benchmarks/checkout_flash.py
+    python benchmarks/checkout_flash.py --users 5000 --stock 300 --concurrency 500 --workers 4
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datagen import generate, load_mysql  # noqa: E402
+from loadtest import ROOT, percentile, wait_until_up  # noqa: E402
+from mysql_sandbox import MySQLSandbox  # noqa: E402
+
+SESSION_SECRET = "checkout-flash-bench"
+PRODUCT_ID = 1
+OPEN_STATUS = "Đang mua"
+PENDING_STATUS = "Chờ thanh toán"
+
+
+def prepare_carts(db, users, stock):
+    """Mỗi khách một giỏ đang mua chỉ chứa 1 sản phẩm PRODUCT_ID; tồn kho = `stock`."""
+    cursor = db.cursor()
+    cursor.execute("UPDATE sanpham SET soLuong = %s, daBan = 0 WHERE maSP = %s", (stock, PRODUCT_ID))
+    cursor.executemany("INSERT INTO giohang (maGH, maKH, trangThai) VALUES (%s, %s, %s)",
+                       [(i, i, OPEN_STATUS) for i in range(1, users + 1)])
+    cursor.executemany("INSERT INTO chitietgiohang (maGH, maSP, soLuong) VALUES (%s, %s, 1)",
+                       [(i, PRODUCT_ID) for i in range(1, users + 1)])
+    db.commit()
+    cursor.close()
+
+
+def snapshot(db):
+    cursor = db.cursor()
+    cursor.execute("SELECT soLuong, daBan FROM sanpham WHERE maSP = %s", (PRODUCT_ID,))
+    stock, sold = cursor.fetchone()
+    cursor.execute("SELECT trangThai, COUNT(*) FROM giohang GROUP BY trangThai")
+    carts = dict(cursor.fetchall())
+    db.commit()  # snapshot mới cho lần đọc sau
+    cursor.close()
+    return stock, sold, carts
+
+
+def post(port, path, token, timeout):
+    """(status, Location, giây) của một POST với cookie phiên."""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("POST", path, headers={"Cookie": f"session={token}", "Content-Length": "0"})
+        response = conn.getresponse()
+        response.read()
+        result = response.status, response.getheader("Location")
+    except (OSError, http.client.HTTPException):
+        result = 0, None
+    finally:
+        conn.close()
+    return result + (time.perf_counter() - start,)
+
+
+def run(args, db):
+    import sessions
+
+    failures = []
+
+    def check(name, ok, detail=""):
+        print(f"{'PASS' if ok else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+        if not ok:
+            failures.append(name)
+
+    tokens = {user_id: sessions.create_token(user_id, f"user{user_id}", "USER")
+              for user_id in range(1, args.users + 1)}
+
+    # Mọi luồng chờ nhau ở barrier rồi mới gửi, để các request thật sự đồng thời
+    barrier = threading.Barrier(min(args.concurrency, args.users))
+
+    def checkout_one(user_id):
+        if user_id <= barrier.parties:
+            barrier.wait()
+        return user_id, post(args.port, "/checkout", tokens[user_id], args.timeout)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(checkout_one, range(1, args.users + 1)))
+    elapsed = time.perf_counter() - started
+
+    outcomes = {}
+    reserved = []
+    for user_id, (status, location, _) in results:
+        key = f"{status} {location or ''}".strip()
+        outcomes[key] = outcomes.get(key, 0) + 1
+        if status == 302 and location == "/checkout":
+            reserved.append(user_id)
+    latencies = [seconds * 1000 for _, (_, _, seconds) in results]
+    print(f"{args.users} checkout trong {elapsed:.2f}s ({args.users / elapsed:.0f} req/s), "
+          f"p50 {percentile(latencies, 50):.1f} ms, p99 {percentile(latencies, 99):.1f} ms")
+    for key, count in sorted(outcomes.items(), key=lambda item: -item[1]):
+        print(f"  {count:6d}  {key}")
+
+    stock, sold, carts = snapshot(db)
+    pending = carts.get(PENDING_STATUS, 0)
+    check("stock never goes negative", stock >= 0, f"stock {stock}")
+    check("no oversell", len(reserved) <= args.stock, f"{len(reserved)} reserved of {args.stock}")
+    check("stock taken equals holds", args.stock - stock == pending == len(reserved),
+          f"taken {args.stock - stock}, pending carts {pending}, 302 -> /checkout {len(reserved)}")
+    clean = set(outcomes) <= {"302 /checkout", "302 /cart?error=out_of_stock"}
+    if clean:
+        check("no undersell", len(reserved) == min(args.stock, args.users))
+
+    # Xác nhận một nửa, để phần còn lại hết hạn giữ
+    confirmed = reserved[: len(reserved) // 2]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        confirms = list(executor.map(lambda user_id: post(args.port, "/checkout/confirm", tokens[user_id],
+                                                          args.timeout), confirmed))
+    placed = sum(1 for status, location, _ in confirms if status == 302 and location == "/cart?ordered=1")
+    _, sold, _ = snapshot(db)
+    check("confirmed orders add to daBan", placed == len(confirmed) == sold,
+          f"confirmed {placed}/{len(confirmed)}, daBan {sold}")
+
+    print(f"Chờ {args.hold + 2 * args.sweep_interval:.0f}s cho các giỏ hết hạn giữ")
+    time.sleep(args.hold + 2 * args.sweep_interval)
+    stock, sold, carts = snapshot(db)
+    check("expired holds are released", carts.get(PENDING_STATUS, 0) == 0,
+          f"pending carts {carts.get(PENDING_STATUS, 0)}")
+    check("released stock is back", stock == args.stock - placed, f"stock {stock}, expected {args.stock - placed}")
+    check("released carts are open again", carts.get(OPEN_STATUS, 0) == args.users - placed,
+          f"open carts {carts.get(OPEN_STATUS, 0)}")
+    return len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--users", type=int, default=3_000, help="số người cùng thanh toán")
+    parser.add_argument("--stock", type=int, default=200, help="tồn kho ban đầu của sản phẩm flash sale")
+    parser.add_argument("--concurrency", type=int, default=1_000)
+    parser.add_argument("--workers", type=int, default=2, help="số tiến trình uvicorn")
+    parser.add_argument("--hold", type=int, default=5, help="CHECKOUT_HOLD_SECONDS")
+    parser.add_argument("--sweep-interval", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    os.environ["SESSION_SECRET"] = SESSION_SECRET
+    sys.path.insert(0, ROOT)
+
+    sandbox = server = db = None
+    failures = 1
+    try:
+        import mysql.connector
+
+        sandbox = MySQLSandbox().start()
+        db = mysql.connector.connect(host="127.0.0.1", port=sandbox.port, user="root", password="",
+                                     database=sandbox.database, charset="utf8mb4")
+        print("Nạp dữ liệu giả")
+        load_mysql(db, generate(100, args.users, 0, 0, 42), 2000, schema=True)
+        prepare_carts(db, args.users, args.stock)
+
+        env = dict(os.environ, **sandbox.env())
+        env.update({
+            "SESSION_SECRET": SESSION_SECRET,
+            "CHECKOUT_HOLD_SECONDS": str(args.hold),
+            "CHECKOUT_SWEEP_INTERVAL": str(args.sweep_interval),
+            "CHECKOUT_QUEUE_MAX": str(args.users),  # đo tính đúng, không đo từ chối vì quá tải
+        })
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                   "--port", str(args.port), "--workers", str(args.workers),
+                                   "--backlog", str(max(2048, args.concurrency)), "--log-level", "warning"],
+                                  cwd=ROOT, env=env)
+        wait_until_up("127.0.0.1", args.port)
+        failures = run(args, db)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if db is not None:
+            db.close()
+        if sandbox is not None:
+            sandbox.stop()
+    print("OK" if not failures else f"{failures} check(s) failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Sinh dữ liệu giả cho benchmark: danhmuc, thuonghieu, sanpham, nguoidung,
+khachhang, giohang, chitietgiohang. Cùng `--seed` luôn cho cùng dữ liệu.
+
+    python benchmarks/datagen.py --schema --truncate --products 100000 --users 5000 --orders 50000
+    python benchmarks/datagen.py --products 10000 --sql-out /tmp/dataset.sql   # chỉ ghi file SQL
+
+Mặc định ghi vào database cấu hình trong db.py (biến môi trường DB_*).
+Người dùng được tạo là `bench_user_<i>` với mật khẩu `bench` (loadtest.py
+dùng cùng quy ước), lưu dạng hash scrypt như tài khoản đăng ký qua web;
+`--plaintext-passwords` lưu mật khẩu thô để thử đường băm lại khi đăng nhập. `--truncate` xóa dữ liệu cũ của cả 7 bảng: chỉ dùng trên
+database dành riêng cho benchmark.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import SALT_BYTES, hash_password  # noqa: E402
+
+BENCH_USER_PREFIX = "bench_user_"
+BENCH_PASSWORD = "bench"
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+CATEGORIES = ["Áo", "Quần", "Váy đầm", "Giày dép", "Phụ kiện", "Đồ thể thao", "Đồ ngủ", "Áo khoác"]
+BRANDS = ["Coolmate", "Routine", "Yody", "Owen", "Ivy Moda", "Canifa", "Biti's", "Uniqlo",
+          "Zara", "H&M", "Levi's", "Adidas"]
+KINDS = ["Áo thun", "Áo sơ mi", "Quần jean", "Quần kaki", "Váy", "Đầm dự tiệc", "Áo khoác",
+         "Áo len", "Quần short", "Giày thể thao", "Mũ lưỡi trai", "Túi đeo chéo"]
+STYLES = ["nam", "nữ", "trẻ em", "unisex", "oversize", "slim fit", "cổ tròn", "cổ bẻ", "tay lỡ"]
+COLORS = ["đen", "trắng", "xanh navy", "đỏ đô", "be", "xám", "hồng pastel", "vàng nghệ"]
+SIZES = ["S", "M", "L", "XL", "XXL"]
+ORDER_STATUSES = ["Chờ xác nhận", "Đang giao", "Đã giao", "Đã giao", "Đã giao", "Đã hủy"]
+OPEN_STATUS = "Đang mua"
+
+# Từ khóa tìm kiếm có trong tên sản phẩm sinh ra (loadtest.py dùng)
+SEARCH_TERMS = ["ao thun", "Áo thun", "quan jean nam", "dam du", "den", "ao kh", "xanh navy", "oversize"]
+
+TABLES = ["chitietgiohang", "giohang", "khachhang", "nguoidung", "sanpham", "thuonghieu", "danhmuc"]
+
+
+def generate(products, users, orders, open_carts, seed, plaintext_passwords=False):
+    """Các bảng dưới dạng (tên bảng, cột, iterator các dòng); mã tự tăng bắt đầu từ 1."""
+    rng = random.Random(seed)
+    if plaintext_passwords:
+        stored_password = BENCH_PASSWORD
+    else:
+        # Một hash cho mọi tài khoản (salt lấy từ seed): băm từng người sẽ mất vài phút
+        stored_password = hash_password(BENCH_PASSWORD, salt=random.Random(seed).randbytes(SALT_BYTES))
+
+    yield "danhmuc", ("maDM", "ten"), ((i, name) for i, name in enumerate(CATEGORIES, 1))
+    yield "thuonghieu", ("maTH", "ten"), ((i, name) for i, name in enumerate(BRANDS, 1))
+
+    prices = {}
+
+    def product_rows():
+        for i in range(1, products + 1):
+            color = rng.choice(COLORS)
+            name = f"{rng.choice(KINDS)} {rng.choice(STYLES)} {color} {i}"
+            prices[i] = rng.randrange(50, 3000) * 1000
+            yield (i, name, prices[i], rng.choice([0, 2, 5] + [rng.randrange(10, 500)] * 7),
+                   rng.randrange(0, 2000), "Chất liệu thoáng mát, form chuẩn, dễ phối đồ.",
+                   f"/static/img/products/{i}.jpg", rng.choice(SIZES), color,
+                   rng.randrange(1, len(CATEGORIES) + 1), rng.randrange(1, len(BRANDS) + 1))
+
+    yield ("sanpham", ("maSP", "ten", "gia", "soLuong", "daBan", "moTa", "hinhAnh", "kichCo", "mauSac",
+                       "maDM", "maTH"), product_rows())
+
+    yield ("nguoidung", ("maND", "tenDangNhap", "matKhau", "ten", "soDienThoai", "vaiTro"),
+           ((i, f"{BENCH_USER_PREFIX}{i}", stored_password, f"Khách hàng {i}", f"09{i:08d}"[:10], "USER")
+            for i in range(1, users + 1)))
+    yield "khachhang", ("maKH", "maND"), ((i, i) for i in range(1, users + 1))
+
+    # Đơn cũ trước, rồi các giỏ đang mua (mỗi khách tối đa một giỏ)
+    start = datetime.datetime(2024, 1, 1)
+    carts = []
+    for i in range(1, orders + 1):
+        placed = start + datetime.timedelta(minutes=i * 525600 // max(orders, 1))
+        carts.append((i, rng.randrange(1, users + 1), rng.choice(ORDER_STATUSES), placed))
+    open_customers = rng.sample(range(1, users + 1), min(open_carts, users)) if users else []
+    for offset, customer_id in enumerate(open_customers, 1):
+        carts.append((orders + offset, customer_id, OPEN_STATUS, None))
+    yield "giohang", ("maGH", "maKH", "trangThai", "ngayDat"), iter(carts)
+
+    def line_rows():
+        line_id = 0
+        for cart_id, _, status, _ in carts:
+            for product_id in rng.sample(range(1, products + 1), min(rng.randrange(1, 5), products)):
+                line_id += 1
+                # Đơn đã chốt mang giá bán lúc đặt (migrations/003), giỏ đang mua thì chưa có
+                price = None if status == OPEN_STATUS else prices[product_id]
+                yield line_id, cart_id, product_id, rng.randrange(1, 4), price
+
+    yield "chitietgiohang", ("maCTGH", "maGH", "maSP", "soLuong", "donGia"), line_rows()
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _sql_literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return f"'{value:%Y-%m-%d %H:%M:%S}'"
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def write_sql(path, tables, batch_size):
+    with open(path, "w", encoding="utf-8") as out:
+        out.write("SET NAMES utf8mb4;\n")
+        with open(SCHEMA_PATH, encoding="utf-8") as schema:
+            out.write(schema.read() + "\n")
+        for table, columns, rows in tables:
+            for batch in batched(rows, batch_size):
+                values = ",\n".join("(" + ", ".join(_sql_literal(v) for v in row) + ")" for row in batch)
+                out.write(f"INSERT INTO {table} ({', '.join(columns)}) VALUES\n{values};\n")
+
+
+def load_mysql(db, tables, batch_size, schema=False, truncate=False):
+    cursor = db.cursor()
+    if schema:
+        with open(SCHEMA_PATH, encoding="utf-8") as f:
+            for statement in f.read().split(";"):
+                lines = [line for line in statement.splitlines() if not line.strip().startswith("--")]
+                if "".join(lines).strip():
+                    cursor.execute("\n".join(lines))
+    if truncate:
+        for table in TABLES:
+            cursor.execute(f"TRUNCATE TABLE {table}")
+    for table, columns, rows in tables:
+        started = time.perf_counter()
+        count = 0
+        statement = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                     f"VALUES ({', '.join(['%s'] * len(columns))})")
+        for batch in batched(rows, batch_size):
+            cursor.executemany(statement, batch)
+            db.commit()
+            count += len(batch)
+        print(f"  {table}: {count} dòng trong {time.perf_counter() - started:.1f}s")
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--orders", type=int, default=10_000)
+    parser.add_argument("--open-carts", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch", type=int, default=2_000)
+    parser.add_argument("--schema", action="store_true", help="tạo bảng từ benchmarks/schema.sql nếu chưa có")
+    parser.add_argument("--truncate", action="store_true", help="xóa dữ liệu cũ của 7 bảng trước khi nạp")
+    parser.add_argument("--sql-out", help="ghi ra file SQL thay vì nạp vào database")
+    parser.add_argument("--plaintext-passwords", action="store_true",
+                        help="lưu mật khẩu thô như dữ liệu cũ (đăng nhập đầu tiên sẽ băm lại)")
+    args = parser.parse_args()
+
+    tables = generate(args.products, args.users, args.orders, args.open_carts, args.seed,
+                      args.plaintext_passwords)
+    if args.sql_out:
+        write_sql(args.sql_out, tables, args.batch)
+        print(f"Đã ghi {args.sql_out}")
+        return
+
+    import mysql.connector
+    from db import DB_CONFIG
+
+    db = mysql.connector.connect(**DB_CONFIG)
+    try:
+        print(f"Nạp dữ liệu vào {DB_CONFIG['host']}/{DB_CONFIG['database']}")
+        load_mysql(db, tables, args.batch, schema=args.schema, truncate=args.truncate)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
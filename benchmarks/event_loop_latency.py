@@ -0,0 +1,120 @@
+"""
+Đo độ trễ của `/` khi `/products?search=` đang chạy song song.
+
+Chạy server trước (`python run.py`), rồi:
+
+    python benchmarks/event_loop_latency.py --base-url http://127.0.0.1:8000
+
+Kịch bản gồm hai pha:
+  1. baseline: chỉ gửi request tới `/` theo tuần tự.
+  2. under load: vẫn đo `/` như trên, đồng thời `--slow-workers` luồng liên tục
+     gọi `/products?search=...` (truy vấn LIKE quét toàn bảng).
+
+Nếu handler chặn event loop, p99 của `/` ở pha 2 sẽ tăng theo độ trễ của
+truy vấn chậm; khi truy cập DB chạy trên thread pool, p99 gần như không đổi.
+"""
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def timed_get(host, port, path, timeout):
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    start = time.perf_counter()
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - start, response.status
+    finally:
+        conn.close()
+
+
+def probe(host, port, path, count, timeout):
+    latencies = []
+    errors = 0
+    for _ in range(count):
+        try:
+            elapsed, status = timed_get(host, port, path, timeout)
+            latencies.append(elapsed)
+            if status >= 500:
+                errors += 1
+        except OSError:
+            errors += 1
+    return latencies, errors
+
+
+def slow_worker(host, port, path, stop, timeout, counter):
+    while not stop.is_set():
+        try:
+            timed_get(host, port, path, timeout)
+            counter.append(1)
+        except OSError:
+            pass
+
+
+def summarize(name, latencies, errors):
+    ms = [x * 1000 for x in latencies]
+    print(f"{name:<12} n={len(ms):<5} errors={errors:<3} "
+          f"p50={percentile(ms, 50):8.2f}ms p95={percentile(ms, 95):8.2f}ms "
+          f"p99={percentile(ms, 99):8.2f}ms mean={statistics.fmean(ms) if ms else 0:8.2f}ms")
+    return percentile(ms, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--probe-path", default="/")
+    parser.add_argument("--slow-path", default="/products?search=a")
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--slow-workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    url = urlsplit(args.base_url)
+    host, port = url.hostname, url.port or 80
+
+    # Làm nóng pool kết nối và template cache
+    probe(host, port, args.probe_path, 10, args.timeout)
+
+    baseline, baseline_errors = probe(host, port, args.probe_path, args.probes, args.timeout)
+
+    stop = threading.Event()
+    completed = []
+    workers = [
+        threading.Thread(target=slow_worker,
+                         args=(host, port, args.slow_path, stop, args.timeout, completed),
+                         daemon=True)
+        for _ in range(args.slow_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.5)
+
+    loaded, loaded_errors = probe(host, port, args.probe_path, args.probes, args.timeout)
+
+    stop.set()
+    for worker in workers:
+        worker.join(args.timeout)
+
+    print(f"probe: GET {args.probe_path}   background: {args.slow_workers} x GET {args.slow_path}")
+    p99_base = summarize("baseline", baseline, baseline_errors)
+    p99_load = summarize("under load", loaded, loaded_errors)
+    print(f"background requests completed: {len(completed)}")
+    if p99_base:
+        print(f"p99 ratio (under load / baseline): {p99_load / p99_base:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
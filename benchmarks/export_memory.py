@@ -0,0 +1,102 @@
+"""
+Kiểm tra bộ nhớ khi xuất danh mục (export.py): RSS phải gần như không đổi
+dù số dòng tăng.
+
+    python benchmarks/export_memory.py --rows 1000000
+    python benchmarks/export_memory.py --format csv --mysql   # xuất thật từ MySQL
+
+Không có `--mysql`, cursor được giả lập: sinh từng dòng khi `fetchmany` được
+gọi, giống cursor không đệm của MySQL. Với `--mysql`, dùng `stream_products`
+trên database cấu hình trong db.py.
+"""
+import argparse
+import datetime
+import decimal
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export  # noqa: E402
+
+COLUMNS = ("maSP", "ten", "gia", "soLuong", "moTa", "hinhAnh", "maDM", "maTH", "ngayTao")
+
+
+class SyntheticCursor:
+    """Cursor chỉ đọc một lần, sinh dòng theo yêu cầu."""
+
+    column_names = COLUMNS
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.position = 0
+        self.created = datetime.datetime(2024, 1, 1)
+
+    def fetchmany(self, size):
+        end = min(self.position + size, self.rows)
+        batch = [
+            (i, f"Áo thun cổ tròn số {i}", decimal.Decimal(150000 + i % 900 * 1000), i % 50,
+             "Chất liệu cotton 100%, form rộng, thoáng mát " * 3, f"sp{i}.jpg",
+             i % 5 + 1, i % 8 + 1, self.created)
+            for i in range(self.position + 1, end + 1)
+        ]
+        self.position = end
+        return batch
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=sorted(export.EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--chunk", type=int, default=export.EXPORT_CHUNK_ROWS)
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--mysql", action="store_true")
+    args = parser.parse_args()
+
+    if args.mysql:
+        chunks = export.stream_products(args.format, chunk_rows=args.chunk)
+        expected_chunks = None
+    else:
+        categories = {k: f"Danh mục {k}" for k in range(1, 6)}
+        brands = {k: f"Thương hiệu {k}" for k in range(1, 9)}
+        cursor = SyntheticCursor(args.rows)
+        chunks = export.iter_export_chunks(cursor, args.format, categories, brands, args.chunk)
+        expected_chunks = -(-args.rows // args.chunk)
+
+    every = max(1, (expected_chunks or 1000) // args.samples)
+    samples = []
+    total_bytes = 0
+    count = 0
+    started = time.perf_counter()
+    for count, chunk in enumerate(chunks, 1):
+        total_bytes += len(chunk)
+        if count % every == 0:
+            samples.append((count, total_bytes, rss_kb()))
+    elapsed = time.perf_counter() - started
+    if not samples or samples[-1][0] != count:
+        samples.append((count, total_bytes, rss_kb()))
+
+    print(f"{'chunk':>8} {'đã xuất (MB)':>14} {'RSS (MB)':>10}")
+    for count, written, rss in samples:
+        print(f"{count:>8} {written / 1e6:>14.1f} {rss / 1024:>10.1f}")
+
+    first, last = samples[0][2], samples[-1][2]
+    print(f"\n{total_bytes / 1e6:.1f} MB trong {elapsed:.1f}s ({total_bytes / 1e6 / elapsed:.1f} MB/s)")
+    print(f"RSS: {first / 1024:.1f} MB -> {last / 1024:.1f} MB (chênh {(last - first) / 1024:+.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
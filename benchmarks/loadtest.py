@@ -0,0 +1,339 @@
+"""
+Chạy các kịch bản duyệt / tìm kiếm / đăng nhập / giỏ hàng ở nhiều mức đồng
+thời, báo cáo throughput và p50/p95/p99 theo route, lưu kết quả ra JSON.
+
+Với server đang chạy (dữ liệu từ benchmarks/datagen.py):
+
+    python benchmarks/loadtest.py --base-url http://127.0.0.1:8000 --concurrency 1,8,32 --duration 20
+
+Tự dựng mọi thứ: mysqld tạm (benchmarks/mysql_sandbox.py), nạp dữ liệu giả
+rồi chạy uvicorn trỏ tới nó:
+
+    python benchmarks/loadtest.py --embedded-mysql --products 20000 --users 2000
+
+So sánh với lần chạy trước:
+
+    python benchmarks/loadtest.py --compare benchmarks/results/loadtest-20250101-120000.json
+
+Mỗi người dùng ảo là một luồng giữ kết nối keep-alive và cookie riêng, chạy
+lần lượt các kịch bản trong `--scenarios`. Kết quả trong `--warmup` giây đầu
+của mỗi mức bị bỏ qua.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datagen import BENCH_PASSWORD, BENCH_USER_PREFIX, SEARCH_TERMS  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SCENARIOS = ("browse", "search", "login", "cart")
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Client:
+    """Một người dùng ảo: một kết nối keep-alive và cookie riêng."""
+
+    def __init__(self, host, port, timeout, samples, record_after):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.samples = samples  # route -> [(giây, status)]
+        self.record_after = record_after
+        self.cookies = {}
+        self.conn = None
+
+    def request(self, method, path, route, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+
+        start = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            content = response.read()
+            status = response.status
+            for name, value in response.getheaders():
+                if name.lower() == "set-cookie":
+                    key, _, rest = value.partition("=")
+                    cookie = rest.split(";", 1)[0]
+                    if cookie in ("", '""'):
+                        # Cookie bị xóa (đăng xuất, cookie cũ trước khi có phiên ký)
+                        self.cookies.pop(key.strip(), None)
+                    else:
+                        self.cookies[key.strip()] = cookie
+        except (OSError, http.client.HTTPException):
+            self.close()
+            content, status = b"", 0
+        elapsed = time.perf_counter() - start
+        if time.monotonic() >= self.record_after:
+            self.samples.setdefault(f"{method} {route}", []).append((elapsed, status))
+        return status, content
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# ===== KỊCH BẢN =====
+
+def scenario_browse(client, rng, ctx):
+    client.request("GET", "/", "/")
+    client.request("GET", "/products", "/products")
+    client.request("GET", f"/products?after={rng.randrange(1, ctx['max_product_id'] + 1)}", "/products?after")
+    client.request("GET", f"/product/{rng.randrange(1, ctx['max_product_id'] + 1)}", "/product/{id}")
+
+
+def scenario_search(client, rng, ctx):
+    client.request("GET", "/products?" + urlencode({"search": rng.choice(SEARCH_TERMS)}), "/products?search")
+
+
+def _login(client, rng, ctx):
+    username = f"{BENCH_USER_PREFIX}{rng.randrange(1, ctx['users'] + 1)}"
+    client.cookies.clear()
+    status, _ = client.request("POST", "/login", "/login", {"username": username, "password": BENCH_PASSWORD})
+    return status == 302
+
+
+def scenario_login(client, rng, ctx):
+    _login(client, rng, ctx)
+
+
+def scenario_cart(client, rng, ctx):
+    if not client.cookies and not _login(client, rng, ctx):
+        return
+    product_id = rng.randrange(1, ctx['max_product_id'] + 1)
+    client.request("POST", f"/cart/add/{product_id}", "/cart/add/{id}", {"quantity": "1"})
+    _, page = client.request("GET", "/cart", "/cart")
+    item_ids = re.findall(rb"/cart/update/(\d+)", page)
+    if item_ids:
+        item_id = rng.choice(item_ids).decode()
+        client.request("POST", f"/cart/update/{item_id}", "/cart/update/{id}",
+                       {"action": rng.choice(["increase", "decrease"])})
+        if len(item_ids) > 5:
+            client.request("POST", f"/cart/remove/{item_id}", "/cart/remove/{id}")
+
+
+SCENARIO_FUNCTIONS = {
+    "browse": scenario_browse,
+    "search": scenario_search,
+    "login": scenario_login,
+    "cart": scenario_cart,
+}
+
+
+# ===== CHẠY =====
+
+def run_level(host, port, concurrency, duration, warmup, scenarios, ctx, timeout, seed):
+    record_after = time.monotonic() + warmup
+    deadline = record_after + duration
+    per_thread = [dict() for _ in range(concurrency)]
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = Client(host, port, timeout, per_thread[index], record_after)
+        try:
+            while time.monotonic() < deadline:
+                for name in scenarios:
+                    SCENARIO_FUNCTIONS[name](client, rng, ctx)
+                    if time.monotonic() >= deadline:
+                        break
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    merged = {}
+    for samples in per_thread:
+        for route, values in samples.items():
+            merged.setdefault(route, []).extend(values)
+
+    routes = {}
+    total = 0
+    for route, values in sorted(merged.items()):
+        latencies = [elapsed for elapsed, _ in values]
+        errors = sum(1 for _, status in values if status == 0 or status >= 500)
+        total += len(values)
+        routes[route] = {
+            "count": len(values),
+            "errors": errors,
+            "rps": round(len(values) / duration, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+    return {"concurrency": concurrency, "duration": duration, "rps": round(total / duration, 2), "routes": routes}
+
+
+def print_level(level, previous=None):
+    print(f"\n== {level['concurrency']} người dùng đồng thời: {level['rps']} req/s ==")
+    print(f"{'route':<28}{'số req':>8}{'lỗi':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, stats in level["routes"].items():
+        line = (f"{route:<28}{stats['count']:>8}{stats['errors']:>6}{stats['rps']:>9}"
+                f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+        old = (previous or {}).get("routes", {}).get(route)
+        if old and old["p95_ms"]:
+            change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+            line += f"   p95 {change:+.0f}% so với trước"
+        print(line)
+
+
+def discover_max_product_id(host, port, timeout):
+    """maSP lớn nhất trong các link sản phẩm ở trang /products đầu tiên."""
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("GET", "/products")
+        page = conn.getresponse().read()
+    finally:
+        conn.close()
+    ids = [int(i) for i in re.findall(rb"/product/(\d+)", page)]
+    return max(ids) if ids else None
+
+
+def wait_until_up(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/health/db")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("server did not start")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", default="1,8,32", help="các mức đồng thời, cách nhau bằng dấu phẩy")
+    parser.add_argument("--duration", type=float, default=20, help="số giây đo cho mỗi mức")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=1000, help="số bench_user_<i> có trong database")
+    parser.add_argument("--max-product-id", type=int)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="file JSON kết quả (mặc định benchmarks/results/loadtest-<thời gian>.json)")
+    parser.add_argument("--compare", help="file JSON của lần chạy trước để so sánh")
+    parser.add_argument("--start-server", action="store_true", help="tự chạy uvicorn main:app")
+    parser.add_argument("--embedded-mysql", action="store_true",
+                        help="dựng mysqld tạm, nạp dữ liệu giả (kéo theo --start-server)")
+    parser.add_argument("--products", type=int, default=10_000, help="dùng với --embedded-mysql")
+    parser.add_argument("--orders", type=int, default=10_000, help="dùng với --embedded-mysql")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    for name in scenarios:
+        if name not in SCENARIO_FUNCTIONS:
+            parser.error(f"unknown scenario: {name}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    url = urlsplit(args.base_url)
+    host, port = url.hostname, url.port or 80
+
+    sandbox = server = None
+    env = dict(os.environ)
+    try:
+        if args.embedded_mysql:
+            from mysql_sandbox import MySQLSandbox
+            import mysql.connector
+            from datagen import generate, load_mysql
+
+            sandbox = MySQLSandbox().start()
+            env.update(sandbox.env())
+            db = mysql.connector.connect(host="127.0.0.1", port=sandbox.port, user="root", password="",
+                                         database=sandbox.database, charset="utf8mb4")
+            print("Nạp dữ liệu giả vào sandbox")
+            load_mysql(db, generate(args.products, args.users, args.orders, 200, 42), 2000, schema=True)
+            db.close()
+            args.start_server = True
+
+        if args.start_server:
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", host, "--port", str(port),
+                 "--log-level", "warning"], cwd=ROOT, env=env)
+            wait_until_up(host, port)
+
+        max_product_id = args.max_product_id or discover_max_product_id(host, port, args.timeout)
+        if not max_product_id:
+            parser.error("could not find any product; pass --max-product-id or load data first")
+        ctx = {"max_product_id": max_product_id, "users": args.users}
+
+        previous = {}
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                previous = {level["concurrency"]: level for level in json.load(f)["levels"]}
+
+        results = []
+        for concurrency in levels:
+            level = run_level(host, port, concurrency, args.duration, args.warmup, scenarios, ctx,
+                              args.timeout, args.seed)
+            print_level(level, previous.get(concurrency))
+            results.append(level)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if sandbox is not None:
+            sandbox.stop()
+
+    report = {
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "base_url": args.base_url,
+        "scenarios": scenarios,
+        "max_product_id": max_product_id,
+        "users": args.users,
+        "warmup": args.warmup,
+        "levels": results,
+    }
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"loadtest-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nĐã lưu kết quả: {out}")
+
+
+if __name__ == "__main__":
+    main()
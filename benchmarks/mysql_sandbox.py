@@ -0,0 +1,158 @@
+"""
+Một mysqld tạm thời (datadir trong thư mục tạm) cho benchmark, khi máy không
+có sẵn MySQL để thử. Cần `mysqld` (MySQL 8 hoặc MariaDB) trong PATH.
+
+    with MySQLSandbox() as sandbox:
+        os.environ.update(sandbox.env())   # DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME
+        ...
+
+Primary + replica (MySQL 8, replication theo GTID) để thử DB_REPLICAS:
+
+    primary = MySQLSandbox(server_id=1, replication=True).start()
+    replica = MySQLSandbox(server_id=2, replication=True).start()
+    replica.replicate_from(primary)
+
+Chạy trực tiếp để giữ sandbox mở tới khi Ctrl+C:
+
+    python benchmarks/mysql_sandbox.py --port 3307
+    python benchmarks/mysql_sandbox.py --port 3307 --replicas 2
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+
+class MySQLSandbox:
+    def __init__(self, port=None, database="clothing_shop_bench", mysqld=None, server_id=1, replication=False):
+        self.port = port or self._free_port()
+        self.database = database
+        self.mysqld = mysqld or shutil.which("mysqld") or shutil.which("mariadbd")
+        self.server_id = server_id
+        self.replication = replication
+        self.base_dir = None
+        self.process = None
+
+    @staticmethod
+    def _free_port():
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    def _run_initialize(self, data_dir):
+        if "mariadb" in os.path.basename(self.mysqld):
+            installer = shutil.which("mariadb-install-db") or shutil.which("mysql_install_db")
+            subprocess.run([installer, f"--datadir={data_dir}", "--auth-root-authentication-method=normal"],
+                           check=True, capture_output=True)
+        else:
+            subprocess.run([self.mysqld, "--no-defaults", "--initialize-insecure", f"--datadir={data_dir}"],
+                           check=True, capture_output=True)
+
+    def start(self, timeout=60):
+        if not self.mysqld:
+            raise RuntimeError("mysqld not found in PATH")
+        self.base_dir = tempfile.mkdtemp(prefix="mysql-bench-")
+        data_dir = os.path.join(self.base_dir, "data")
+        self._run_initialize(data_dir)
+        if self.replication:
+            if "mariadb" in os.path.basename(self.mysqld):
+                raise RuntimeError("replication sandbox needs MySQL 8 (GTID auto-positioning)")
+            binlog = [f"--server-id={self.server_id}", f"--log-bin={os.path.join(self.base_dir, 'binlog')}",
+                      "--gtid-mode=ON", "--enforce-gtid-consistency=ON"]
+        else:
+            binlog = ["--skip-log-bin"]
+        self.process = subprocess.Popen([
+            self.mysqld, "--no-defaults", f"--datadir={data_dir}", f"--port={self.port}",
+            "--bind-address=127.0.0.1", f"--socket={os.path.join(self.base_dir, 'mysql.sock')}",
+            "--mysqlx=OFF", *binlog, "--innodb-buffer-pool-size=256M",
+            "--innodb-flush-log-at-trx-commit=2", "--max-connections=500",
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        import mysql.connector
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                conn = mysql.connector.connect(host="127.0.0.1", port=self.port, user="root", password="")
+                break
+            except mysql.connector.Error:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError("mysqld sandbox did not start")
+                time.sleep(0.5)
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database} CHARACTER SET utf8mb4")
+        cursor.close()
+        conn.close()
+        return self
+
+    def execute(self, *statements):
+        import mysql.connector
+        conn = mysql.connector.connect(host="127.0.0.1", port=self.port, user="root", password="")
+        cursor = conn.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+            if cursor.with_rows:
+                cursor.fetchall()
+        cursor.close()
+        conn.close()
+
+    def replicate_from(self, primary):
+        """Biến sandbox này thành replica của `primary` (cả hai tạo với replication=True)."""
+        self.execute(
+            f"CHANGE REPLICATION SOURCE TO SOURCE_HOST='127.0.0.1', SOURCE_PORT={primary.port}, "
+            "SOURCE_USER='root', SOURCE_PASSWORD='', SOURCE_AUTO_POSITION=1, GET_SOURCE_PUBLIC_KEY=1",
+            "START REPLICA",
+        )
+        return self
+
+    def env(self):
+        return {
+            "DB_HOST": "127.0.0.1",
+            "DB_PORT": str(self.port),
+            "DB_USER": "root",
+            "DB_PASSWORD": "",
+            "DB_NAME": self.database,
+        }
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.base_dir:
+            shutil.rmtree(self.base_dir, ignore_errors=True)
+            self.base_dir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--replicas", type=int, default=0, help="số replica của sandbox chính")
+    args = parser.parse_args()
+    with MySQLSandbox(port=args.port, replication=args.replicas > 0) as sandbox:
+        replica_sandboxes = []
+        try:
+            for i in range(args.replicas):
+                replica = MySQLSandbox(server_id=i + 2, replication=True).start()
+                replica_sandboxes.append(replica.replicate_from(sandbox))
+            print("Sandbox MySQL đang chạy:", " ".join(f"{k}={v}" for k, v in sandbox.env().items()))
+            if replica_sandboxes:
+                print("DB_REPLICAS=" + ",".join(f"127.0.0.1:{r.port}" for r in replica_sandboxes))
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for replica in replica_sandboxes:
+                replica.stop()
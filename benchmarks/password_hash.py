@@ -0,0 +1,140 @@
+"""
+Đo ảnh hưởng của việc băm mật khẩu lên một worker: thông lượng đăng nhập và
+độ trễ của các request catalog chạy cùng lúc, khi kiểm tra mật khẩu
+
+- "trong loop": gọi `verify_password` thẳng trong coroutine (như route cũ
+  nếu chỉ thay `==` bằng scrypt),
+- "process pool": qua `password_hasher` (passwords.py).
+
+    python benchmarks/password_hash.py --logins 200 --concurrency 32
+    PASSWORD_WORKERS=4 python benchmarks/password_hash.py
+
+Không cần MySQL: request catalog được mô phỏng bằng một lần render template
+nhỏ (vài trăm µs CPU) sau `asyncio.sleep(--db-latency ms)`, đến đều đặn
+`--catalog-rps` lần mỗi giây trong suốt thời gian đăng nhập. Trên máy một
+nhân, process pool không tăng thông lượng đăng nhập; điều cần xem là độ trễ
+catalog.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jinja2 import Template  # noqa: E402
+
+from passwords import PasswordHasher, PasswordHasherBusy, hash_password, verify_password  # noqa: E402
+
+PASSWORD = "bench-password"
+CATALOG_TEMPLATE = Template(
+    "{% for p in products %}<div class=card><h6>{{ p.ten }}</h6><p>{{ p.gia }}</p></div>{% endfor %}"
+)
+PRODUCTS = [{"ten": f"Áo thun {i}", "gia": i * 1000} for i in range(48)]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def catalog_load(stop, rps, db_latency, latencies):
+    async def one(arrival):
+        await asyncio.sleep(db_latency)
+        CATALOG_TEMPLATE.render(products=PRODUCTS)
+        latencies.append((time.perf_counter() - arrival) * 1000)
+
+    # Tải mở: request "đến" theo lịch cố định, độ trễ tính từ lúc đến chứ không
+    # từ lúc event loop kịp nhận, nên thời gian loop bị chặn cũng được tính
+    tasks = []
+    interval = 1 / rps
+    arrival = time.perf_counter()
+    while not stop.is_set():
+        now = time.perf_counter()
+        while arrival <= now:
+            tasks.append(asyncio.ensure_future(one(arrival)))
+            arrival += interval
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+    await asyncio.gather(*tasks)
+
+
+async def run_mode(name, verify, args, stored):
+    login_latencies, catalog_latencies = [], []
+    rejected = 0
+    queue = asyncio.Queue()
+    for _ in range(args.logins):
+        queue.put_nowait(None)
+
+    async def login_worker():
+        nonlocal rejected
+        while not queue.empty():
+            queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                ok, _ = await verify(stored, PASSWORD)
+                assert ok
+            except PasswordHasherBusy:
+                rejected += 1
+                continue
+            login_latencies.append((time.perf_counter() - started) * 1000)
+
+    stop = asyncio.Event()
+    catalog = asyncio.ensure_future(catalog_load(stop, args.catalog_rps, args.db_latency / 1000,
+                                                 catalog_latencies))
+    started = time.perf_counter()
+    await asyncio.gather(*(login_worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await catalog
+    return {
+        "mode": name,
+        "logins_per_s": len(login_latencies) / elapsed,
+        "login_p50": statistics.median(login_latencies) if login_latencies else 0.0,
+        "login_p99": percentile(login_latencies, 99),
+        "rejected": rejected,
+        "catalog_p50": statistics.median(catalog_latencies),
+        "catalog_p99": percentile(catalog_latencies, 99),
+    }
+
+
+async def run(args):
+    stored = hash_password(PASSWORD)
+
+    async def inline(stored_value, password):
+        return verify_password(stored_value, password)
+
+    hasher = PasswordHasher(max_pending=args.max_pending)
+    hasher.warm()
+    try:
+        results = [await run_mode("trong loop", inline, args, stored),
+                   await run_mode("process pool", hasher.verify, args, stored)]
+    finally:
+        hasher.shutdown()
+
+    print(f"{args.logins} đăng nhập, {args.concurrency} đồng thời, {hasher.workers} tiến trình băm; "
+          f"catalog {args.catalog_rps} req/s, DB {args.db_latency} ms")
+    print(f"{'kiểu':<14}{'đăng nhập/s':>12}{'p50 (ms)':>10}{'p99 (ms)':>10}{'từ chối':>9}"
+          f"{'catalog p50':>13}{'catalog p99':>13}")
+    for r in results:
+        print(f"{r['mode']:<14}{r['logins_per_s']:>12.1f}{r['login_p50']:>10.1f}{r['login_p99']:>10.1f}"
+              f"{r['rejected']:>9}{r['catalog_p50']:>13.2f}{r['catalog_p99']:>13.2f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--catalog-rps", type=float, default=200)
+    parser.add_argument("--db-latency", type=float, default=2.0, help="ms cho mỗi request catalog giả lập")
+    parser.add_argument("--max-pending", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,104 @@
+"""
+Đo chỉ mục sản phẩm liên quan (related.py) trên dữ liệu giả của datagen.py,
+không cần MySQL: thời gian dựng (NumPy/SciPy), kích thước file, thời gian tra
+một maSP và bộ nhớ riêng của mỗi worker sau khi mmap (RSS tăng thêm gần như
+chỉ là các trang đã đọc, dùng chung giữa các tiến trình).
+
+    python benchmarks/related_index.py
+    python benchmarks/related_index.py --products 100000 --orders 500000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datagen import OPEN_STATUS, generate  # noqa: E402
+from loadtest import ROOT, percentile  # noqa: E402
+
+sys.path.insert(0, ROOT)
+
+import related  # noqa: E402
+
+
+def inputs_from_datagen(products, users, orders, seed):
+    """(products, lines) như related.fetch_related_inputs nhưng lấy từ datagen thay cho DB."""
+    tables = {name: rows for name, _, rows in generate(products, users, orders, 0, seed, plaintext_passwords=True)}
+    product_columns = ([], [], [], [])
+    for row in tables["sanpham"]:
+        for column, value in zip(product_columns, (row[0], row[9], row[10], row[4])):
+            column.append(value)
+    ordered = {cart_id for cart_id, _, status, _ in tables["giohang"] if status != OPEN_STATUS}
+    carts, items = [], []
+    for _, cart_id, product_id, _, _ in tables["chitietgiohang"]:
+        if cart_id in ordered:
+            carts.append(cart_id)
+            items.append(product_id)
+    return product_columns, (carts, items)
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def worker(path, max_id, lookups, queue):
+    """Một worker: mmap chỉ mục và tra `lookups` maSP ngẫu nhiên."""
+    before = rss_kb()
+    index = related.RelatedIndex(path)
+    index.refresh()
+    rng = random.Random(os.getpid())
+    samples = []
+    for _ in range(lookups):
+        product_id = rng.randrange(1, max_id + 1)
+        start = time.perf_counter()
+        index.also_bought(product_id, 8)
+        index.similar(product_id, 8)
+        samples.append((time.perf_counter() - start) * 1e6)
+    queue.put((rss_kb() - before, percentile(samples, 50), percentile(samples, 99)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--top-k", type=int, default=related.RELATED_TOP_K)
+    parser.add_argument("--min-support", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    products, lines = inputs_from_datagen(args.products, args.users, args.orders, args.seed)
+    print(f"Dữ liệu: {len(products[0])} sản phẩm, {len(lines[0])} dòng đơn "
+          f"({time.perf_counter() - started:.1f}s)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "related.npy")
+        started = time.perf_counter()
+        related.write_related_index(products, lines, path, args.top_k, args.min_support)
+        print(f"Dựng chỉ mục: {time.perf_counter() - started:.2f}s, file {os.path.getsize(path) / 1e6:.1f} MB")
+
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(path, max(products[0]), args.lookups, queue))
+                     for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        for i, (rss_delta, p50, p99) in enumerate(results, 1):
+            print(f"worker {i}: tra cứu p50 {p50:.1f} µs, p99 {p99:.1f} µs, RSS tăng {rss_delta} KB")
+
+
+if __name__ == "__main__":
+    main()
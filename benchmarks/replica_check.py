@@ -0,0 +1,182 @@
+"""
+Kiểm tra định tuyến đọc/ghi với replica (db.ReplicaSet, run_db_read) trên
+MySQL thật: dựng primary + 2 replica bằng mysql_sandbox.py (MySQL 8), nạp
+dữ liệu giả, chạy uvicorn với DB_REPLICAS rồi kiểm tra lần lượt:
+
+1. trang catalog đọc từ replica, chia cho cả hai;
+2. sau khi thêm vào giỏ, /cart đọc từ primary (thấy ngay món vừa thêm) cho
+   tới khi hết DB_PRIMARY_PIN_SECONDS, sau đó lại đọc từ replica;
+3. replica dừng áp dụng binlog (lag không xác định) thì đọc từ primary;
+4. một replica tắt hẳn thì bị loại, trang vẫn trả 200.
+
+    python benchmarks/replica_check.py
+    python benchmarks/replica_check.py --products 2000 --port 8010
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datagen import BENCH_PASSWORD, BENCH_USER_PREFIX, generate, load_mysql  # noqa: E402
+from loadtest import ROOT, Client, wait_until_up  # noqa: E402
+from mysql_sandbox import MySQLSandbox  # noqa: E402
+
+PIN_SECONDS = 3
+
+
+class Checker:
+    def __init__(self, port):
+        self.client = Client("127.0.0.1", port, 10, {}, float("inf"))
+        self.failures = 0
+
+    def get(self, path):
+        status, body = self.client.request("GET", path, path)
+        return status, body
+
+    def stats(self):
+        _, body = Client("127.0.0.1", self.client.port, 10, {}, float("inf")).request(
+            "GET", "/health/replicas", "/health/replicas")
+        return json.loads(body)
+
+    def reads(self):
+        return [replica["reads"] for replica in self.stats()["replicas"]]
+
+    def check(self, name, ok, detail=""):
+        print(f"{'PASS' if ok else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+        if not ok:
+            self.failures += 1
+
+
+def wait_for_replicas(primary, replicas, timeout=60):
+    """Chờ replica áp dụng hết dữ liệu vừa nạp vào primary."""
+    import mysql.connector
+
+    def gtid_executed(sandbox):
+        conn = mysql.connector.connect(host="127.0.0.1", port=sandbox.port, user="root", password="")
+        cursor = conn.cursor()
+        cursor.execute("SELECT @@GLOBAL.gtid_executed")
+        value = cursor.fetchone()[0]
+        cursor.close()
+        conn.close()
+        return value
+
+    target = gtid_executed(primary)
+    for replica in replicas:
+        conn = mysql.connector.connect(host="127.0.0.1", port=replica.port, user="root", password="")
+        cursor = conn.cursor()
+        cursor.execute("SELECT WAIT_FOR_EXECUTED_GTID_SET(%s, %s)", (target, timeout))
+        if cursor.fetchone()[0] != 0:
+            raise RuntimeError(f"replica on port {replica.port} did not catch up")
+        cursor.close()
+        conn.close()
+
+
+def run(args):
+    checker = Checker(args.port)
+
+    # 1. Catalog đọc từ replica
+    before = checker.reads()
+    for i in range(20):
+        checker.get(f"/product/{i % 50 + 1}")
+        checker.get("/products")
+    after = checker.reads()
+    gained = [a - b for a, b in zip(after, before)]
+    checker.check("catalog reads go to replicas", sum(gained) > 0, f"reads per replica {gained}")
+    checker.check("reads are spread over both replicas", all(g > 0 for g in gained))
+
+    # 2. Đọc được chính dữ liệu mình vừa ghi
+    client = checker.client
+    status, _ = client.request("POST", "/login", "/login",
+                               {"username": f"{BENCH_USER_PREFIX}1", "password": BENCH_PASSWORD})
+    checker.check("login", status == 302, f"status {status}")
+    product_id = 7
+    client.request("POST", f"/cart/add/{product_id}", "/cart/add", {"quantity": "1"})
+    checker.check("write sets the primary pin cookie", "db_primary" in client.cookies)
+    pinned_before = checker.stats()["pinned_reads"]
+    _, page = checker.get("/cart")
+    checker.check("cart after a write is read from the primary",
+                  checker.stats()["pinned_reads"] > pinned_before)
+    checker.check("cart shows the item just added", b"/cart/update/" in page)
+    time.sleep(PIN_SECONDS + 1.5)
+    client.cookies.pop("db_primary", None)  # trình duyệt đã bỏ cookie hết hạn
+    before = sum(checker.reads())
+    checker.get("/cart")
+    checker.check("cart is read from a replica once the pin expires", sum(checker.reads()) > before)
+
+    # 3. Replica ngừng áp dụng binlog: đọc từ primary
+    for replica in args.replica_sandboxes:
+        replica.execute("STOP REPLICA SQL_THREAD")
+    time.sleep(args.check_interval + 0.5)
+    checker.get("/products")  # lần đọc này đo lại độ trễ
+    fallbacks_before = checker.stats()["fallbacks_to_primary"]
+    status, _ = checker.get("/product/3")
+    stats = checker.stats()
+    checker.check("lagging replicas are skipped", stats["fallbacks_to_primary"] > fallbacks_before and status == 200,
+                  f"lag {[r['lag'] for r in stats['replicas']]}")
+    for replica in args.replica_sandboxes:
+        replica.execute("START REPLICA SQL_THREAD")
+    time.sleep(args.check_interval + 0.5)
+
+    # 4. Một replica chết: bị loại, trang vẫn chạy
+    args.replica_sandboxes[0].stop()
+    statuses = [checker.get(f"/product/{i + 1}")[0] for i in range(10)]
+    stats = checker.stats()
+    checker.check("pages keep working with a replica down", all(s == 200 for s in statuses), f"statuses {statuses}")
+    checker.check("dead replica is ejected", stats["replicas"][0]["ejections"] > 0,
+                  f"ejected for {stats['replicas'][0]['ejected_for']}s")
+    return checker.failures
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--products", type=int, default=1_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--check-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    primary = server = None
+    args.replica_sandboxes = []
+    try:
+        import mysql.connector
+
+        primary = MySQLSandbox(server_id=1, replication=True).start()
+        for server_id in (2, 3):
+            replica = MySQLSandbox(server_id=server_id, replication=True).start()
+            args.replica_sandboxes.append(replica.replicate_from(primary))
+        db = mysql.connector.connect(host="127.0.0.1", port=primary.port, user="root", password="",
+                                     database=primary.database, charset="utf8mb4")
+        print("Nạp dữ liệu giả vào primary")
+        load_mysql(db, generate(args.products, args.users, 200, 20, 42), 2000, schema=True)
+        db.close()
+        wait_for_replicas(primary, args.replica_sandboxes)
+
+        env = dict(os.environ, **primary.env())
+        env.update({
+            "DB_REPLICAS": ",".join(f"127.0.0.1:{r.port}" for r in args.replica_sandboxes),
+            "DB_REPLICA_CHECK_INTERVAL": str(args.check_interval),
+            "DB_REPLICA_EJECT_SECONDS": "30",
+            "DB_PRIMARY_PIN_SECONDS": str(PIN_SECONDS),
+            "PAGE_CACHE_MAX_BYTES": "0",  # mọi lần xem trang đều truy vấn DB
+        })
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                   "--port", str(args.port), "--log-level", "warning"], cwd=ROOT, env=env)
+        wait_until_up("127.0.0.1", args.port)
+        failures = run(args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        for sandbox in args.replica_sandboxes + [primary]:
+            if sandbox is not None:
+                sandbox.stop()
+    print("OK" if not failures else f"{failures} check(s) failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,107 @@
+-- Lược đồ tối thiểu cho database benchmark (benchmarks/datagen.py --schema).
+-- Gồm các cột mà ứng dụng dùng và các chỉ mục trong migrations/; không dùng
+-- cho database thật đang chạy.
+
+CREATE TABLE IF NOT EXISTS danhmuc
+(
+    maDM INT AUTO_INCREMENT PRIMARY KEY,
+    ten  VARCHAR(100) NOT NULL
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS thuonghieu
+(
+    maTH INT AUTO_INCREMENT PRIMARY KEY,
+    ten  VARCHAR(100) NOT NULL
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS sanpham
+(
+    maSP    INT AUTO_INCREMENT PRIMARY KEY,
+    ten     VARCHAR(255)   NOT NULL,
+    gia     DECIMAL(12, 0) NOT NULL,
+    soLuong INT            NOT NULL DEFAULT 0,
+    daBan   INT            NOT NULL DEFAULT 0,
+    moTa    TEXT,
+    hinhAnh VARCHAR(255),
+    kichCo  VARCHAR(50),
+    mauSac  VARCHAR(50),
+    maDM    INT,
+    maTH    INT,
+    ngayCapNhat TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
+    INDEX idx_sanpham_dm_masp (maDM, maSP),
+    INDEX idx_sanpham_th_masp (maTH, maSP),
+    INDEX idx_sanpham_soluong (soLuong),
+    INDEX idx_sanpham_ngaycapnhat (ngayCapNhat)
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS nguoidung
+(
+    maND        INT AUTO_INCREMENT PRIMARY KEY,
+    tenDangNhap VARCHAR(100) NOT NULL UNIQUE,
+    matKhau     VARCHAR(255) NOT NULL,
+    ten         VARCHAR(100),
+    soDienThoai VARCHAR(20),
+    vaiTro      VARCHAR(20)  NOT NULL DEFAULT 'USER'
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS khachhang
+(
+    maKH INT AUTO_INCREMENT PRIMARY KEY,
+    maND INT NOT NULL UNIQUE
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS giohang
+(
+    maGH      INT AUTO_INCREMENT PRIMARY KEY,
+    maKH      INT         NOT NULL,
+    trangThai VARCHAR(50) NOT NULL DEFAULT 'Đang mua',
+    ngayDat   DATETIME    NULL,
+    hetHanGiu DATETIME    NULL,
+    INDEX idx_giohang_kh_trangthai (maKH, trangThai),
+    INDEX idx_giohang_trangthai_gh (trangThai, maGH),
+    INDEX idx_giohang_ngaydat (ngayDat),
+    INDEX idx_giohang_trangthai_hethan (trangThai, hetHanGiu)
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS chitietgiohang
+(
+    maCTGH  INT AUTO_INCREMENT PRIMARY KEY,
+    maGH    INT NOT NULL,
+    maSP    INT NOT NULL,
+    soLuong INT NOT NULL DEFAULT 1,
+    donGia  DECIMAL(12, 0) NULL,
+    UNIQUE KEY uq_chitietgiohang_gh_sp (maGH, maSP)
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS thongke_banhang
+(
+    nhom     VARCHAR(20)    NOT NULL,
+    ma       INT            NOT NULL,
+    soLuong  INT            NOT NULL DEFAULT 0,
+    doanhThu DECIMAL(15, 0) NOT NULL DEFAULT 0,
+    PRIMARY KEY (nhom, ma),
+    INDEX idx_thongke_banhang_nhom_soluong (nhom, soLuong)
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS thongke_donhang
+(
+    trangThai VARCHAR(50) NOT NULL PRIMARY KEY,
+    soDon     INT         NOT NULL DEFAULT 0
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS thongke_giohang
+(
+    maSP    INT NOT NULL PRIMARY KEY,
+    soLuong INT NOT NULL DEFAULT 0,
+    INDEX idx_thongke_giohang_soluong (soLuong)
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
@@ -0,0 +1,109 @@
+"""
+So sánh chỉ mục tìm kiếm trong bộ nhớ (search.py) với truy vấn LIKE cũ.
+
+    python benchmarks/search_index.py --products 100000
+    python benchmarks/search_index.py --products 100000 --mysql   # thêm LIKE thật trên MySQL
+
+Không có `--mysql`, phía LIKE được mô phỏng bằng phép quét chuỗi con trên
+toàn bộ tên sản phẩm, giống cách MySQL quét bảng cho `LIKE '%term%'`.
+Với `--mysql`, truy vấn `fetch_products(search=...)` được chạy trên database
+cấu hình trong db.py (cần có sẵn dữ liệu, vd. từ bộ sinh dữ liệu benchmark).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import ProductSearchIndex, fold  # noqa: E402
+
+KINDS = ["Áo thun", "Áo sơ mi", "Quần jean", "Quần kaki", "Váy", "Đầm dự tiệc", "Áo khoác",
+         "Áo len", "Quần short", "Giày thể thao", "Mũ lưỡi trai", "Túi đeo chéo"]
+STYLES = ["nam", "nữ", "trẻ em", "unisex", "oversize", "slim fit", "cổ tròn", "cổ bẻ", "tay lỡ"]
+COLORS = ["đen", "trắng", "xanh navy", "đỏ đô", "be", "xám", "hồng pastel", "vàng nghệ"]
+BRANDS = ["Coolmate", "Routine", "Yody", "Owen", "Ivy Moda", "Canifa", "Biti's", "Uniqlo"]
+CATEGORIES = ["Áo", "Quần", "Váy đầm", "Giày dép", "Phụ kiện"]
+
+QUERIES = ["ao thun", "Áo thun", "quan jean nam", "dam du", "den", "coolmate ao", "ao kh", "xanh navy"]
+
+
+def generate(count, seed):
+    rng = random.Random(seed)
+    for product_id in range(1, count + 1):
+        name = f"{rng.choice(KINDS)} {rng.choice(STYLES)} {rng.choice(COLORS)} {product_id}"
+        yield {
+            "maSP": product_id,
+            "ten": name,
+            "ten_danhmuc": rng.choice(CATEGORIES),
+            "ten_thuonghieu": rng.choice(BRANDS),
+        }
+
+
+def time_calls(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mysql", action="store_true", help="đo thêm truy vấn LIKE trên MySQL thật")
+    args = parser.parse_args()
+
+    documents = list(generate(args.products, args.seed))
+
+    index = ProductSearchIndex()
+    start = time.perf_counter()
+    index.load(documents)
+    build_s = time.perf_counter() - start
+    print(f"index build: {args.products} products in {build_s:.2f}s "
+          f"({index.stats()['tokens']} tokens)")
+
+    names = [(d["maSP"], d["ten"]) for d in reversed(documents)]
+
+    def like_scan(term):
+        # Giống LIKE '%term%': không phân biệt hoa thường nhưng phân biệt dấu
+        needle = term.lower()
+        hits = [pid for pid, name in names if needle in name.lower()]
+        return hits[:args.page_size], len(hits)
+
+    db_runner = None
+    if args.mysql:
+        import queries
+        from db import pool
+        db_runner = (queries, pool)
+
+    print(f"{'query':<16} {'index ms':>10} {'hits':>7} | {'LIKE ms':>10} {'hits':>7}"
+          + (f" | {'MySQL ms':>10}" if db_runner else ""))
+    for term in QUERIES:
+        index_med, _ = time_calls(lambda: index.search(term, limit=args.page_size), args.repeat)
+        index_hits = len(index.rank(term))
+        like_med, _ = time_calls(lambda: like_scan(term), max(3, args.repeat // 4))
+        like_hits = like_scan(term)[1]
+        line = f"{term:<16} {index_med:>10.3f} {index_hits:>7} | {like_med:>10.3f} {like_hits:>7}"
+        if db_runner:
+            queries, pool = db_runner
+
+            def run_like():
+                with pool.connection() as db:
+                    queries.fetch_products(db, search=term, limit=args.page_size)
+
+            mysql_med, _ = time_calls(run_like, max(3, args.repeat // 4))
+            line += f" | {mysql_med:>10.3f}"
+        print(line)
+
+    print(f"note: the LIKE scan is accent-sensitive; the index folds 'Áo' -> '{fold('Áo')}'.")
+
+
+if __name__ == "__main__":
+    main()
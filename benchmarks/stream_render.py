@@ -0,0 +1,172 @@
+"""
+So sánh trang /products render một lần (TemplateResponse) với render theo
+luồng (streaming.TemplateStreamer): thời gian tới byte đầu tiên (TTFB), tổng
+thời gian, bộ nhớ cấp phát đỉnh (tracemalloc) và số byte gửi đi khi nén.
+
+    python benchmarks/stream_render.py --products 96
+    python benchmarks/stream_render.py --products 2000 --db-latency 5 --encoding br
+
+Không cần MySQL: thẻ sản phẩm được sinh sẵn, mỗi lần "truy vấn" DB được mô
+phỏng bằng `asyncio.sleep(--db-latency ms)`. Cả hai kiểu đều lấy mọi thẻ
+bằng một truy vấn; kiểu cũ chờ truy vấn rồi render cả trang, kiểu luồng gửi
+đầu trang + form lọc trước khi truy vấn, sau đó gửi thẻ theo khối
+`PRODUCTS_STREAM_CHUNK`.
+"""
+import argparse
+import asyncio
+import decimal
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import main  # noqa: E402
+from compression import CompressionMiddleware  # noqa: E402
+from facets import PRICE_RANGES  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+KINDS = ["Áo thun", "Áo sơ mi", "Quần jean", "Quần kaki", "Váy", "Đầm dự tiệc", "Áo khoác"]
+COLORS = ["đen", "trắng", "xanh navy", "đỏ đô", "be", "xám"]
+CATEGORIES = ["Áo", "Quần", "Váy đầm", "Giày dép", "Phụ kiện"]
+BRANDS = ["Coolmate", "Routine", "Yody", "Owen", "Ivy Moda", "Canifa", "Biti's", "Uniqlo"]
+
+
+def make_products(count, seed=7):
+    rng = random.Random(seed)
+    return [{
+        "maSP": i,
+        "ten": f"{rng.choice(KINDS)} {rng.choice(COLORS)} {i}",
+        "gia": decimal.Decimal(rng.randrange(50, 3000) * 1000),
+        "hinhAnh": f"/static/img/products/{i}.jpg",
+        "ten_danhmuc": rng.choice(CATEGORIES),
+        "ten_thuonghieu": rng.choice(BRANDS),
+    } for i in range(1, count + 1)]
+
+
+def make_request():
+    return Request({
+        "type": "http", "method": "GET", "path": "/products", "raw_path": b"/products",
+        "query_string": b"", "headers": [], "scheme": "http", "server": ("testserver", 80),
+        "root_path": "", "app": main.app, "router": main.app.router,
+    })
+
+
+def base_context(request, products):
+    def options(values):
+        return [{"value": v, "label": v, "count": 10, "selected": False} for v in values]
+
+    return {
+        "request": request,
+        "current_user": None,
+        "product_count": len(products),
+        "flush_every": main.PRODUCTS_STREAM_CHUNK,
+        "facets": {
+            "category": options(CATEGORIES),
+            "brand": options(BRANDS),
+            "price": [{"value": key, "label": label, "count": 10, "selected": False}
+                      for key, label, _, _ in PRICE_RANGES],
+        },
+        "search_query": None,
+        "is_first_page": True,
+        "first_page_url": "/products",
+        "next_page_url": "/products?after=1",
+    }
+
+
+async def buffered_response(products, latency):
+    """Như trước: một truy vấn lấy mọi thẻ, rồi render cả trang thành một chuỗi."""
+    await asyncio.sleep(latency)
+    request = make_request()
+    return main.templates.TemplateResponse("products.html", {**base_context(request, products),
+                                                             "products": list(products)})
+
+
+async def streamed_response(products, latency):
+    async def cards():
+        await asyncio.sleep(latency)
+        for product in products:
+            yield product
+
+    request = make_request()
+    return main.streamed_templates.TemplateResponse("products.html", {**base_context(request, products),
+                                                                      "products": cards()})
+
+
+async def measure(factory, products, latency, encoding, trace=False):
+    first_byte = None
+    wire_bytes = 0
+    chunks = 0
+
+    async def app(scope, receive, send):
+        response = await factory(products, latency)
+        await response(scope, receive, send)
+
+    async def receive():
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal first_byte, wire_bytes, chunks
+        if message["type"] == "http.response.body" and message.get("body"):
+            if first_byte is None:
+                first_byte = time.perf_counter()
+            wire_bytes += len(message["body"])
+            chunks += 1
+
+    headers = [(b"accept-encoding", encoding.encode())] if encoding else []
+    scope = {"type": "http", "method": "GET", "path": "/products", "headers": headers}
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await CompressionMiddleware(app)(scope, receive, send)
+    finished = time.perf_counter()
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "ttfb": (first_byte - started) * 1000,
+        "total": (finished - started) * 1000,
+        "peak_kb": peak / 1024,
+        "bytes": wire_bytes,
+        "chunks": chunks,
+    }
+
+
+async def run(args):
+    products = make_products(args.products)
+    latency = args.db_latency / 1000
+    results = {}
+    for name, factory in (("một lần", buffered_response), ("theo luồng", streamed_response)):
+        await measure(factory, products, latency, args.encoding)  # nạp/biên dịch template
+        runs = [await measure(factory, products, latency, args.encoding) for _ in range(args.repeat)]
+        results[name] = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+        # Đo bộ nhớ ở lần chạy riêng: tracemalloc làm chậm đáng kể và lệch số đo thời gian
+        results[name]["peak_kb"] = (await measure(factory, products, latency, args.encoding, trace=True))["peak_kb"]
+
+    print(f"{args.products} sản phẩm, DB {args.db_latency} ms/truy vấn, "
+          f"Accept-Encoding: {args.encoding or '(không)'}, trung vị {args.repeat} lần")
+    print(f"{'kiểu':<12}{'TTFB (ms)':>11}{'tổng (ms)':>11}{'đỉnh bộ nhớ (KB)':>18}{'byte gửi':>11}{'số khối':>9}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['ttfb']:>11.2f}{r['total']:>11.2f}{r['peak_kb']:>18.0f}"
+              f"{r['bytes']:>11.0f}{r['chunks']:>9.0f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=96)
+    parser.add_argument("--db-latency", type=float, default=2.0, help="ms cho mỗi truy vấn giả lập")
+    parser.add_argument("--encoding", default="gzip", help="giá trị Accept-Encoding ('' = không nén)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
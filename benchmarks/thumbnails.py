@@ -0,0 +1,92 @@
+"""
+Đo thumbnail của images.py: thời gian tạo lần đầu (trong process pool) và
+số byte tiết kiệm so với gửi ảnh gốc, theo từng chiều rộng và định dạng.
+
+    python benchmarks/thumbnails.py --images 24 --size 2400x1800
+    python benchmarks/thumbnails.py --source-dir static/img/products
+
+Không có `--source-dir` thì sinh ảnh JPEG giả (gradient + nhiễu, gần với ảnh
+chụp hơn ảnh một màu) trong thư mục tạm. Cache thumbnail cũng nằm trong thư
+mục tạm nên mọi lần chạy đều là "lạnh".
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import images  # noqa: E402
+
+
+def make_sources(directory, count, size, seed=7):
+    from PIL import Image, ImageFilter
+
+    rng = random.Random(seed)
+    width, height = size
+    paths = []
+    for i in range(count):
+        base = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        tint = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+        noise = Image.effect_noise((width, height), rng.randrange(20, 60)).convert("RGB")
+        image = Image.blend(Image.blend(base, tint, 0.5), noise, 0.25).filter(ImageFilter.SMOOTH)
+        path = os.path.join(directory, f"{i}.jpg")
+        image.save(path, "JPEG", quality=92)
+        paths.append(path)
+    return paths
+
+
+async def run(args, sources, cache_dir):
+    service = images.ThumbnailService(cache_dir=cache_dir, workers=args.workers)
+    source_bytes = sum(os.path.getsize(p) for p in sources) / len(sources)
+    print(f"{len(sources)} ảnh gốc, trung bình {source_bytes / 1024:.0f} KB, {args.workers} tiến trình")
+    print(f"{'định dạng':<10}{'rộng':>6}{'ms/ảnh (lạnh)':>15}{'KB/ảnh':>9}{'so với gốc':>12}{'ms (có sẵn)':>13}")
+    try:
+        # Khởi động pool trước để không tính thời gian spawn tiến trình vào lần đo đầu
+        await asyncio.get_running_loop().run_in_executor(service._executor(), os.getpid)
+        for fmt in images.IMAGE_FORMATS:
+            for width in images.IMAGE_WIDTHS:
+                jobs = [service.thumbnail_path(p, width, fmt) for p in sources]
+                started = time.perf_counter()
+                await asyncio.gather(*(service.ensure(src, path, width, fmt, quality)
+                                       for src, (path, _, quality) in zip(sources, jobs)))
+                cold = (time.perf_counter() - started) * 1000 / len(sources)
+                warm = []
+                for src, (path, _, quality) in zip(sources, jobs):
+                    started = time.perf_counter()
+                    await service.ensure(src, path, width, fmt, quality)
+                    warm.append((time.perf_counter() - started) * 1000)
+                size = statistics.mean(os.path.getsize(path) for path, _, _ in jobs)
+                print(f"{fmt:<10}{width:>6}{cold:>15.1f}{size / 1024:>9.1f}"
+                      f"{size / source_bytes:>11.1%}{statistics.median(warm):>13.3f}")
+    finally:
+        service.shutdown()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--size", default="2400x1800", help="kích thước ảnh giả, RxC")
+    parser.add_argument("--source-dir", help="dùng ảnh JPEG/PNG có sẵn thay vì sinh ảnh giả")
+    parser.add_argument("--workers", type=int, default=images.IMAGE_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.source_dir:
+            sources = sorted(os.path.join(args.source_dir, name) for name in os.listdir(args.source_dir)
+                             if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))[:args.images]
+        else:
+            width, height = (int(v) for v in args.size.lower().split("x"))
+            sources = make_sources(tmp, args.images, (width, height))
+        if not sources:
+            parser.error("không có ảnh nào")
+        asyncio.run(run(args, sources, os.path.join(tmp, "thumbs")))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,372 @@
+"""
+Ghi giỏ hàng bằng các câu lệnh nguyên tử.
+
+- Mỗi dòng chitietgiohang là duy nhất theo (maGH, maSP) (migrations/002), nên
+  thêm sản phẩm là một câu INSERT ... ON DUPLICATE KEY UPDATE thay cho
+  SELECT rồi UPDATE/INSERT.
+- Tăng/giảm số lượng là một câu UPDATE có điều kiện, không đọc trước rồi ghi
+  sau, nên các lần bấm đồng thời không ghi đè lên nhau.
+- maKH/maGH của người dùng được nhớ trong tiến trình; mọi câu lệnh vẫn kiểm
+  tra giỏ còn ở trạng thái 'Đang mua', nếu không thì bỏ cache và tìm lại.
+
+Các hàm nhận kết nối `db` như queries.py và được gọi qua `run_db`.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+CART_OPEN_STATUS = 'Đang mua'
+# Đang giữ hàng chờ xác nhận thanh toán (checkout.py); chưa tính là đơn hàng
+CART_PENDING_STATUS = 'Chờ thanh toán'
+# Các trạng thái giohang chưa phải đơn hàng
+NOT_ORDER_STATUSES = (CART_OPEN_STATUS, CART_PENDING_STATUS)
+CART_ID_CACHE_SIZE = int(os.getenv("CART_ID_CACHE_SIZE", "10000"))
+
+
+class CartNotFound(Exception):
+    """Người dùng chưa có bản ghi khách hàng (khachhang)."""
+
+
+class _CartIdCache:
+    """maND -> (maKH, maGH của giỏ đang mua), giới hạn theo LRU."""
+
+    def __init__(self, max_size=CART_ID_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._ids = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            ids = self._ids.get(user_id)
+            if ids is not None:
+                self._ids.move_to_end(user_id)
+            return ids
+
+    def set(self, user_id, customer_id, cart_id):
+        with self._lock:
+            self._ids[user_id] = (customer_id, cart_id)
+            self._ids.move_to_end(user_id)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._ids.pop(user_id, None)
+
+
+cart_ids = _CartIdCache()
+
+
+# ===== TÌM / TẠO GIỎ =====
+
+def find_open_cart(db, user_id):
+    """maGH của giỏ đang mua (None nếu chưa có), dùng cache nếu có."""
+    cached = cart_ids.get(user_id)
+    if cached is not None:
+        return cached[1]
+
+    cursor = db.cursor()
+    cursor.execute("""
+                   SELECT kh.maKH, gh.maGH
+                   FROM khachhang kh
+                            LEFT JOIN giohang gh ON gh.maKH = kh.maKH AND gh.trangThai = %s
+                   WHERE kh.maND = %s
+                   ORDER BY gh.maGH DESC LIMIT 1
+                   """, (CART_OPEN_STATUS, user_id))
+    row = cursor.fetchone()
+    cursor.close()
+    if row and row[1] is not None:
+        cart_ids.set(user_id, row[0], row[1])
+        return row[1]
+    return None
+
+
+def open_cart(db, user_id):
+    """maGH của giỏ đang mua, tạo mới nếu chưa có."""
+    cart_id = find_open_cart(db, user_id)
+    if cart_id is not None:
+        return cart_id
+
+    cursor = db.cursor()
+    # Khóa dòng khachhang để hai request đồng thời không cùng tạo hai giỏ
+    cursor.execute("SELECT maKH FROM khachhang WHERE maND = %s FOR UPDATE", (user_id,))
+    customer = cursor.fetchone()
+    if not customer:
+        cursor.close()
+        db.rollback()
+        raise CartNotFound(user_id)
+    customer_id = customer[0]
+
+    cursor.execute("SELECT maGH FROM giohang WHERE maKH = %s AND trangThai = %s ORDER BY maGH DESC LIMIT 1",
+                   (customer_id, CART_OPEN_STATUS))
+    cart = cursor.fetchone()
+    if cart:
+        cart_id = cart[0]
+    else:
+        cursor.execute("INSERT INTO giohang (maKH) VALUES (%s)", (customer_id,))
+        cart_id = cursor.lastrowid
+    db.commit()
+    cursor.close()
+
+    cart_ids.set(user_id, customer_id, cart_id)
+    return cart_id
+
+
+# ===== ĐỌC =====
+
+def fetch_cart_items(db, user_id):
+    cart_id = find_open_cart(db, user_id)
+    if cart_id is None:
+        return []
+
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("""
+                   SELECT ctgh.*, sp.ten, sp.gia, sp.hinhAnh, sp.soLuong as stock
+                   FROM chitietgiohang ctgh
+                            JOIN giohang gh ON ctgh.maGH = gh.maGH
+                            JOIN sanpham sp ON ctgh.maSP = sp.maSP
+                   WHERE ctgh.maGH = %s
+                     AND gh.trangThai = %s
+                   """, (cart_id, CART_OPEN_STATUS))
+    cart_items = cursor.fetchall()
+    cursor.close()
+    if not cart_items:
+        # Có thể giỏ đã được thanh toán ở tiến trình khác: lần sau tra lại
+        cart_ids.forget(user_id)
+    return cart_items
+
+
+# ===== GHI =====
+
+# Không thêm quá tồn kho hiện có: sản phẩm hết hàng thì không chèn dòng nào
+_UPSERT_ITEMS = """
+    INSERT INTO chitietgiohang (maGH, maSP, soLuong)
+    SELECT gh.maGH, sp.maSP, LEAST(%s, sp.soLuong)
+    FROM giohang gh
+             JOIN sanpham sp ON sp.maSP = %s AND sp.soLuong > 0
+    WHERE gh.maGH = %s
+      AND gh.trangThai = %s
+    ON DUPLICATE KEY UPDATE soLuong = LEAST(chitietgiohang.soLuong + VALUES(soLuong), sp.soLuong)
+"""
+
+# Bộ đếm "đang trong giỏ" của dashboard (aggregates.py), cộng trong cùng giao dịch
+_COUNT_CART_UNITS = """
+    INSERT INTO thongke_giohang (maSP, soLuong)
+    VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE soLuong = soLuong + VALUES(soLuong)
+"""
+
+
+def _with_open_cart(db, user_id, apply):
+    """
+    Chạy `apply(cursor, cart_id)` trên giỏ đang mua trong một giao dịch.
+    `apply` trả về False nếu giỏ (theo cache) không còn mở; khi đó cache
+    bị xóa và thao tác được thử lại một lần với giỏ tra từ DB.
+    """
+    for _ in range(2):
+        cart_id = open_cart(db, user_id)
+        cursor = db.cursor()
+        try:
+            result = apply(cursor, cart_id)
+        finally:
+            cursor.close()
+        if result is not False:
+            db.commit()
+            return result
+        db.rollback()
+        cart_ids.forget(user_id)
+    return False
+
+
+def _cart_is_open(cursor, cart_id, lock=False):
+    query = "SELECT 1 FROM giohang WHERE maGH = %s AND trangThai = %s"
+    if lock:
+        # Giữ khóa tới cuối giao dịch để giỏ không bị chốt đơn giữa chừng
+        query += " FOR UPDATE"
+    cursor.execute(query, (cart_id, CART_OPEN_STATUS))
+    return cursor.fetchone() is not None
+
+
+def _item_quantity(cursor, cart_id, product_id):
+    cursor.execute("SELECT soLuong FROM chitietgiohang WHERE maGH = %s AND maSP = %s FOR UPDATE",
+                   (cart_id, product_id))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def add_cart_item(db, user_id, product_id, quantity):
+    """
+    Thêm `quantity` sản phẩm vào giỏ đang mua (tối đa bằng tồn kho). Trả về
+    số lượng thực sự thay đổi trên dòng giỏ (có thể nhỏ hơn `quantity`, hoặc
+    âm nếu tồn kho đã giảm dưới số đang có trong giỏ), None nếu sản phẩm không
+    tồn tại, đã hết hàng hoặc giỏ đã đủ tồn kho. Chênh lệch được cộng vào bộ
+    đếm "đang trong giỏ" (thongke_giohang) trong cùng giao dịch.
+    """
+    if quantity < 1:
+        return None
+
+    def apply(cursor, cart_id):
+        # Khóa giỏ để số lượng đọc trước và sau câu upsert không lẫn với lần thêm đồng thời
+        if not _cart_is_open(cursor, cart_id, lock=True):
+            return False
+        before = _item_quantity(cursor, cart_id, product_id)
+        cursor.execute(_UPSERT_ITEMS, (quantity, product_id, cart_id, CART_OPEN_STATUS))
+        if cursor.rowcount == 0:
+            return None
+        added = _item_quantity(cursor, cart_id, product_id) - before
+        cursor.execute(_COUNT_CART_UNITS, (product_id, added))
+        return added
+
+    return _with_open_cart(db, user_id, apply)
+
+
+# Chỉ sửa dòng thuộc giỏ còn 'Đang mua' của chính người dùng: maGH lấy từ cache
+# có thể là giỏ vừa được giữ hàng để thanh toán ở tiến trình khác
+_OWN_OPEN_ITEM = """
+    JOIN giohang gh ON gh.maGH = ctgh.maGH AND gh.trangThai = %s
+    JOIN khachhang kh ON kh.maKH = gh.maKH AND kh.maND = %s
+"""
+
+
+def _edit_open_item(db, user_id, edit):
+    """
+    Chạy `edit(cursor, cart_id)` (trả về số dòng bị ảnh hưởng) trên giỏ đang
+    mua. Không dòng nào đổi và giỏ theo cache không còn mở thì bỏ cache và thử
+    lại một lần; trả về (số dòng, cart_id), cart_id None nếu không còn giỏ mở.
+    """
+    for _ in range(2):
+        cart_id = find_open_cart(db, user_id)
+        if cart_id is None:
+            return 0, None
+        cursor = db.cursor()
+        try:
+            changed = edit(cursor, cart_id)
+            db.commit()
+            if changed or _cart_is_open(cursor, cart_id):
+                return changed, cart_id
+        finally:
+            cursor.close()
+        cart_ids.forget(user_id)
+    return 0, None
+
+
+def change_cart_item_quantity(db, user_id, cart_item_id, action):
+    """
+    Tăng/giảm 1 đơn vị trong giới hạn [1, tồn kho] bằng một câu UPDATE.
+    Trả về False nếu item không thuộc giỏ đang mua của người dùng (kể cả khi
+    giỏ đã chuyển sang chờ thanh toán).
+    """
+    if action == "increase":
+        change, guard = "+ 1", "ctgh.soLuong < sp.soLuong"
+    elif action == "decrease":
+        change, guard = "- 1", "ctgh.soLuong > 1"
+    else:
+        return True
+
+    def edit(cursor, cart_id):
+        cursor.execute(f"""
+                       UPDATE chitietgiohang ctgh
+                           {_OWN_OPEN_ITEM}
+                           JOIN sanpham sp ON ctgh.maSP = sp.maSP
+                       SET ctgh.soLuong = ctgh.soLuong {change}
+                       WHERE ctgh.maCTGH = %s
+                         AND ctgh.maGH = %s
+                         AND {guard}
+                       """, (CART_OPEN_STATUS, user_id, cart_item_id, cart_id))
+        return cursor.rowcount
+
+    updated, cart_id = _edit_open_item(db, user_id, edit)
+    if updated:
+        return True
+    if cart_id is None:
+        return False
+    # Không đổi: hoặc đã chạm giới hạn, hoặc item không thuộc giỏ
+    cursor = db.cursor()
+    cursor.execute("SELECT 1 FROM chitietgiohang WHERE maCTGH = %s AND maGH = %s", (cart_item_id, cart_id))
+    exists = cursor.fetchone() is not None
+    cursor.close()
+    return exists
+
+
+def delete_cart_item(db, user_id, cart_item_id):
+    """Xóa một dòng khỏi giỏ đang mua; trả về False nếu không xóa được dòng nào."""
+    def edit(cursor, cart_id):
+        cursor.execute(f"""
+                       DELETE ctgh
+                       FROM chitietgiohang ctgh
+                           {_OWN_OPEN_ITEM}
+                       WHERE ctgh.maCTGH = %s
+                         AND ctgh.maGH = %s
+                       """, (CART_OPEN_STATUS, user_id, cart_item_id, cart_id))
+        return cursor.rowcount
+
+    removed, _ = _edit_open_item(db, user_id, edit)
+    return removed > 0
+
+
+def apply_cart_operations(db, user_id, operations):
+    """
+    Áp dụng nhiều thao tác trong một giao dịch.
+
+    operations: danh sách dict
+      {"op": "add", "product_id": ..., "quantity": n}
+      {"op": "update", "item_id": ..., "quantity": n}  (n <= 0 nghĩa là xóa)
+      {"op": "remove", "item_id": ...}
+
+    Các lệnh add cùng sản phẩm được cộng dồn rồi ghi bằng câu upsert của
+    add_cart_item (giới hạn theo tồn kho, bỏ qua sản phẩm hết hàng), các lệnh
+    remove gộp thành một câu DELETE. Trả về số dòng bị ảnh hưởng theo từng loại.
+    """
+    adds = {}
+    updates = {}
+    removes = set()
+    for operation in operations:
+        op = operation["op"]
+        if op == "add":
+            if operation.get("quantity", 1) >= 1:
+                product_id = operation["product_id"]
+                adds[product_id] = adds.get(product_id, 0) + operation.get("quantity", 1)
+        elif op == "update":
+            if operation["quantity"] <= 0:
+                removes.add(operation["item_id"])
+                updates.pop(operation["item_id"], None)
+            else:
+                updates[operation["item_id"]] = operation["quantity"]
+                removes.discard(operation["item_id"])
+        elif op == "remove":
+            removes.add(operation["item_id"])
+            updates.pop(operation["item_id"], None)
+        else:
+            raise ValueError(f"Unknown cart operation: {op}")
+
+    def apply(cursor, cart_id):
+        if not _cart_is_open(cursor, cart_id, lock=True):
+            return False
+        result = {"added": 0, "updated": 0, "removed": 0}
+
+        for product_id, quantity in adds.items():
+            # Như add_cart_item: bỏ qua sản phẩm không tồn tại/hết hàng, không vượt tồn kho
+            cursor.execute(_UPSERT_ITEMS, (quantity, product_id, cart_id, CART_OPEN_STATUS))
+            if cursor.rowcount > 0:
+                result["added"] += 1
+
+        for item_id, quantity in updates.items():
+            # Không vượt quá tồn kho
+            cursor.execute("""
+                           UPDATE chitietgiohang ctgh
+                               JOIN sanpham sp ON ctgh.maSP = sp.maSP
+                           SET ctgh.soLuong = LEAST(%s, GREATEST(sp.soLuong, 1))
+                           WHERE ctgh.maCTGH = %s
+                             AND ctgh.maGH = %s
+                           """, (quantity, item_id, cart_id))
+            result["updated"] += cursor.rowcount
+
+        if removes:
+            placeholders = ", ".join(["%s"] * len(removes))
+            cursor.execute(f"DELETE FROM chitietgiohang WHERE maGH = %s AND maCTGH IN ({placeholders})",
+                           [cart_id, *removes])
+            result["removed"] = cursor.rowcount
+
+        return result
+
+    return _with_open_cart(db, user_id, apply)
@@ -0,0 +1,70 @@
+"""
+Đồng bộ các chỉ mục sản phẩm trong bộ nhớ (tìm kiếm, facet) với bảng sanpham.
+
+Mỗi lần đồng bộ đọc lại các dòng có ngayCapNhat (migrations/007) từ lần
+trước trở đi, nên sản phẩm mới, sản phẩm bị sửa (kể cả từ tiến trình khác
+hoặc ngoài ứng dụng) đều vào chỉ mục và trang cache liên quan bị invalidate.
+Sản phẩm bị xóa không để lại dòng nào để đọc: khi số dòng trong sanpham ít
+hơn số sản phẩm trong chỉ mục thì nạp lại toàn bộ.
+
+Các hàm ở đây nhận kết nối `db` như trong queries.py và được gọi qua `run_db`.
+"""
+import datetime
+import os
+
+import queries
+from facets import facet_index
+from pagecache import invalidate_product
+from refdata import reference_data
+from search import search_index
+
+# Đọc lùi thêm bấy nhiêu giây so với lần đồng bộ trước: ngayCapNhat lấy giờ lúc
+# câu UPDATE chạy, giao dịch có thể commit sau lúc đó
+CATALOG_SYNC_OVERLAP = float(os.getenv("CATALOG_SYNC_OVERLAP", "5"))
+
+# Giờ DB lúc bắt đầu lần nạp/đồng bộ gần nhất
+_synced_at = None
+
+
+def _index_row(row):
+    search_index.upsert(row['maSP'], row['ten'], row['ten_danhmuc'], row['ten_thuonghieu'])
+    facet_index.upsert(row['maSP'], row['maDM'], row['maTH'], row['gia'])
+
+
+def catalog_indexes_ready():
+    return search_index.ready and facet_index.ready
+
+
+def rebuild_catalog_indexes(db):
+    """Nạp lại toàn bộ chỉ mục từ database."""
+    global _synced_at
+    facet_index.set_labels(reference_data.categories(db), reference_data.brands(db))
+    started_at = queries.begin_catalog_snapshot(db)
+    rows = queries.fetch_catalog_documents(db)
+    search_index.load(rows)
+    facet_index.load(rows)
+    _synced_at = started_at
+    db.rollback()
+    invalidate_product()
+
+
+def sync_catalog_indexes(db):
+    """Cập nhật các sản phẩm mới hoặc đã sửa từ lần đồng bộ trước; có sản phẩm bị xóa thì nạp lại."""
+    global _synced_at
+    facet_index.set_labels(reference_data.categories(db), reference_data.brands(db))
+    # Mốc giờ, phần đọc các dòng đã đổi và phép đếm dùng cùng một snapshot mới
+    started_at = queries.begin_catalog_snapshot(db)
+    if _synced_at is None:
+        rows = queries.fetch_catalog_documents(db, after_id=min(search_index.max_id, facet_index.max_id))
+    else:
+        since = _synced_at - datetime.timedelta(seconds=CATALOG_SYNC_OVERLAP)
+        rows = queries.fetch_catalog_documents(db, changed_since=since)
+    for row in rows:
+        _index_row(row)
+        invalidate_product(row['maSP'])
+
+    if queries.count_products(db) < len(search_index):
+        rebuild_catalog_indexes(db)
+        return
+    _synced_at = started_at
+    db.rollback()
@@ -0,0 +1,407 @@
+"""
+Thanh toán: giữ hàng, xác nhận đơn và trả hàng về kho.
+
+1. `reserve_cart` khóa giỏ đang mua rồi trừ tồn kho từng dòng bằng một câu
+   UPDATE có điều kiện (`soLuong >= số cần`), theo thứ tự maSP để hai giỏ
+   cùng chứa nhiều sản phẩm không khóa chéo nhau. Một dòng không đủ hàng thì
+   rollback cả giỏ và ném `OutOfStock`. Đủ hàng thì giỏ chuyển sang
+   'Chờ thanh toán' với hạn giữ `hetHanGiu` (migrations/006).
+2. `confirm_order` chốt giỏ còn hạn giữ thành đơn 'Chờ xác nhận', ghi giá bán
+   từng dòng (chitietgiohang.donGia), cộng daBan và số liệu bán hàng.
+3. `release_checkout` (người dùng hủy) và `release_expired` (chạy nền, dùng
+   SKIP LOCKED nên nhiều worker cùng dọn không chờ nhau) cộng lại tồn kho và
+   trả giỏ về 'Đang mua'; nếu người dùng đã có giỏ mới thì gộp vào giỏ đó.
+
+Tồn kho không bao giờ âm vì mọi lần trừ đều kiểm tra trong chính câu UPDATE.
+Trong một tiến trình, `sku_queue` xếp hàng các lần giữ hàng trên cùng maSP
+(mỗi maSP chỉ một giao dịch tại một thời điểm, hàng chờ có giới hạn) để lúc
+flash sale các request không dồn lại chờ khóa dòng trong MySQL; `stock_hints`
+nhớ tồn kho vừa thấy để từ chối ngay khi sản phẩm đã hết.
+
+Các hàm nhận kết nối `db` như queries.py và được gọi qua `run_db`.
+"""
+import asyncio
+import contextlib
+import os
+import threading
+import time
+
+from aggregates import sales_aggregates
+from cart import CART_OPEN_STATUS, CART_PENDING_STATUS, cart_ids
+
+ORDER_PLACED_STATUS = 'Chờ xác nhận'
+
+CHECKOUT_HOLD_SECONDS = int(os.getenv("CHECKOUT_HOLD_SECONDS", "600"))
+CHECKOUT_SWEEP_INTERVAL = float(os.getenv("CHECKOUT_SWEEP_INTERVAL", "15"))
+CHECKOUT_SWEEP_BATCH = int(os.getenv("CHECKOUT_SWEEP_BATCH", "200"))
+# Số request tối đa cùng chờ giữ hàng trên một maSP (mỗi tiến trình)
+CHECKOUT_QUEUE_MAX = int(os.getenv("CHECKOUT_QUEUE_MAX", "256"))
+CHECKOUT_RETRY_AFTER = int(os.getenv("CHECKOUT_RETRY_AFTER", "1"))
+# Tin tồn kho đã thấy trong bao lâu khi từ chối sớm (tiến trình khác có thể vừa trả hàng)
+CHECKOUT_STOCK_HINT_TTL = float(os.getenv("CHECKOUT_STOCK_HINT_TTL", "2"))
+
+
+class OutOfStock(Exception):
+    """Một dòng trong giỏ cần nhiều hơn tồn kho hiện có."""
+
+    def __init__(self, product_id, available):
+        super().__init__(product_id, available)
+        self.product_id = product_id
+        self.available = available
+
+
+class CheckoutBusy(Exception):
+    """Hàng chờ giữ hàng của một sản phẩm đã đầy."""
+
+
+# ===== ĐỌC =====
+
+def prepare_checkout(db, user_id):
+    """
+    (maGH của giỏ đang giữ hàng hoặc None, [(maSP, soLuong)] của giỏ đang mua).
+    Đọc trên primary: ngay sau khi giữ hàng replica có thể chưa thấy.
+    """
+    cursor = db.cursor()
+    cursor.execute("""
+                   SELECT gh.maGH, gh.trangThai, ctgh.maSP, ctgh.soLuong
+                   FROM khachhang kh
+                            JOIN giohang gh ON gh.maKH = kh.maKH AND gh.trangThai IN (%s, %s)
+                            LEFT JOIN chitietgiohang ctgh ON ctgh.maGH = gh.maGH
+                   WHERE kh.maND = %s
+                   ORDER BY gh.maGH DESC
+                   """, (CART_OPEN_STATUS, CART_PENDING_STATUS, user_id))
+    rows = cursor.fetchall()
+    cursor.close()
+    pending = next((cart_id for cart_id, status, _, _ in rows if status == CART_PENDING_STATUS), None)
+    open_cart = next((cart_id for cart_id, status, _, _ in rows if status == CART_OPEN_STATUS), None)
+    lines = [(product_id, quantity) for cart_id, _, product_id, quantity in rows
+             if cart_id == open_cart and product_id is not None]
+    return pending, lines
+
+
+def fetch_checkout(db, user_id):
+    """Giỏ đang giữ hàng: {"maGH", "con_lai" (giây), "items"}; None nếu không có."""
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("""
+                   SELECT gh.maGH, GREATEST(TIMESTAMPDIFF(SECOND, NOW(), gh.hetHanGiu), 0) AS con_lai
+                   FROM khachhang kh
+                            JOIN giohang gh ON gh.maKH = kh.maKH AND gh.trangThai = %s
+                   WHERE kh.maND = %s
+                   ORDER BY gh.maGH DESC LIMIT 1
+                   """, (CART_PENDING_STATUS, user_id))
+    checkout = cursor.fetchone()
+    if checkout is not None:
+        cursor.execute("""
+                       SELECT ctgh.maSP, ctgh.soLuong, sp.ten, sp.gia
+                       FROM chitietgiohang ctgh
+                                JOIN sanpham sp ON sp.maSP = ctgh.maSP
+                       WHERE ctgh.maGH = %s
+                       ORDER BY ctgh.maSP
+                       """, (checkout['maGH'],))
+        checkout['items'] = cursor.fetchall()
+    cursor.close()
+    return checkout
+
+
+# ===== GIỮ HÀNG / XÁC NHẬN / TRẢ HÀNG =====
+
+def _adjust_stock(cursor, product_id, delta, required=None):
+    """
+    Cộng `delta` vào tồn kho và trả về tồn kho mới (LAST_INSERT_ID(expr) gửi
+    lại giá trị trong cùng câu lệnh). Nếu có `required`, chỉ trừ khi tồn kho
+    còn ít nhất `required`; không đủ thì trả về None.
+    """
+    if required is None:
+        cursor.execute("UPDATE sanpham SET soLuong = LAST_INSERT_ID(soLuong + %s) WHERE maSP = %s",
+                       (delta, product_id))
+    else:
+        cursor.execute("""
+                       UPDATE sanpham
+                       SET soLuong = LAST_INSERT_ID(soLuong + %s)
+                       WHERE maSP = %s
+                         AND soLuong >= %s
+                       """, (delta, product_id, required))
+    if cursor.rowcount == 0:
+        return None
+    return cursor.lastrowid or 0
+
+
+def reserve_cart(db, user_id, hold_seconds=CHECKOUT_HOLD_SECONDS):
+    """
+    Giữ hàng cho toàn bộ giỏ đang mua trong một giao dịch.
+    Trả về {"maGH", "stock": {maSP: tồn kho sau khi trừ}}, None nếu giỏ trống.
+    Ném OutOfStock (đã rollback) nếu một sản phẩm không đủ hàng.
+    """
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+                       SELECT gh.maGH
+                       FROM khachhang kh
+                                JOIN giohang gh ON gh.maKH = kh.maKH AND gh.trangThai = %s
+                       WHERE kh.maND = %s
+                       ORDER BY gh.maGH DESC LIMIT 1
+                       FOR UPDATE
+                       """, (CART_OPEN_STATUS, user_id))
+        row = cursor.fetchone()
+        if row is None:
+            db.rollback()
+            return None
+        cart_id = row[0]
+
+        cursor.execute("SELECT maSP, soLuong FROM chitietgiohang WHERE maGH = %s ORDER BY maSP", (cart_id,))
+        lines = cursor.fetchall()
+        if not lines:
+            db.rollback()
+            return None
+
+        stock = {}
+        for product_id, quantity in lines:
+            remaining = _adjust_stock(cursor, product_id, -quantity, required=quantity)
+            if remaining is None:
+                cursor.execute("SELECT soLuong FROM sanpham WHERE maSP = %s", (product_id,))
+                available = cursor.fetchone()
+                db.rollback()
+                raise OutOfStock(product_id, available[0] if available else 0)
+            stock[product_id] = remaining
+
+        cursor.execute("""
+                       UPDATE giohang
+                       SET trangThai = %s,
+                           hetHanGiu = NOW() + INTERVAL %s SECOND
+                       WHERE maGH = %s
+                       """, (CART_PENDING_STATUS, hold_seconds, cart_id))
+        db.commit()
+    finally:
+        cursor.close()
+
+    # Lần thêm vào giỏ tiếp theo sẽ tạo giỏ mới
+    cart_ids.forget(user_id)
+    return {"maGH": cart_id, "stock": stock}
+
+
+def confirm_order(db, user_id):
+    """
+    Chốt giỏ đang giữ hàng (còn hạn) thành đơn với giá bán lúc này; số liệu
+    bán hàng được cộng trong cùng giao dịch. Trả về các dòng đơn, None nếu
+    không có giỏ nào còn hạn giữ.
+    """
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+                       SELECT gh.maGH
+                       FROM khachhang kh
+                                JOIN giohang gh ON gh.maKH = kh.maKH AND gh.trangThai = %s
+                       WHERE kh.maND = %s
+                         AND gh.hetHanGiu > NOW()
+                       ORDER BY gh.maGH DESC LIMIT 1
+                       FOR UPDATE
+                       """, (CART_PENDING_STATUS, user_id))
+        row = cursor.fetchone()
+        if row is None:
+            db.rollback()
+            return None
+        cart_id = row['maGH']
+
+        cursor.execute("""
+                       UPDATE giohang
+                       SET trangThai = %s,
+                           ngayDat   = NOW(),
+                           hetHanGiu = NULL
+                       WHERE maGH = %s
+                       """, (ORDER_PLACED_STATUS, cart_id))
+        cursor.execute("""
+                       UPDATE sanpham sp
+                           JOIN chitietgiohang ctgh ON ctgh.maSP = sp.maSP
+                       SET sp.daBan    = COALESCE(sp.daBan, 0) + ctgh.soLuong,
+                           ctgh.donGia = sp.gia
+                       WHERE ctgh.maGH = %s
+                       """, (cart_id,))
+        cursor.execute("""
+                       SELECT ctgh.maSP, sp.ten, sp.maDM, sp.maTH, ctgh.soLuong, ctgh.donGia AS gia
+                       FROM chitietgiohang ctgh
+                                JOIN sanpham sp ON sp.maSP = ctgh.maSP
+                       WHERE ctgh.maGH = %s
+                       """, (cart_id,))
+        lines = cursor.fetchall()
+        sales_aggregates.record_order(cursor, lines, ORDER_PLACED_STATUS)
+        db.commit()
+    finally:
+        cursor.close()
+    return lines
+
+
+def _release(cursor, cart_id, customer_id):
+    """Trả hàng của một giỏ đang giữ về kho và mở lại giỏ. Trả về {maSP: tồn kho mới}."""
+    # Khóa giỏ trước rồi mới tới sanpham, cùng thứ tự với reserve_cart
+    cursor.execute("""
+                   SELECT maGH
+                   FROM giohang
+                   WHERE maKH = %s
+                     AND trangThai = %s
+                   ORDER BY maGH DESC LIMIT 1
+                   FOR UPDATE
+                   """, (customer_id, CART_OPEN_STATUS))
+    newer = cursor.fetchone()
+
+    cursor.execute("SELECT maSP, soLuong FROM chitietgiohang WHERE maGH = %s ORDER BY maSP", (cart_id,))
+    stock = {}
+    for product_id, quantity in cursor.fetchall():
+        stock[product_id] = _adjust_stock(cursor, product_id, quantity)
+
+    if newer is None:
+        cursor.execute("UPDATE giohang SET trangThai = %s, hetHanGiu = NULL WHERE maGH = %s",
+                       (CART_OPEN_STATUS, cart_id))
+    else:
+        # Người dùng đã bắt đầu giỏ mới trong lúc giữ hàng: gộp các dòng vào giỏ đó
+        cursor.execute("""
+                       INSERT INTO chitietgiohang (maGH, maSP, soLuong)
+                       SELECT %s, maSP, soLuong
+                       FROM chitietgiohang
+                       WHERE maGH = %s
+                       ON DUPLICATE KEY UPDATE soLuong = chitietgiohang.soLuong + VALUES(soLuong)
+                       """, (newer[0], cart_id))
+        cursor.execute("DELETE FROM chitietgiohang WHERE maGH = %s", (cart_id,))
+        cursor.execute("DELETE FROM giohang WHERE maGH = %s", (cart_id,))
+    return stock
+
+
+def release_checkout(db, user_id):
+    """Người dùng hủy thanh toán. Trả về {maSP: tồn kho mới} ({} nếu không có giỏ đang giữ)."""
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+                       SELECT gh.maGH, gh.maKH
+                       FROM khachhang kh
+                                JOIN giohang gh ON gh.maKH = kh.maKH AND gh.trangThai = %s
+                       WHERE kh.maND = %s
+                       ORDER BY gh.maGH DESC LIMIT 1
+                       FOR UPDATE
+                       """, (CART_PENDING_STATUS, user_id))
+        row = cursor.fetchone()
+        stock = _release(cursor, row[0], row[1]) if row else {}
+        db.commit()
+    finally:
+        cursor.close()
+    cart_ids.forget(user_id)
+    return stock
+
+
+def release_expired(db, batch=CHECKOUT_SWEEP_BATCH):
+    """
+    Trả hàng của tối đa `batch` giỏ đã quá hạn giữ.
+    Trả về (số giỏ đã trả, {maSP: tồn kho mới}).
+    """
+    cursor = db.cursor()
+    try:
+        # Giỏ đang được xác nhận/hủy (đã bị khóa) để lại cho lần sau
+        cursor.execute("""
+                       SELECT maGH, maKH
+                       FROM giohang
+                       WHERE trangThai = %s
+                         AND hetHanGiu <= NOW()
+                       ORDER BY hetHanGiu LIMIT %s
+                       FOR UPDATE SKIP LOCKED
+                       """, (CART_PENDING_STATUS, batch))
+        expired = cursor.fetchall()
+        stock = {}
+        for cart_id, customer_id in expired:
+            stock.update(_release(cursor, cart_id, customer_id))
+        db.commit()
+    finally:
+        cursor.close()
+    return len(expired), stock
+
+
+# ===== HÀNG CHỜ THEO SẢN PHẨM (TRONG TIẾN TRÌNH) =====
+
+class SkuQueue:
+    """
+    Mỗi maSP một asyncio.Lock: các lần giữ hàng cùng sản phẩm chạy lần lượt
+    thay vì cùng chiếm kết nối DB để chờ khóa dòng. Khóa nhiều maSP theo thứ
+    tự tăng dần nên không bế tắc. Quá `max_waiters` request trên một maSP thì
+    ném CheckoutBusy ngay.
+    """
+
+    def __init__(self, max_waiters=CHECKOUT_QUEUE_MAX):
+        self.max_waiters = max_waiters
+        self._slots = {}  # maSP -> [asyncio.Lock, số request đang giữ/chờ]
+        self._rejected = 0
+        self._max_depth = 0
+
+    @contextlib.asynccontextmanager
+    async def hold(self, product_ids):
+        product_ids = sorted(set(product_ids))
+        # Kiểm tra rồi đăng ký trong cùng một bước (không có await ở giữa)
+        if any(self._slots.get(pid, (None, 0))[1] >= self.max_waiters for pid in product_ids):
+            self._rejected += 1
+            raise CheckoutBusy(product_ids)
+        for pid in product_ids:
+            slot = self._slots.get(pid)
+            if slot is None:
+                slot = self._slots[pid] = [asyncio.Lock(), 0]
+            slot[1] += 1
+            self._max_depth = max(self._max_depth, slot[1])
+
+        acquired = []
+        try:
+            for pid in product_ids:
+                await self._slots[pid][0].acquire()
+                acquired.append(pid)
+            yield
+        finally:
+            for pid in acquired:
+                self._slots[pid][0].release()
+            for pid in product_ids:
+                slot = self._slots[pid]
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._slots[pid]
+
+    def stats(self):
+        return {
+            "max_waiters": self.max_waiters,
+            "active_products": len(self._slots),
+            "waiting": sum(slot[1] for slot in self._slots.values()),
+            "max_depth": self._max_depth,
+            "rejected": self._rejected,
+        }
+
+
+class StockHints:
+    """Tồn kho vừa thấy khi giữ/trả hàng, để từ chối sớm sản phẩm đã hết."""
+
+    def __init__(self, ttl=CHECKOUT_STOCK_HINT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stock = {}  # maSP -> (tồn kho, thời điểm)
+        self._fast_rejections = 0
+
+    def update(self, stock):
+        now = time.monotonic()
+        with self._lock:
+            for product_id, remaining in stock.items():
+                if remaining is not None:
+                    self._stock[product_id] = (remaining, now)
+
+    def short(self, lines):
+        """maSP đầu tiên chắc chắn không đủ hàng theo tin còn mới, None nếu không có."""
+        now = time.monotonic()
+        with self._lock:
+            for product_id, quantity in lines:
+                hint = self._stock.get(product_id)
+                if hint is None:
+                    continue
+                if now - hint[1] > self.ttl:
+                    del self._stock[product_id]
+                elif hint[0] < quantity:
+                    self._fast_rejections += 1
+                    return product_id
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {"ttl": self.ttl, "products": len(self._stock), "fast_rejections": self._fast_rejections}
+
+
+sku_queue = SkuQueue()
+stock_hints = StockHints()
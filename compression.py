@@ -0,0 +1,142 @@
+"""
+Nén gzip/brotli cho response động (HTML, JSON, CSV...), dạng middleware ASGI.
+
+- Chọn brotli nếu client nhận `br` và có gói Brotli, ngược lại gzip.
+- Response có sẵn Content-Encoding (file tĩnh nén sẵn của assets.py) hoặc
+  nhỏ hơn `COMPRESS_MIN_SIZE` được gửi nguyên.
+- Response dạng luồng (StreamingResponse, trang render theo luồng) được nén
+  theo từng khối và flush sau mỗi khối, để client nhận được phần đầu trang
+  ngay thay vì chờ bộ nén gom đủ dữ liệu.
+- ETag mạnh được đổi thành ETag yếu vì nội dung gửi đi đã khác bản gốc.
+
+Middleware này phải nằm ngoài cùng (thêm sau cùng), sau khi ProfilerMiddleware
+đã chèn bảng profile vào HTML.
+"""
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # không có Brotli thì chỉ dùng gzip
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+# Mức brotli thấp: nén ngay trong request, mức 11 chỉ hợp với file build sẵn
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/x-ndjson",
+                      "application/xml", "image/svg+xml")
+
+
+class _GzipEncoder:
+    def __init__(self):
+        # wbits 31: định dạng gzip
+        self._compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b""):
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data=b""):
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+ENCODERS = {"gzip": _GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = _BrotliEncoder
+
+
+def choose_encoding(accept_encoding):
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding in accepted and encoding in ENCODERS:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if (message["status"] in (204, 206, 304) or "content-encoding" in headers
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                    passthrough = True
+                    await send(message)
+                    return
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                if encoding is None:
+                    passthrough = True
+                    await send(message)
+                    return
+                # Chờ khối body đầu tiên để biết có đáng nén không
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if not more_body and len(body) < self.min_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = ENCODERS[encoding]()
+                headers["Content-Encoding"] = encoding
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+                if more_body:
+                    del headers["Content-Length"]
+                    body = encoder.compress(body)
+                else:
+                    body = encoder.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                start_message = None
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            body = encoder.compress(body) if more_body else encoder.finish(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,597 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError, ProgrammingError
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+
+from admission import admission, current_ticket
+from metrics import db_pool_acquire_seconds, db_query_errors_total, db_query_seconds
+from profiler import current_profile
+
+# Database configuration
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', '3306')),
+    'user': os.getenv('DB_USER', 'root'),
+    'password': os.getenv('DB_PASSWORD', 'Sonbui@2005'),
+    'database': os.getenv('DB_NAME', 'clothing_shop'),
+    'charset': 'utf8mb4'
+}
+
+# Pool configuration
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN', '2'))
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX', '10'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+POOL_RECYCLE = float(os.getenv('DB_POOL_RECYCLE', '1800'))
+POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', '30'))
+
+# Replica chỉ đọc: "host[:port]" cách nhau bởi dấu phẩy, cùng user/password/database với primary
+DB_REPLICAS = os.getenv('DB_REPLICAS', '')
+DB_REPLICA_POOL_MAX = int(os.getenv('DB_REPLICA_POOL_MAX', str(POOL_MAX_SIZE)))
+# Replica trễ hơn số giây này thì đọc từ primary
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', '2'))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '2'))
+# Replica lỗi kết nối bị loại trong khoảng này (gấp đôi sau mỗi lần lỗi liên tiếp, tối đa 16 lần)
+DB_REPLICA_EJECT_SECONDS = float(os.getenv('DB_REPLICA_EJECT_SECONDS', '10'))
+# Sau một request ghi, phiên đó đọc từ primary trong khoảng này (đọc được chính dữ liệu mình vừa ghi)
+DB_PRIMARY_PIN_SECONDS = float(os.getenv(
+    'DB_PRIMARY_PIN_SECONDS', str(DB_REPLICA_MAX_LAG + DB_REPLICA_CHECK_INTERVAL + 1)))
+DB_PIN_COOKIE = 'db_primary'
+# Replica chết không được làm request treo lâu ở bước kết nối
+DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', '2'))
+
+
+def replica_configs(spec=DB_REPLICAS, base=None):
+    configs = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':') if ':' in item else (item, '', '')
+        config = dict(base or DB_CONFIG)
+        config['host'] = host
+        config['port'] = int(port) if port else 3306
+        config['connection_timeout'] = DB_REPLICA_CONNECT_TIMEOUT
+        configs.append(config)
+    return configs
+
+
+class _PooledConnection:
+    """Kết nối thật kèm thời điểm tạo và lần cuối được trả về pool."""
+
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Pool kết nối MySQL dùng chung cho mọi route.
+
+    - Giữ sẵn tối thiểu `min_size` kết nối, không bao giờ mở quá `max_size`.
+    - Chờ tối đa `timeout` giây khi pool đã đầy, sau đó ném PoolError.
+    - Kết nối quá `recycle` giây sẽ bị đóng và mở lại; kết nối rảnh quá
+      `ping_after` giây sẽ được ping trước khi giao cho route.
+    """
+
+    def __init__(self, config, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 timeout=POOL_TIMEOUT, recycle=POOL_RECYCLE, ping_after=POOL_PING_AFTER):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Invalid pool size: min=%s max=%s" % (min_size, max_size))
+        self.config = dict(config)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+
+        self._idle = deque()
+        self._in_use = 0
+        self._opening = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._closed = False
+
+        # Bộ đếm để theo dõi và tinh chỉnh kích thước pool
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._timeouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._created = 0
+        self._discarded = 0
+
+    # ----- kết nối thật -----
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.config)
+        with self._cond:
+            self._created += 1
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Error:
+            pass
+        with self._cond:
+            self._discarded += 1
+
+    def _is_usable(self, pooled):
+        now = time.monotonic()
+        if self.recycle and now - pooled.created_at > self.recycle:
+            return False
+        if self.ping_after is not None and now - pooled.last_used > self.ping_after:
+            try:
+                pooled.conn.ping(reconnect=False)
+            except Error:
+                return False
+        return True
+
+    def warm(self):
+        """Mở trước `min_size` kết nối (gọi khi ứng dụng khởi động)."""
+        while True:
+            with self._cond:
+                if self._closed or len(self._idle) + self._in_use + self._opening >= self.min_size:
+                    return
+                self._opening += 1
+            try:
+                pooled = self._connect()
+            except Error:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._opening -= 1
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    # ----- mượn / trả -----
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        pooled = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    self._checkout_failures += 1
+                    raise PoolError("Connection pool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use + self._opening < self.max_size:
+                    self._opening += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._checkout_failures += 1
+                    self._record_wait(time.monotonic() - start)
+                    raise PoolError("Timed out waiting for a database connection "
+                                    "(max_size=%d)" % self.max_size)
+                waited = True
+                self._cond.wait(remaining)
+
+        if pooled is not None and not self._is_usable(pooled):
+            # Kết nối cũ/chết: bỏ đi và mở kết nối mới, slot vẫn giữ cho luồng này
+            self._discard(pooled)
+            with self._cond:
+                self._in_use -= 1
+                self._opening += 1
+            pooled = None
+
+        if pooled is None:
+            # Mở kết nối ngoài lock để không chặn các luồng khác
+            try:
+                pooled = self._connect()
+            except Error:
+                with self._cond:
+                    self._opening -= 1
+                    self._checkout_failures += 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._opening -= 1
+                self._in_use += 1
+
+        with self._cond:
+            self._checkouts += 1
+            if waited:
+                self._record_wait(time.monotonic() - start)
+        return pooled
+
+    def release(self, pooled, broken=False):
+        """
+        Trả kết nối về pool. Autocommit tắt, nên mọi kết nối còn dùng được đều
+        được rollback: kết thúc giao dịch (và snapshot REPEATABLE READ) mà các
+        câu đọc đã mở, để lần mượn sau thấy dữ liệu mới; phần ghi chưa commit
+        cũng không bị người mượn sau commit hộ. Rollback lỗi nghĩa là kết nối hỏng.
+        """
+        if not broken:
+            try:
+                pooled.conn.rollback()
+            except Error:
+                broken = True
+
+        if broken:
+            self._discard(pooled)
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if self._closed:
+                close_now = True
+            else:
+                close_now = False
+                self._idle.append(pooled)
+            self._cond.notify()
+        if close_now:
+            self._discard(pooled)
+
+    @contextmanager
+    def connection(self):
+        """
+        Mượn một kết nối trong khối `with`.
+
+        Giao dịch chưa commit (kể cả khi khối lệnh ném lỗi) bị rollback khi
+        kết nối quay lại pool (xem `release`).
+        """
+        pooled = self.acquire()
+        try:
+            yield pooled.conn
+        finally:
+            self.release(pooled)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+    # ----- số liệu -----
+
+    def _record_wait(self, seconds):
+        self._waits += 1
+        self._wait_time_total += seconds
+        if seconds > self._wait_time_max:
+            self._wait_time_max = seconds
+
+    def stats(self):
+        with self._cond:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "opening": self._opening,
+                "checkouts": self._checkouts,
+                "checkout_failures": self._checkout_failures,
+                "timeouts": self._timeouts,
+                "waits": self._waits,
+                "wait_time_total": round(self._wait_time_total, 6),
+                "wait_time_max": round(self._wait_time_max, 6),
+                "connections_created": self._created,
+                "connections_discarded": self._discarded,
+            }
+
+
+pool = ConnectionPool(DB_CONFIG)
+
+
+class _Replica:
+    __slots__ = ("name", "pool", "lag", "checked_at", "checking", "ejected_until", "failures",
+                 "reads", "ejections")
+
+    def __init__(self, config, max_size):
+        self.name = f"{config['host']}:{config['port']}"
+        self.pool = ConnectionPool(config, min_size=0, max_size=max_size)
+        self.lag = float("inf")  # chưa đo
+        self.checked_at = float("-inf")
+        self.checking = False
+        self.ejected_until = 0.0
+        self.failures = 0
+        self.reads = 0
+        self.ejections = 0
+
+
+class ReplicaSet:
+    """
+    Các replica chỉ đọc cho truy vấn catalog (`run_db_read`).
+
+    - Chọn replica đang mượn ít kết nối nhất (xoay vòng khi bằng nhau), bỏ qua
+      replica đã hết kết nối rảnh thay vì đứng chờ.
+    - Độ trễ replication được đo lại mỗi `check_interval` giây bằng
+      `SHOW REPLICA STATUS` (cần quyền REPLICATION CLIENT); trễ quá `max_lag`
+      hoặc replication đã dừng thì không dùng replica đó.
+    - Lỗi kết nối loại replica trong `eject_seconds` (tăng dần khi lỗi liên
+      tiếp); hết thời gian thì đo độ trễ lại trước khi dùng.
+    - Không có replica nào dùng được thì đọc từ primary.
+    """
+
+    def __init__(self, configs, max_lag=DB_REPLICA_MAX_LAG, check_interval=DB_REPLICA_CHECK_INTERVAL,
+                 eject_seconds=DB_REPLICA_EJECT_SECONDS, pool_max=DB_REPLICA_POOL_MAX):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.eject_seconds = eject_seconds
+        self._replicas = [_Replica(config, pool_max) for config in configs]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._fallbacks = 0
+        self._pinned_reads = 0
+
+    @property
+    def enabled(self):
+        return bool(self._replicas)
+
+    @staticmethod
+    def _measure_lag(replica):
+        with replica.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except ProgrammingError:
+                cursor.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22, MariaDB
+            rows = cursor.fetchall()
+            cursor.close()
+        if not rows:
+            # Server không chạy replication (vd. MySQL độc lập dùng để thử): coi như không trễ
+            return 0.0
+        lags = [row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master")) for row in rows]
+        if any(lag is None for lag in lags):
+            return float("inf")  # luồng replication đã dừng
+        return float(max(lags))
+
+    def _check(self, replica):
+        try:
+            lag = self._measure_lag(replica)
+        except Error as e:
+            self.eject(replica, e)
+        else:
+            with self._lock:
+                replica.lag = lag
+                replica.checked_at = time.monotonic()
+                replica.failures = 0
+        finally:
+            replica.checking = False
+
+    @staticmethod
+    def _has_capacity(replica_pool):
+        return bool(replica_pool._idle) or replica_pool._in_use + replica_pool._opening < replica_pool.max_size
+
+    def choose(self):
+        """Replica để đọc, None nếu nên đọc từ primary. Chạy trên luồng của executor."""
+        now = time.monotonic()
+        due = None
+        with self._lock:
+            for replica in self._replicas:
+                if (replica.ejected_until <= now and not replica.checking
+                        and now - replica.checked_at >= self.check_interval):
+                    replica.checking = True
+                    due = replica
+                    break
+        if due is not None:
+            # Một luồng đo, các luồng khác dùng số đo cũ
+            self._check(due)
+
+        with self._lock:
+            count = len(self._replicas)
+            best = None
+            for offset in range(count):
+                replica = self._replicas[(self._next + offset) % count]
+                if (replica.ejected_until > now or replica.lag > self.max_lag
+                        or not self._has_capacity(replica.pool)):
+                    continue
+                if best is None or replica.pool._in_use < best.pool._in_use:
+                    best = replica
+            self._next = (self._next + 1) % max(count, 1)
+            if best is None:
+                self._fallbacks += 1
+                return None
+            best.reads += 1
+            return best
+
+    def eject(self, replica, error):
+        with self._lock:
+            replica.failures += 1
+            replica.ejections += 1
+            seconds = self.eject_seconds * 2 ** min(replica.failures - 1, 4)
+            replica.ejected_until = time.monotonic() + seconds
+            # Quay lại thì phải đo độ trễ trước khi được chọn
+            replica.lag = float("inf")
+            replica.checked_at = float("-inf")
+        print(f"Error on replica {replica.name}, ejected for {seconds:.0f}s: {error}")
+
+    def record_pinned_read(self):
+        with self._lock:
+            self._pinned_reads += 1
+
+    def close(self):
+        for replica in self._replicas:
+            replica.pool.close()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "max_lag": self.max_lag,
+                "fallbacks_to_primary": self._fallbacks,
+                "pinned_reads": self._pinned_reads,
+                "replicas": [{
+                    "name": replica.name,
+                    "lag": None if replica.lag == float("inf") else replica.lag,
+                    "ejected_for": round(max(0.0, replica.ejected_until - now), 1),
+                    "failures": replica.failures,
+                    "ejections": replica.ejections,
+                    "reads": replica.reads,
+                    "pool": replica.pool.stats(),
+                } for replica in self._replicas],
+            }
+
+
+replicas = ReplicaSet(replica_configs())
+
+# True trong request phải đọc từ primary (request ghi, hoặc phiên vừa ghi xong)
+primary_pinned = ContextVar("primary_pinned", default=False)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Request ghi (POST/PUT/PATCH/DELETE) đọc từ primary và gắn cookie
+    `db_primary` để các request sau của cùng phiên cũng đọc từ primary trong
+    `DB_PRIMARY_PIN_SECONDS` giây, lâu hơn độ trễ replica tối đa được chấp nhận.
+    Không cấu hình replica thì không làm gì.
+    """
+
+    def __init__(self, app, pin_seconds=DB_PRIMARY_PIN_SECONDS):
+        self.app = app
+        self.pin_seconds = pin_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replicas.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        writes = scope["method"] not in ("GET", "HEAD", "OPTIONS")
+        pinned = writes
+        if not pinned:
+            pinned_until = cookie_parser(Headers(scope=scope).get("cookie", "")).get(DB_PIN_COOKIE)
+            pinned = bool(pinned_until) and pinned_until.isdigit() and int(pinned_until) > time.time()
+
+        async def send_with_pin(message):
+            if writes and message["type"] == "http.response.start" and message["status"] < 500:
+                until = int(time.time() + self.pin_seconds) + 1
+                MutableHeaders(raw=message["headers"]).append(
+                    "set-cookie", f"{DB_PIN_COOKIE}={until}; HttpOnly; Max-Age={int(self.pin_seconds) + 1}; "
+                                  f"Path=/; SameSite=lax")
+            await send(message)
+
+        token = primary_pinned.set(pinned)
+        try:
+            await self.app(scope, receive, send_with_pin)
+        finally:
+            primary_pinned.reset(token)
+
+
+# ===== Truy cập DB không chặn event loop =====
+
+# Số luồng bằng kích thước pool: mỗi luồng luôn có thể mượn được một kết nối
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', str(POOL_MAX_SIZE)))
+
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Chạy một hàm blocking bất kỳ trên thread pool dành cho DB."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Gọi `fn(db, *args, **kwargs)` trên thread pool với một kết nối mượn từ pool.
+
+    Việc chờ pool, chờ mạng và chạy truy vấn đều diễn ra ngoài event loop,
+    nên một truy vấn chậm không làm treo các request khác. Lần gọi đầu tiên
+    của một request phải qua admission control (có thể ném Overloaded).
+    """
+    name = getattr(fn, "__name__", "unknown")
+    # Lấy ở event loop: context của request không tự sang luồng của executor
+    profile = current_profile.get()
+    return await _admitted(run_blocking, _call_with_connection, pool, fn, name, profile, args, kwargs)
+
+
+async def run_db_read(fn, *args, **kwargs):
+    """
+    Như `run_db` nhưng cho hàm chỉ đọc: chạy trên một replica nếu có replica
+    dùng được và request không bị ghim vào primary (xem ReadYourWritesMiddleware).
+    Replica lỗi kết nối giữa chừng thì bị loại và hàm được chạy lại trên primary.
+    """
+    if not replicas.enabled:
+        return await run_db(fn, *args, **kwargs)
+    if primary_pinned.get():
+        replicas.record_pinned_read()
+        return await run_db(fn, *args, **kwargs)
+
+    name = getattr(fn, "__name__", "unknown")
+    profile = current_profile.get()
+
+    def job():
+        replica = replicas.choose()
+        if replica is not None:
+            try:
+                return _call_with_connection(replica.pool, fn, name, profile, args, kwargs)
+            except (InterfaceError, OperationalError) as e:
+                replicas.eject(replica, e)
+            except PoolError:
+                pass  # replica vừa hết kết nối rảnh: đọc từ primary
+        return _call_with_connection(pool, fn, name, profile, args, kwargs)
+
+    return await _admitted(run_blocking, job)
+
+
+async def _admitted(call, *args):
+    """
+    Xin suất cho request hiện tại (nếu chưa có) rồi chạy; thời gian được báo
+    cho admission. Việc nền (đồng bộ chỉ mục, dọn giỏ hết hạn, dựng chỉ mục
+    liên quan, job nhập sản phẩm chạy sau khi response đã gửi) không có
+    ticket: không xin suất và không tính vào giới hạn AIMD, vì một lần chạy
+    dài vài giây của chúng sẽ làm giới hạn của request thật bị hạ vô cớ.
+    """
+    ticket = current_ticket.get()
+    if ticket is None or ticket.finished:
+        return await call(*args)
+    await admission.admit(ticket)
+    start = time.perf_counter()
+    timed_out = False
+    try:
+        return await call(*args)
+    except PoolError:
+        timed_out = True
+        raise
+    finally:
+        admission.record(time.perf_counter() - start, timed_out)
+
+
+def _call_with_connection(target_pool, fn, name, profile, args, kwargs):
+    start = time.perf_counter()
+    with target_pool.connection() as conn:
+        acquired = time.perf_counter()
+        db_pool_acquire_seconds.observe(acquired - start)
+        if profile is not None:
+            conn = profile.wrap(conn, name)
+        try:
+            return fn(conn, *args, **kwargs)
+        except Error:
+            db_query_errors_total.inc(name)
+            raise
+        finally:
+            db_query_seconds.observe(time.perf_counter() - acquired, name)
+
+
+def shutdown_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
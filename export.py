@@ -0,0 +1,134 @@
+"""
+Xuất toàn bộ danh mục sản phẩm dưới dạng NDJSON hoặc CSV theo luồng.
+
+Dữ liệu được đọc bằng cursor không đệm (unbuffered, MySQL gửi dòng dần qua
+socket) và mã hóa theo từng khối `EXPORT_CHUNK_ROWS` dòng, nên bộ nhớ dùng
+cố định dù danh mục có bao nhiêu sản phẩm.
+
+`since` là maSP: chỉ xuất các sản phẩm có maSP lớn hơn, để bên nhận lấy
+phần mới kể từ lần xuất trước (maSP của dòng cuối cùng).
+"""
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+
+from mysql.connector import Error
+
+from db import pool
+from refdata import reference_data
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", "replace")
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_ndjson(columns, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default))
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+def encode_csv(rows, buffer, writer):
+    buffer.seek(0)
+    buffer.truncate()
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def iter_export_chunks(cursor, fmt, categories, brands, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Đọc cursor đã execute theo từng khối và trả về bytes đã mã hóa.
+    Thêm hai cột ten_danhmuc/ten_thuonghieu tra từ dữ liệu tham chiếu.
+    """
+    columns = list(cursor.column_names)
+    category_index = columns.index("maDM") if "maDM" in columns else None
+    brand_index = columns.index("maTH") if "maTH" in columns else None
+    out_columns = columns + ["ten_danhmuc", "ten_thuonghieu"]
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        # BOM để Excel đọc đúng tiếng Việt
+        yield "\ufeff".encode("utf-8") + encode_csv([out_columns], buffer, writer)
+
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        enriched = [
+            tuple(row) + (
+                categories.get(row[category_index]) if category_index is not None else None,
+                brands.get(row[brand_index]) if brand_index is not None else None,
+            )
+            for row in rows
+        ]
+        if fmt == "csv":
+            yield encode_csv(enriched, buffer, writer)
+        else:
+            yield encode_ndjson(out_columns, enriched)
+
+
+def _open_export(since):
+    """Mượn kết nối, nạp dữ liệu tham chiếu và chạy truy vấn xuất."""
+    pooled = pool.acquire()
+    try:
+        db = pooled.conn
+        # Nạp dữ liệu tham chiếu trước: cursor không đệm chiếm kết nối tới khi đọc hết
+        categories = reference_data.categories(db)
+        brands = reference_data.brands(db)
+
+        cursor = db.cursor(buffered=False)
+        query = "SELECT sp.* FROM sanpham sp"
+        params = []
+        if since is not None:
+            query += " WHERE sp.maSP > %s"
+            params.append(since)
+        query += " ORDER BY sp.maSP"
+        cursor.execute(query, params)
+    except BaseException:
+        pool.release(pooled, broken=True)
+        raise
+    return pooled, cursor, categories, brands
+
+
+def stream_products(fmt, since=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Generator đồng bộ cho StreamingResponse (Starlette chạy nó trên thread
+    pool). Kết nối chỉ được mượn khi bắt đầu đọc và luôn được trả lại khi
+    xuất xong hoặc khi client ngắt giữa chừng.
+    """
+    try:
+        pooled, cursor, categories, brands = _open_export(since)
+    except Error as e:
+        print(f"Error starting export: {e}")
+        return
+
+    finished = False
+    try:
+        yield from iter_export_chunks(cursor, fmt, categories, brands, chunk_rows)
+        cursor.close()
+        pooled.conn.rollback()  # kết thúc snapshot đọc
+        finished = True
+    except Error as e:
+        print(f"Error exporting products: {e}")
+    finally:
+        # Nếu client ngắt giữa chừng, kết nối còn dòng chưa đọc: bỏ nó đi
+        pool.release(pooled, broken=not finished)
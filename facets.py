@@ -0,0 +1,216 @@
+"""
+Lọc nhiều lựa chọn (danh mục, thương hiệu, khoảng giá) kèm số lượng theo
+từng lựa chọn, tính hoàn toàn trong bộ nhớ.
+
+Mỗi giá trị của một facet giữ một bitmap (số nguyên Python, bit thứ maSP bật
+nếu sản phẩm có giá trị đó). Lọc là phép OR trong cùng facet rồi AND giữa các
+facet; số lượng của một facet được đếm với bộ lọc của các facet *khác*, để
+người dùng thấy chọn thêm một ô sẽ ra bao nhiêu sản phẩm.
+"""
+import threading
+
+# (mã trên URL, nhãn hiển thị, giá từ, giá đến) - khoảng [từ, đến)
+PRICE_RANGES = [
+    ("duoi-200k", "Dưới 200.000đ", 0, 200_000),
+    ("200k-500k", "200.000đ - 500.000đ", 200_000, 500_000),
+    ("500k-1tr", "500.000đ - 1.000.000đ", 500_000, 1_000_000),
+    ("tren-1tr", "Trên 1.000.000đ", 1_000_000, None),
+]
+
+FACETS = ("category", "brand", "price")
+
+
+def price_range_of(price):
+    if price is None:
+        return None
+    for key, _, low, high in PRICE_RANGES:
+        if price >= low and (high is None or price < high):
+            return key
+    return None
+
+
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._all = 0
+        self._bitmaps = {facet: {} for facet in FACETS}  # facet -> {giá trị: bitmap}
+        self._products = {}  # maSP -> {facet: giá trị}
+        self._labels = {"category": {}, "brand": {}, "price": {k: label for k, label, _, _ in PRICE_RANGES}}
+        self.max_id = 0
+        self.ready = False
+
+    # ----- cập nhật -----
+
+    def set_labels(self, categories, brands):
+        """categories/brands: {mã: tên} lấy từ bảng danhmuc/thuonghieu."""
+        with self._lock:
+            self._labels["category"] = dict(categories)
+            self._labels["brand"] = dict(brands)
+
+    def _clear(self, product_id):
+        values = self._products.pop(product_id, None)
+        if values is None:
+            return
+        bit = 1 << product_id
+        self._all &= ~bit
+        for facet, value in values.items():
+            bitmaps = self._bitmaps[facet]
+            if value in bitmaps:
+                bitmaps[value] &= ~bit
+
+    def upsert(self, product_id, category_id, brand_id, price):
+        values = {
+            "category": category_id,
+            "brand": brand_id,
+            "price": price_range_of(price),
+        }
+        bit = 1 << product_id
+        with self._lock:
+            self._clear(product_id)
+            self._all |= bit
+            for facet, value in values.items():
+                if value is not None:
+                    bitmaps = self._bitmaps[facet]
+                    bitmaps[value] = bitmaps.get(value, 0) | bit
+            self._products[product_id] = values
+            if product_id > self.max_id:
+                self.max_id = product_id
+
+    def remove(self, product_id):
+        with self._lock:
+            self._clear(product_id)
+
+    def load(self, documents):
+        """Nạp lại toàn bộ từ các dòng (maSP, maDM, maTH, gia)."""
+        fresh = FacetIndex()
+        for row in documents:
+            fresh.upsert(row['maSP'], row['maDM'], row['maTH'], row['gia'])
+        with self._lock:
+            self._all = fresh._all
+            self._bitmaps = fresh._bitmaps
+            self._products = fresh._products
+            self.max_id = fresh.max_id
+            self.ready = True
+
+    # ----- truy vấn -----
+
+    def _resolve(self, facet, selected):
+        """Đổi tên trên URL sang mã; trả về set rỗng nếu không chọn gì."""
+        if not selected:
+            return set()
+        if facet == "price":
+            return {value for value in selected if value in self._labels["price"]}
+        by_name = {name: key for key, name in self._labels[facet].items()}
+        # Giữ một giá trị không tồn tại để lựa chọn sai cho ra 0 kết quả
+        return {by_name.get(name, ("missing", name)) for name in selected}
+
+    def _union(self, facet, values):
+        bitmaps = self._bitmaps[facet]
+        result = 0
+        for value in values:
+            result |= bitmaps.get(value, 0)
+        return result
+
+    def _options(self, facet, counts, chosen):
+        labels = self._labels[facet]
+        if facet == "price":
+            keys = [key for key, _, _, _ in PRICE_RANGES]
+        else:
+            keys = sorted(labels, key=lambda k: labels[k])
+        options = []
+        for key in keys:
+            options.append({
+                "value": key if facet == "price" else labels[key],
+                "label": labels[key],
+                "count": counts.get(key, 0),
+                "selected": key in chosen,
+            })
+        return options
+
+    def query(self, selected, after=None, limit=24, ranked_ids=None):
+        """
+        selected: {"category": [tên], "brand": [tên], "price": [mã khoảng giá]}.
+
+        Không có `ranked_ids`: kết quả theo maSP giảm dần, `after` là maSP cuối
+        trang trước. Có `ranked_ids` (kết quả tìm kiếm đã xếp hạng): chỉ lọc
+        trong danh sách đó và giữ nguyên thứ tự.
+
+        Trả về (danh sách maSP của trang, next_after, {facet: [lựa chọn]},
+        tổng số sản phẩm khớp bộ lọc trên mọi trang).
+        """
+        with self._lock:
+            chosen = {facet: self._resolve(facet, selected.get(facet)) for facet in FACETS}
+            if ranked_ids is None:
+                page, next_after, counts, total = self._query_bitmaps(chosen, after, limit)
+            else:
+                page, next_after, counts, total = self._query_ranked(chosen, ranked_ids, after, limit)
+            options = {facet: self._options(facet, counts[facet], chosen[facet]) for facet in FACETS}
+        return page, next_after, options, total
+
+    def _query_bitmaps(self, chosen, after, limit):
+        masks = {facet: (self._union(facet, values) if values else self._all)
+                 for facet, values in chosen.items()}
+
+        counts = {}
+        for facet in FACETS:
+            base = self._all
+            for other in FACETS:
+                if other != facet:
+                    base &= masks[other]
+            counts[facet] = {value: (base & bitmap).bit_count()
+                             for value, bitmap in self._bitmaps[facet].items()}
+
+        result = self._all
+        for mask in masks.values():
+            result &= mask
+        total = result.bit_count()
+        if after is not None:
+            result &= (1 << max(after, 0)) - 1
+
+        # Lấy các bit cao nhất (maSP lớn nhất) trước
+        page = []
+        while result and len(page) <= limit:
+            top = result.bit_length() - 1
+            page.append(top)
+            result ^= 1 << top
+        next_after = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_after = page[-1]
+        return page, next_after, counts, total
+
+    def _query_ranked(self, chosen, ranked_ids, after, limit):
+        counts = {facet: {} for facet in FACETS}
+        matched = []
+        for product_id in ranked_ids:
+            values = self._products.get(product_id)
+            if values is None:
+                continue
+            ok = {facet: (not chosen[facet] or values[facet] in chosen[facet]) for facet in FACETS}
+            for facet in FACETS:
+                if all(ok[other] for other in FACETS if other != facet):
+                    value = values[facet]
+                    counts[facet][value] = counts[facet].get(value, 0) + 1
+            if all(ok.values()):
+                matched.append(product_id)
+
+        start = 0
+        if after is not None:
+            try:
+                start = matched.index(after) + 1
+            except ValueError:
+                start = 0
+        page = matched[start:start + limit]
+        next_after = page[-1] if start + limit < len(matched) else None
+        return page, next_after, counts, len(matched)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "documents": len(self._products),
+                "max_id": self.max_id,
+            }
+
+
+facet_index = FacetIndex()
@@ -0,0 +1,270 @@
+"""
+Ảnh thu nhỏ cho sản phẩm: GET /img/{maSP}/{width}.
+
+- Ảnh gốc là `sanpham.hinhAnh`: đường dẫn trong static/ (vd.
+  "/static/img/products/1.jpg" hoặc "img/products/1.jpg"). Ảnh là URL ngoài
+  thì chuyển hướng tới URL đó; không có ảnh thì trả ảnh SVG thay thế.
+- Chỉ các chiều rộng trong `IMAGE_WIDTHS`, để số file cache có giới hạn.
+  WebP nếu trình duyệt nhận `image/webp`, ngược lại JPEG.
+- Cache trên đĩa theo nội dung: tên file là SHA-256 của ảnh gốc + chiều
+  rộng + định dạng + chất lượng, nên các sản phẩm dùng chung ảnh dùng chung
+  thumbnail và ảnh gốc đổi nội dung thì tự ra file mới.
+- Việc giải mã/thu nhỏ/nén chạy trong process pool (`IMAGE_WORKERS` tiến
+  trình), không chiếm GIL của worker web; nhiều request cùng một thumbnail
+  chưa có chỉ tạo nó một lần.
+- File đã có được gửi bằng sendfile phía proxy nếu đặt
+  `IMAGE_ACCEL_REDIRECT` (nginx `X-Accel-Redirect`, location internal trỏ tới
+  `IMAGE_CACHE_DIR`), hoặc `http.response.pathsend` nếu server ASGI hỗ trợ;
+  ngược lại dùng FileResponse.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from starlette.responses import FileResponse, Response
+
+IMAGE_SOURCE_DIR = os.getenv("IMAGE_SOURCE_DIR", "static")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join("cache", "thumbs"))
+IMAGE_WIDTHS = tuple(int(w) for w in os.getenv("IMAGE_WIDTHS", "160,320,640,960").split(","))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "82"))
+# Thời gian nhớ hinhAnh của một sản phẩm trong bộ nhớ
+IMAGE_SOURCE_TTL = float(os.getenv("IMAGE_SOURCE_TTL", "300"))
+IMAGE_MAX_AGE = int(os.getenv("IMAGE_MAX_AGE", "86400"))
+# vd. "/_thumbs/": gửi header X-Accel-Redirect thay vì tự gửi file
+IMAGE_ACCEL_REDIRECT = os.getenv("IMAGE_ACCEL_REDIRECT", "")
+IMAGE_LOOKUP_CACHE_SIZE = 10_000
+
+IMAGE_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{w}" viewBox="0 0 100 100">'
+    '<rect width="100" height="100" fill="#e9ecef"/>'
+    '<text x="50" y="54" font-family="sans-serif" font-size="9" fill="#6c757d" '
+    'text-anchor="middle">No Image</text></svg>'
+)
+
+
+def negotiate_format(accept):
+    return "webp" if accept and "image/webp" in accept else "jpeg"
+
+
+def resolve_source(hinh_anh, source_dir=IMAGE_SOURCE_DIR):
+    """
+    ("file", đường dẫn tuyệt đối) cho ảnh trong `source_dir`, ("url", url)
+    cho ảnh ngoài, None nếu không có ảnh dùng được.
+    """
+    if not hinh_anh:
+        return None
+    hinh_anh = hinh_anh.strip()
+    if hinh_anh.startswith(("http://", "https://", "//")):
+        return "url", hinh_anh
+    path = hinh_anh.split("?", 1)[0].lstrip("/")
+    if path.startswith("static/"):
+        path = path[len("static/"):]
+    root = os.path.realpath(source_dir)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if not full_path.startswith(root + os.sep) or not os.path.isfile(full_path):
+        return None
+    return "file", full_path
+
+
+def render_thumbnail(source_path, target_path, width, fmt, quality):
+    """Chạy trong process pool: thu nhỏ `source_path` về `width` px, ghi `target_path`."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        # JPEG lớn: giải mã ở độ phân giải thấp hơn ngay từ đầu
+        image.draft("RGB", (width, width * 4))
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if fmt == "jpeg" or image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if fmt == "webp" and "A" in image.getbands() else "RGB")
+        options = {"quality": quality}
+        if fmt == "jpeg":
+            options.update(optimize=True, progressive=True)
+        else:
+            options["method"] = 4
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        temp_path = f"{target_path}.{os.getpid()}.tmp"
+        image.save(temp_path, "WEBP" if fmt == "webp" else "JPEG", **options)
+    os.replace(temp_path, target_path)
+    return target_path
+
+
+class ThumbnailService:
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, workers=IMAGE_WORKERS, source_ttl=IMAGE_SOURCE_TTL):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.source_ttl = source_ttl
+        self._lock = threading.Lock()
+        self._pool = None
+        self._sources = OrderedDict()   # maSP -> (hinhAnh, thời điểm lấy)
+        self._digests = OrderedDict()   # (đường dẫn, mtime, size) -> sha256 ảnh gốc
+        self._pending = {}              # đường dẫn thumbnail -> Future
+        self._hits = 0
+        self._misses = 0
+        self._failures = 0
+
+    # ----- ảnh gốc -----
+
+    def cached_source(self, product_id):
+        """hinhAnh đã nhớ của sản phẩm: (True, hinhAnh) hoặc (False, None) nếu cần hỏi DB."""
+        with self._lock:
+            entry = self._sources.get(product_id)
+            if entry is None or time.monotonic() - entry[1] > self.source_ttl:
+                return False, None
+            self._sources.move_to_end(product_id)
+            return True, entry[0]
+
+    def remember_source(self, product_id, hinh_anh):
+        with self._lock:
+            self._sources[product_id] = (hinh_anh, time.monotonic())
+            self._sources.move_to_end(product_id)
+            while len(self._sources) > IMAGE_LOOKUP_CACHE_SIZE:
+                self._sources.popitem(last=False)
+
+    def invalidate(self, product_id=None):
+        with self._lock:
+            if product_id is None:
+                self._sources.clear()
+            else:
+                self._sources.pop(product_id, None)
+
+    def _source_digest(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+            if digest is not None:
+                self._digests.move_to_end(key)
+                return digest
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with self._lock:
+            self._digests[key] = digest
+            while len(self._digests) > IMAGE_LOOKUP_CACHE_SIZE:
+                self._digests.popitem(last=False)
+        return digest
+
+    # ----- thumbnail -----
+
+    def thumbnail_path(self, source_path, width, fmt):
+        """Chạy ngoài event loop (đọc ảnh gốc lần đầu để tính hash)."""
+        quality = IMAGE_WEBP_QUALITY if fmt == "webp" else IMAGE_JPEG_QUALITY
+        key = hashlib.sha256(f"{self._source_digest(source_path)}:{width}:{fmt}:{quality}".encode()).hexdigest()
+        ext = "webp" if fmt == "webp" else "jpg"
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{ext}"), key, quality
+
+    def locate(self, hinh_anh, width, fmt):
+        """
+        Chạy qua run_blocking. Trả None (không có ảnh), ("url", url) hoặc
+        ("file", ảnh gốc, thumbnail, hash, chất lượng).
+        """
+        source = resolve_source(hinh_anh)
+        if source is None or source[0] == "url":
+            return source
+        target_path, key, quality = self.thumbnail_path(source[1], width, fmt)
+        return "file", source[1], target_path, key, quality
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    async def ensure(self, source_path, target_path, width, fmt, quality):
+        """Tạo thumbnail nếu chưa có; các request cùng lúc chờ chung một lần tạo."""
+        if os.path.exists(target_path):
+            self._hits += 1
+            return target_path
+        future = self._pending.get(target_path)
+        if future is None:
+            self._misses += 1
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor(), render_thumbnail, source_path,
+                                          target_path, width, fmt, quality)
+            self._pending[target_path] = future
+            future.add_done_callback(lambda _: self._pending.pop(target_path, None))
+        try:
+            return await asyncio.shield(future)
+        except BrokenProcessPool:
+            # Tiến trình con chết (vd. hết bộ nhớ khi giải mã ảnh quá lớn): lần sau tạo pool mới
+            self._failures += 1
+            with self._lock:
+                self._pool = None
+            raise
+        except Exception:
+            self._failures += 1
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pool_started": self._pool is not None,
+                "hits": self._hits,
+                "misses": self._misses,
+                "failures": self._failures,
+                "pending": len(self._pending),
+                "sources_cached": len(self._sources),
+            }
+
+
+thumbnails = ThumbnailService()
+
+
+def placeholder_response(width):
+    return Response(PLACEHOLDER_SVG.format(w=width), media_type="image/svg+xml",
+                    headers={"Cache-Control": f"public, max-age={IMAGE_MAX_AGE}"})
+
+
+class ThumbnailResponse(FileResponse):
+    """
+    FileResponse cho thumbnail trong cache: nhường việc gửi file cho proxy
+    (X-Accel-Redirect) hoặc cho server (pathsend) khi có thể.
+    """
+
+    def __init__(self, path, fmt, etag):
+        headers = {"Cache-Control": f"public, max-age={IMAGE_MAX_AGE}", "ETag": etag, "Vary": "Accept"}
+        self.accel_path = None
+        if IMAGE_ACCEL_REDIRECT:
+            rel = os.path.relpath(path, IMAGE_CACHE_DIR).replace(os.sep, "/")
+            self.accel_path = IMAGE_ACCEL_REDIRECT.rstrip("/") + "/" + rel
+        super().__init__(path, media_type=IMAGE_FORMATS[fmt], headers=headers)
+
+    async def __call__(self, scope, receive, send):
+        if self.accel_path is not None:
+            self.headers["X-Accel-Redirect"] = self.accel_path
+            del self.headers["content-length"]
+            await send({"type": "http.response.start", "status": self.status_code,
+                        "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if "http.response.pathsend" in scope.get("extensions", {}):
+            stat_result = os.stat(self.path)
+            self.set_stat_headers(stat_result)
+            await send({"type": "http.response.start", "status": self.status_code,
+                        "headers": self.raw_headers})
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            return
+        await super().__call__(scope, receive, send)
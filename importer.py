@@ -0,0 +1,418 @@
+"""
+Nhập sản phẩm hàng loạt từ file CSV / JSON / NDJSON (trang quản trị).
+
+- File được đọc tuần tự từng dòng (JSON mảng được giải mã dần theo khối),
+  không bao giờ nạp toàn bộ vào bộ nhớ.
+- Tên danh mục/thương hiệu được đổi sang maDM/maTH qua `reference_data`.
+- Dòng hợp lệ được ghi bằng `executemany` theo lô `IMPORT_BATCH_ROWS` dòng,
+  commit sau mỗi `IMPORT_COMMIT_ROWS` dòng. Nếu một lô bị MySQL từ chối, lô
+  đó được ghi lại từng dòng để chỉ ra đúng dòng lỗi.
+- Tiến độ và lỗi theo dòng được giữ trong `ImportJob`, xem qua
+  GET /admin/products/import/{job_id}. Bản chụp tiến độ được ghi ra
+  `IMPORT_JOBS_DIR` để worker nào (serve.py) nhận request theo dõi cũng đọc được.
+"""
+import codecs
+import csv
+import decimal
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from mysql.connector import Error
+
+from catalog import sync_catalog_indexes
+from refdata import reference_data
+
+IMPORT_BATCH_ROWS = int(os.getenv("IMPORT_BATCH_ROWS", "500"))
+IMPORT_COMMIT_ROWS = int(os.getenv("IMPORT_COMMIT_ROWS", "5000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "200"))
+IMPORT_JOBS_KEPT = int(os.getenv("IMPORT_JOBS_KEPT", "20"))
+IMPORT_JOBS_DIR = os.getenv("IMPORT_JOBS_DIR", os.path.join(tempfile.gettempdir(), "clothing-shop-imports"))
+
+IMPORT_FORMATS = ("csv", "json", "ndjson")
+
+# Cột sanpham có thể nhập trực tiếp (ngoài maDM/maTH)
+TEXT_COLUMNS = ("moTa", "hinhAnh", "kichCo", "mauSac")
+
+
+class RowError(ValueError):
+    """Lỗi của một dòng dữ liệu nhập (thông báo hiển thị cho admin)."""
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if extension == "jsonl":
+        return "ndjson"
+    return extension if extension in IMPORT_FORMATS else None
+
+
+# ===== ĐỌC FILE =====
+
+def _iter_csv(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        for row in csv.DictReader(text):
+            yield row
+    finally:
+        text.detach()
+
+
+def _iter_ndjson(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+    try:
+        for line in text:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    finally:
+        text.detach()
+
+
+def _iter_json_array(stream, chunk_size=64 * 1024):
+    """Giải mã dần một mảng JSON lớn: mỗi lần chỉ giữ phần chưa giải mã."""
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # Bỏ khoảng trắng và dấu phân cách
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != "[":
+                raise ValueError("JSON import must be an array of objects")
+            started = True
+            position += 1
+            continue
+        if started and position < len(buffer) and buffer[position] == "]":
+            return
+
+        if position < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                item = None
+            else:
+                # Số ở cuối buffer có thể còn tiếp ở khối sau
+                if end < len(buffer) or eof:
+                    yield item
+                    position = end
+                    continue
+        if eof:
+            if not started:
+                return
+            raise ValueError("Unterminated JSON array")
+
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+            buffer = buffer[position:] + reader.decode(b"", final=True)
+        else:
+            buffer = buffer[position:] + reader.decode(chunk)
+        position = 0
+
+
+def iter_records(stream, fmt):
+    """Các dòng dữ liệu (dict) từ file nhị phân `stream`."""
+    if fmt == "csv":
+        return _iter_csv(stream)
+    if fmt == "ndjson":
+        return _iter_ndjson(stream)
+    return _iter_json_array(stream)
+
+
+# ===== KIỂM TRA DÒNG =====
+
+def _text(record, key):
+    value = record.get(key)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _number(record, key, kind, required=False):
+    value = record.get(key)
+    if isinstance(value, str):
+        value = value.strip().replace(" ", "")
+    if value is None or value == "":
+        if required:
+            raise RowError(f"thiếu '{key}'")
+        return None
+    try:
+        number = kind(decimal.Decimal(str(value)))
+    except (decimal.InvalidOperation, ValueError):
+        raise RowError(f"'{key}' không phải số: {value!r}")
+    if number < 0:
+        raise RowError(f"'{key}' không được âm")
+    return number
+
+
+def _reference(db, record, id_key, name_key, lookup, label):
+    key = _number(record, id_key, int)
+    if key is not None:
+        return key
+    name = _text(record, name_key)
+    if name is None:
+        return None
+    key = lookup(db, name)
+    if key is None:
+        raise RowError(f"không có {label} '{name}'")
+    return key
+
+
+def validate_record(db, record):
+    """Đổi một dòng nhập thành dict cột sanpham -> giá trị, hoặc ném RowError."""
+    if not isinstance(record, dict):
+        raise RowError("dòng không phải object")
+    name = _text(record, "ten")
+    if name is None:
+        raise RowError("thiếu 'ten'")
+    values = {
+        "ten": name,
+        "gia": _number(record, "gia", decimal.Decimal, required=True),
+        "soLuong": _number(record, "soLuong", int) or 0,
+        "maDM": _reference(db, record, "maDM", "danhmuc", reference_data.category_id, "danh mục"),
+        "maTH": _reference(db, record, "maTH", "thuonghieu", reference_data.brand_id, "thương hiệu"),
+    }
+    for column in TEXT_COLUMNS:
+        if column in record:
+            values[column] = _text(record, column)
+    return values
+
+
+# ===== TIẾN ĐỘ =====
+
+class ImportJob:
+    def __init__(self, filename, fmt):
+        self.id = uuid.uuid4().hex[:12]
+        self.filename = filename
+        self.format = fmt
+        self.status = "pending"
+        self.rows_read = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []  # [{"row": số dòng, "error": thông báo}], tối đa IMPORT_MAX_ERRORS
+        self.message = None
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    def add_error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "format": self.format,
+            "status": self.status,
+            "rows_read": self.rows_read,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": list(self.errors),
+            "message": self.message,
+            "elapsed": round(elapsed, 3),
+            "rows_per_sec": round(self.rows_read / elapsed, 1) if elapsed else None,
+        }
+
+
+class ImportJobs:
+    """
+    Các lần nhập gần nhất (giữ `IMPORT_JOBS_KEPT` job).
+
+    Job đang chạy nằm trong bộ nhớ của worker đã nhận file; mỗi job còn được
+    ghi thành `<directory>/<id>.json` để các worker khác trả lời được.
+    """
+
+    _ID_RE = re.compile(r"^[0-9a-f]{12}$")
+
+    def __init__(self, kept=IMPORT_JOBS_KEPT, directory=IMPORT_JOBS_DIR):
+        self.kept = kept
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def create(self, filename, fmt):
+        job = ImportJob(filename, fmt)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.kept:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest].status in ("pending", "running"):
+                    break
+                self._jobs.popitem(last=False)
+        self.save(job)
+        self._prune_files()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def save(self, job):
+        """Ghi bản chụp tiến độ của `job` (ghi file tạm rồi đổi tên)."""
+        path = os.path.join(self.directory, f"{job.id}.json")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(job.to_dict(), f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Error saving import job {job.id}: {e}")
+
+    def _load(self, job_id):
+        try:
+            with open(os.path.join(self.directory, f"{job_id}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _saved_ids(self):
+        """Mã các job đã ghi ra đĩa, mới nhất trước."""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            try:
+                entries.append((os.path.getmtime(os.path.join(self.directory, name)), name[:-5]))
+            except OSError:
+                continue
+        return [job_id for _, job_id in sorted(entries, reverse=True)]
+
+    def _prune_files(self):
+        for job_id in self._saved_ids()[self.kept:]:
+            try:
+                os.unlink(os.path.join(self.directory, f"{job_id}.json"))
+            except OSError:
+                pass
+
+    def status(self, job_id):
+        """Tiến độ của job dạng dict (như `ImportJob.to_dict`), None nếu không có."""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if not self._ID_RE.match(job_id):
+            return None
+        return self._load(job_id)
+
+    def recent(self):
+        """Tiến độ các job gần nhất của mọi worker, mới nhất trước."""
+        with self._lock:
+            local = {job.id: job for job in self._jobs.values()}
+        result = []
+        for job_id in self._saved_ids()[:self.kept]:
+            if job_id in local:
+                result.append(local.pop(job_id).to_dict())
+            else:
+                saved = self._load(job_id)
+                if saved is not None:
+                    result.append(saved)
+        result.extend(job.to_dict() for job in reversed(local.values()))
+        return result
+
+
+import_jobs = ImportJobs()
+
+
+# ===== GHI =====
+
+def _insert_statement(columns):
+    placeholders = ", ".join(["%s"] * len(columns))
+    return f"INSERT INTO sanpham ({', '.join(columns)}) VALUES ({placeholders})"
+
+
+def _write_batch(db, job, batch):
+    """batch: [(số dòng, dict giá trị)] cùng tập cột."""
+    columns = list(batch[0][1])
+    statement = _insert_statement(columns)
+    cursor = db.cursor()
+    try:
+        try:
+            cursor.executemany(statement, [tuple(values[c] for c in columns) for _, values in batch])
+            job.inserted += len(batch)
+            return
+        except Error:
+            # Cả câu INSERT nhiều dòng bị hủy: ghi lại từng dòng để biết dòng nào lỗi
+            pass
+        for row_number, values in batch:
+            try:
+                cursor.execute(statement, tuple(values[c] for c in columns))
+                job.inserted += 1
+            except Error as e:
+                job.add_error(row_number, getattr(e, "msg", None) or str(e))
+    finally:
+        cursor.close()
+
+
+def run_import(db, job, stream, batch_rows=IMPORT_BATCH_ROWS, commit_rows=IMPORT_COMMIT_ROWS):
+    """Chạy qua `run_db`: đọc `stream`, ghi theo lô, commit theo khối."""
+    job.status = "running"
+    job.started_at = time.time()
+    batch = []
+    since_commit = 0
+    try:
+        # Dòng 1 của CSV là header
+        first_row = 2 if job.format == "csv" else 1
+        for row_number, record in enumerate(iter_records(stream, job.format), first_row):
+            job.rows_read += 1
+            try:
+                values = validate_record(db, record)
+            except RowError as e:
+                job.add_error(row_number, str(e))
+                continue
+
+            if batch and list(batch[0][1]) != list(values):
+                _write_batch(db, job, batch)
+                since_commit += len(batch)
+                batch = []
+            batch.append((row_number, values))
+            if len(batch) >= batch_rows:
+                _write_batch(db, job, batch)
+                since_commit += len(batch)
+                batch = []
+                import_jobs.save(job)
+            if since_commit >= commit_rows:
+                db.commit()
+                since_commit = 0
+
+        if batch:
+            _write_batch(db, job, batch)
+        db.commit()
+        job.status = "done"
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        # File hỏng giữa chừng: vẫn ghi các dòng hợp lệ đã đọc, báo lỗi
+        if batch:
+            _write_batch(db, job, batch)
+        db.commit()
+        job.status = "failed"
+        job.message = f"Dòng {job.rows_read + 1}: {e}"
+    except Error as e:
+        db.rollback()
+        job.status = "failed"
+        job.message = str(e)
+        raise
+    finally:
+        job.finished_at = time.time()
+        import_jobs.save(job)
+
+    if job.inserted:
+        sync_catalog_indexes(db)
+    return job
@@ -1,19 +1,50 @@
-import json
 from pydantic import BaseModel
 from fastapi.responses import StreamingResponse
-from typing import List, Dict, Any
-from fastapi import FastAPI, Request, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-import mysql.connector
+from typing import List, Literal
+from fastapi import FastAPI, Request, Form, HTTPException, Query, File, UploadFile
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, PlainTextResponse, FileResponse, JSONResponse
 from mysql.connector import Error
 import os
-import uvicorn
 from typing import Optional
-import socket
+import asyncio
+import datetime
+import hashlib
+import shutil
+import tempfile
+from markupsafe import Markup
+
+import queries
+import cart
+import checkout
+import export
+import importer
+import orders
+import metrics
+import assets
+import images
+from passwords import password_hasher, PasswordHasherBusy, PASSWORD_RETRY_AFTER
+import sessions
+from profiles import profile_cache, load_profile
+from profiler import ProfilerMiddleware
+from compression import CompressionMiddleware
+from streaming import TemplateStreamer
+from db import pool, replicas, run_db, run_db_read, run_blocking, shutdown_executor, ReadYourWritesMiddleware
+from refdata import reference_data
+from search import search_index
+from facets import facet_index, PRICE_RANGES
+from catalog import catalog_indexes_ready, rebuild_catalog_indexes, sync_catalog_indexes
+from pagecache import page_cache, make_etag, etag_matches, CacheEntry
+from aggregates import sales_aggregates
+from related import related_index, RELATED_CHECK_INTERVAL, RELATED_REBUILD_INTERVAL
+from admission import admission, admit_current, current_ticket, AdmissionMiddleware, Overloaded
 
 app = FastAPI(title="Clothing Shop", debug=True)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(sessions.SessionMiddleware, load_profile=load_profile)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(CompressionMiddleware)
 
 # Tạo thư mục
 os.makedirs("static/css", exist_ok=True)
@@ -22,172 +53,476 @@ os.makedirs("templates", exist_ok=True)
 os.makedirs("templates/admin", exist_ok=True)
 
 # Mount static files and templates
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
-
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'Sonbui@2005',
-    'database': 'clothing_shop',
-    'charset': 'utf8mb4'
-}
+app.mount("/static", assets.AssetFiles(directory="static"), name="static")
+templates = metrics.InstrumentedTemplates(directory="templates")
+templates.env.globals["url_for"] = assets.url_for
+streamed_templates = TemplateStreamer(templates)
+
+
+# Chu kỳ (giây) bổ sung sản phẩm mới vào chỉ mục tìm kiếm/facet
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", "60"))
 
 
-def get_db_connection():
+@app.on_event("startup")
+async def open_db_pool():
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        await run_blocking(pool.warm)
     except Error as e:
         print(f"Database connection error: {e}")
-        return None
 
 
-def get_current_user(request: Request):
-    user_id = request.cookies.get("user_id")
-    username = request.cookies.get("username")
-    role = request.cookies.get("role")
+async def keep_catalog_indexes_fresh():
+    while True:
+        try:
+            if catalog_indexes_ready():
+                await run_db(sync_catalog_indexes)
+            else:
+                await run_db(rebuild_catalog_indexes)
+        except Error as e:
+            print(f"Error syncing catalog indexes: {e}")
+        await asyncio.sleep(CATALOG_SYNC_INTERVAL)
 
-    if user_id and username and role:
-        return {"user_id": user_id, "username": username, "role": role}
-    return None
 
+@app.on_event("startup")
+async def start_catalog_indexes():
+    app.state.catalog_sync_task = asyncio.create_task(keep_catalog_indexes_fresh())
 
-# ===== ROUTES =====
 
-@app.get("/", response_class=HTMLResponse)
-async def home(request: Request):
-    current_user = get_current_user(request)
+# Chu kỳ (giây) tính lại số lượng trong giỏ và đối soát toàn bộ số liệu bán hàng
+SALES_REFRESH_INTERVAL = float(os.getenv("SALES_REFRESH_INTERVAL", "30"))
+SALES_RECONCILE_INTERVAL = float(os.getenv("SALES_RECONCILE_INTERVAL", "600"))
+
 
-    featured_products = []
-    db = get_db_connection()
-    if db:
+async def keep_sales_aggregates_fresh():
+    last_reconcile = None
+    while True:
         try:
-            cursor = db.cursor(dictionary=True)
-            cursor.execute("""
-                           SELECT sp.*, dm.ten as ten_danhmuc, th.ten as ten_thuonghieu
-                           FROM sanpham sp
-                                    LEFT JOIN danhmuc dm ON sp.maDM = dm.maDM
-                                    LEFT JOIN thuonghieu th ON sp.maTH = th.maTH
-                           ORDER BY sp.maSP DESC LIMIT 8
-                           """)
-            featured_products = cursor.fetchall()
-            cursor.close()
+            now = asyncio.get_running_loop().time()
+            if last_reconcile is None or now - last_reconcile >= SALES_RECONCILE_INTERVAL:
+                await run_db(sales_aggregates.reconcile)
+                last_reconcile = now
+            elif sales_aggregates.cart_stale:
+                await run_db(sales_aggregates.refresh_cart_units)
         except Error as e:
-            print(f"Error fetching products: {e}")
-        finally:
-            if db.is_connected():
-                db.close()
+            print(f"Error refreshing sales aggregates: {e}")
+        await asyncio.sleep(SALES_REFRESH_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_sales_aggregates():
+    app.state.sales_task = asyncio.create_task(keep_sales_aggregates_fresh())
+
+
+async def keep_related_index_fresh():
+    can_rebuild = True
+    while True:
+        try:
+            # Nạp file có sẵn trước (có thể do `python related.py` dựng), rồi mới dựng lại nếu cũ
+            if related_index.refresh():
+                page_cache.invalidate_tags("related")
+            age = related_index.file_age()
+            if can_rebuild and (age is None or age >= RELATED_REBUILD_INTERVAL):
+                if await run_db_read(related_index.rebuild) and related_index.refresh():
+                    page_cache.invalidate_tags("related")
+        except ImportError as e:
+            # Thiếu NumPy/SciPy: chỉ đọc file do nơi khác dựng
+            print(f"Related products index cannot be built here: {e}")
+            can_rebuild = False
+        except (Error, OSError, ValueError) as e:
+            print(f"Error refreshing related products index: {e}")
+        await asyncio.sleep(RELATED_CHECK_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_related_index():
+    app.state.related_task = asyncio.create_task(keep_related_index_fresh())
+
+
+async def release_expired_checkouts():
+    while True:
+        try:
+            # Dọn theo lô cho tới khi hết giỏ quá hạn
+            while True:
+                released, stock = await run_db(checkout.release_expired)
+                _record_stock_changes(stock)
+                if released < checkout.CHECKOUT_SWEEP_BATCH:
+                    break
+        except Error as e:
+            print(f"Error releasing expired checkouts: {e}")
+        await asyncio.sleep(checkout.CHECKOUT_SWEEP_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_checkout_sweeper():
+    app.state.checkout_sweep_task = asyncio.create_task(release_expired_checkouts())
+
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    app.state.catalog_sync_task.cancel()
+    app.state.sales_task.cancel()
+    app.state.checkout_sweep_task.cancel()
+    app.state.related_task.cancel()
+    shutdown_executor()
+    pool.close()
+    replicas.close()
+    images.thumbnails.shutdown()
+    password_hasher.shutdown()
+
+
+def get_current_user(request: Request):
+    # Kiểm tra chữ ký cookie phiên, không truy vấn DB
+    return sessions.current_user(request)
+
+
+# ===== ROUTES =====
+
+@app.get("/health/db")
+async def db_health():
+    return pool.stats()
+
+
+@app.get("/health/replicas")
+async def replicas_health():
+    return replicas.stats()
+
+
+@app.get("/health/refdata")
+async def refdata_health():
+    return reference_data.stats()
+
+
+@app.get("/health/sales")
+async def sales_health():
+    return sales_aggregates.stats()
+
+
+@app.get("/health/admission")
+async def admission_health():
+    return admission.stats()
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """DB đang quá tải: trả 503 ngay thay vì để request chờ pool tới hết giờ."""
+    headers = {"Retry-After": str(exc.retry_after)}
+    if request.url.path.startswith("/api/"):
+        return JSONResponse({"detail": "Server is busy, please retry"}, status_code=503, headers=headers)
+    return templates.TemplateResponse("overloaded.html", {
+        "request": request,
+        "current_user": get_current_user(request),
+        "retry_after": exc.retry_after,
+    }, status_code=503, headers=headers)
+
+
+@app.get("/health/checkout")
+async def checkout_health():
+    return {
+        "hold_seconds": checkout.CHECKOUT_HOLD_SECONDS,
+        "queue": checkout.sku_queue.stats(),
+        "stock_hints": checkout.stock_hints.stats(),
+    }
+
+
+def _numeric_stats(stats):
+    return {(key,): value for key, value in stats.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+
+metrics.registry.register(metrics.GaugeCallback(
+    "db_pool", "Trạng thái pool kết nối (db.pool.stats()).", ("stat",),
+    lambda: _numeric_stats(pool.stats())))
+metrics.registry.register(metrics.GaugeCallback(
+    "page_cache", "Trạng thái cache trang (pagecache.page_cache.stats()).", ("stat",),
+    lambda: _numeric_stats(page_cache.stats())))
+metrics.registry.register(metrics.GaugeCallback(
+    "admission", "Trạng thái admission control (admission.admission.stats()).", ("stat",),
+    lambda: _numeric_stats(admission.stats())))
+metrics.registry.register(metrics.GaugeCallback(
+    "refdata_cache", "Trạng thái cache danh mục/thương hiệu.", ("stat",),
+    lambda: _numeric_stats(reference_data.stats())))
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# ===== CACHE TRANG =====
 
-    return templates.TemplateResponse("index.html", {
+def _layout_version():
+    """Đổi khi layout thay đổi, để ETag của trang (kể cả phần ngoài fragment) đổi theo."""
+    digest = hashlib.sha256()
+    for name in ("base.html", "index.html", "product_detail.html"):
+        with open(os.path.join("templates", name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+LAYOUT_VERSION = _layout_version()
+
+
+def _cached_page_response(request, page_template, entry, current_user):
+    """
+    Khách chưa đăng nhập: entry là toàn bộ trang, gửi thẳng bytes đã cache.
+    Đã đăng nhập: entry chỉ là phần nội dung, còn navbar (có tên người dùng)
+    được render lại. ETag tính từ fragment + người dùng nên vẫn trả được 304
+    mà không cần render.
+    """
+    if current_user is None:
+        etag = entry.etag
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Cookie"}
+    else:
+        etag = make_etag(entry.etag, current_user['username'], current_user['role'], LAYOUT_VERSION)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Cookie"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if current_user is None:
+        return Response(entry.body, media_type="text/html", headers=headers)
+
+    return templates.TemplateResponse(page_template, {
         "request": request,
         "current_user": current_user,
-        "featured_products": featured_products
-    })
+        "content": Markup(entry.text)
+    }, headers=headers)
 
 
-@app.get("/products", response_class=HTMLResponse)
-async def products(
-        request: Request,
-        category: Optional[str] = None,
-        brand: Optional[str] = None,
-        search: Optional[str] = None
-):
-    current_user = get_current_user(request)
-    products_list = []
-    categories = []
-    brands = []
+async def serve_cached_page(request, current_user, key, tags, page_template, fragment_template, load):
+    """
+    Trả trang từ page_cache, hoặc gọi `load()` -> (context, cacheable) rồi
+    render và lưu lại. Khóa cache gồm `key` và vai trò người dùng.
+
+    Khi DB đang quá tải (admission từ chối request), bản cũ trong cache được
+    gửi thay vì truy vấn lại; chỉ khi không còn bản nào mới trả 503.
+    """
+    role = current_user['role'] if current_user else "anonymous"
+    cache_key = key + (role,)
 
-    db = get_db_connection()
-    if db:
+    entry = page_cache.get(cache_key)
+    if entry is None and admission.degraded:
+        entry = page_cache.get_stale(cache_key)
+    if entry is None:
         try:
-            cursor = db.cursor(dictionary=True)
+            context, cacheable = await load()
+        except Overloaded:
+            entry = page_cache.get_stale(cache_key)
+            if entry is None:
+                raise
+            return _cached_page_response(request, page_template, entry, current_user)
+        with metrics.template_render_seconds.time(fragment_template):
+            fragment = templates.get_template(fragment_template).render(
+                {**context, "current_user": current_user}
+            )
+        if current_user is None:
+            body = templates.TemplateResponse(page_template, {
+                "request": request,
+                "current_user": None,
+                "content": Markup(fragment)
+            }).body
+        else:
+            body = fragment
+        if cacheable:
+            entry = page_cache.set(cache_key, body, tags)
+        else:
+            entry = CacheEntry(body, tags)
+
+    return _cached_page_response(request, page_template, entry, current_user)
+
 
-            query = """
-                    SELECT sp.*, dm.ten as ten_danhmuc, th.ten as ten_thuonghieu
-                    FROM sanpham sp
-                             LEFT JOIN danhmuc dm ON sp.maDM = dm.maDM
-                             LEFT JOIN thuonghieu th ON sp.maTH = th.maTH
-                    WHERE 1 = 1 \
-                    """
-            params = []
+@app.get("/health/assets")
+async def assets_health():
+    return assets.asset_manifest.stats()
 
-            if category:
-                query += " AND dm.ten = %s"
-                params.append(category)
 
-            if brand:
-                query += " AND th.ten = %s"
-                params.append(brand)
+@app.get("/health/profiles")
+async def profiles_health():
+    return profile_cache.stats()
 
-            if search:
-                query += " AND sp.ten LIKE %s"
-                params.append(f"%{search}%")
 
-            query += " ORDER BY sp.maSP DESC"
+@app.get("/health/passwords")
+async def passwords_health():
+    return password_hasher.stats()
 
-            cursor.execute(query, params)
-            products_list = cursor.fetchall()
 
-            cursor.execute("SELECT ten FROM danhmuc")
-            categories = [row['ten'] for row in cursor.fetchall()]
+@app.get("/health/images")
+async def images_health():
+    return images.thumbnails.stats()
 
-            cursor.execute("SELECT ten FROM thuonghieu")
-            brands = [row['ten'] for row in cursor.fetchall()]
 
-            cursor.close()
+@app.get("/health/related")
+async def related_health():
+    return related_index.stats()
 
+
+@app.get("/health/pagecache")
+async def pagecache_health():
+    return page_cache.stats()
+
+
+@app.get("/", response_class=HTMLResponse)
+async def home(request: Request):
+    current_user = get_current_user(request)
+
+    async def load():
+        featured_products = []
+        try:
+            featured_products = await run_db_read(queries.fetch_featured_products)
         except Error as e:
-            print(f"Error: {e}")
-        finally:
-            if db.is_connected():
-                db.close()
+            print(f"Error fetching products: {e}")
+            # Không cache trang rỗng do lỗi DB
+            return {"featured_products": featured_products}, False
+        return {"featured_products": featured_products}, True
 
-    return templates.TemplateResponse("products.html", {
+    return await serve_cached_page(
+        request, current_user, ("home",), ("products",),
+        "index.html", "partials/home_content.html", load
+    )
+
+
+PRODUCTS_PAGE_SIZE = 24
+PRODUCTS_PAGE_SIZE_MAX = 96
+# Số thẻ sản phẩm mỗi khối khi gửi trang theo luồng
+PRODUCTS_STREAM_CHUNK = int(os.getenv("PRODUCTS_STREAM_CHUNK", "24"))
+
+
+def _fallback_facets(categories, brands, selected):
+    """Bộ lọc không có số lượng, dùng khi chỉ mục facet chưa sẵn sàng."""
+    def options(values, chosen):
+        return [{"value": v, "label": v, "count": None, "selected": v in chosen} for v in values]
+
+    return {
+        "category": options(categories, selected["category"]),
+        "brand": options(brands, selected["brand"]),
+        "price": [{"value": key, "label": label, "count": None, "selected": key in selected["price"]}
+                  for key, label, _, _ in PRICE_RANGES],
+    }
+
+
+async def _stream_product_cards(product_ids):
+    """Thẻ sản phẩm, lấy từ DB khi template lặp tới (sau khi đầu trang đã được gửi)."""
+    try:
+        rows = await run_db_read(queries.fetch_products_by_ids, product_ids)
+    except Error as e:
+        print(f"Error fetching products: {e}")
+        return
+    for row in rows:
+        yield row
+
+
+@app.get("/products", response_class=HTMLResponse)
+async def products(
+        request: Request,
+        category: Optional[List[str]] = Query(None),
+        brand: Optional[List[str]] = Query(None),
+        price: Optional[List[str]] = Query(None),
+        search: Optional[str] = None,
+        after: Optional[int] = None,
+        page_size: int = PRODUCTS_PAGE_SIZE
+):
+    current_user = get_current_user(request)
+    products_list = []
+    product_count = 0
+    next_after = None
+    page_size = max(1, min(page_size, PRODUCTS_PAGE_SIZE_MAX))
+    selected = {
+        "category": [c for c in category or [] if c],
+        "brand": [b for b in brand or [] if b],
+        "price": [p for p in price or [] if p],
+    }
+    facets = _fallback_facets([], [], selected)
+
+    try:
+        if catalog_indexes_ready():
+            # Lọc, đếm và phân trang trong bộ nhớ; DB chỉ lấy thẻ sản phẩm theo maSP
+            ranked_ids = search_index.ranked(search) if search else None
+            product_ids, next_after, facets, product_count = facet_index.query(
+                selected, after=after, limit=page_size, ranked_ids=ranked_ids
+            )
+            # Thẻ sản phẩm được lấy trong lúc gửi trang, sau khi đầu trang và form lọc đã đi
+            products_list = _stream_product_cards(product_ids)
+        else:
+            # Chỉ mục chưa nạp xong: truy vấn SQL, mỗi bộ lọc lấy lựa chọn đầu tiên
+            min_price = max_price = None
+            for key, _, low, high in PRICE_RANGES:
+                if selected["price"] and selected["price"][0] == key:
+                    min_price, max_price = low, high
+            products_list, next_after, product_count, categories, brands = await run_db_read(
+                queries.fetch_products_page,
+                selected["category"][0] if selected["category"] else None,
+                selected["brand"][0] if selected["brand"] else None,
+                search, after, page_size, min_price, max_price
+            )
+            facets = _fallback_facets(categories, brands, selected)
+    except Error as e:
+        print(f"Error: {e}")
+
+    # Link trang sau giữ nguyên bộ lọc hiện tại
+    next_url = None
+    if next_after is not None:
+        next_url = str(request.url.include_query_params(after=next_after))
+
+    # Thẻ sản phẩm chỉ được lấy khi đầu trang đã gửi: xin suất DB từ bây giờ
+    # để nếu quá tải thì trả 503 thay vì một trang bị cắt giữa chừng
+    await admit_current()
+
+    return streamed_templates.TemplateResponse("products.html", {
         "request": request,
         "current_user": current_user,
         "products": products_list,
-        "categories": categories,
-        "brands": brands,
-        "selected_category": category,
-        "selected_brand": brand,
-        "search_query": search
+        "product_count": product_count,
+        "flush_every": PRODUCTS_STREAM_CHUNK,
+        "facets": facets,
+        "search_query": search,
+        "is_first_page": after is None,
+        "first_page_url": str(request.url.remove_query_params("after")),
+        "next_page_url": next_url
     })
 
 
+# Số thẻ mỗi khối "Khách hàng cũng mua" / "Sản phẩm tương tự"
+RELATED_PRODUCTS_SHOWN = int(os.getenv("RELATED_PRODUCTS_SHOWN", "4"))
+
+
 @app.get("/product/{product_id}", response_class=HTMLResponse)
 async def product_detail(request: Request, product_id: int):
     current_user = get_current_user(request)
-    product = None
 
-    db = get_db_connection()
-    if db:
+    async def load():
+        also_bought = related_index.also_bought(product_id, RELATED_PRODUCTS_SHOWN)
+        similar = [pid for pid in related_index.similar(product_id, 2 * RELATED_PRODUCTS_SHOWN)
+                   if pid not in also_bought][:RELATED_PRODUCTS_SHOWN]
+
+        product = None
+        cards = []
+        cacheable = True
         try:
-            cursor = db.cursor(dictionary=True)
-            cursor.execute("""
-                           SELECT sp.*, dm.ten as ten_danhmuc, th.ten as ten_thuonghieu
-                           FROM sanpham sp
-                                    LEFT JOIN danhmuc dm ON sp.maDM = dm.maDM
-                                    LEFT JOIN thuonghieu th ON sp.maTH = th.maTH
-                           WHERE sp.maSP = %s
-                           """, (product_id,))
-            product = cursor.fetchone()
-            cursor.close()
+            if also_bought or similar:
+                product, cards = await asyncio.gather(
+                    run_db_read(queries.fetch_product, product_id),
+                    run_db_read(queries.fetch_products_by_ids, also_bought + similar),
+                )
+            else:
+                product = await run_db_read(queries.fetch_product, product_id)
         except Error as e:
             print(f"Error: {e}")
-        finally:
-            if db.is_connected():
-                db.close()
+            cacheable = False
 
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        by_id = {card['maSP']: card for card in cards}
+        return {
+            "product": product,
+            "also_bought": [by_id[pid] for pid in also_bought if pid in by_id],
+            "similar": [by_id[pid] for pid in similar if pid in by_id],
+        }, cacheable
 
-    return templates.TemplateResponse("product_detail.html", {
-        "request": request,
-        "current_user": current_user,
-        "product": product
-    })
+    # Các thẻ liên quan hiển thị giá/tên sản phẩm khác nên cũng theo tag "products"
+    return await serve_cached_page(
+        request, current_user, ("product", product_id), (f"product:{product_id}", "products", "related"),
+        "product_detail.html", "partials/product_detail_content.html", load
+    )
 
 
 @app.get("/login", response_class=HTMLResponse)
@@ -201,39 +536,40 @@ async def login(
         username: str = Form(...),
         password: str = Form(...)
 ):
-    db = get_db_connection()
-    if not db:
+    try:
+        user = await run_db(queries.fetch_user_by_username, username)
+    except Error as e:
+        print(f"Error: {e}")
         return templates.TemplateResponse("login.html", {
             "request": request,
-            "error": "Database connection failed"
+            "error": "Đăng nhập thất bại"
         })
 
     try:
-        cursor = db.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM nguoidung WHERE tenDangNhap = %s", (username,))
-        user = cursor.fetchone()
-        cursor.close()
-
-        if user and user['matKhau'] == password:
-            response = RedirectResponse(url="/", status_code=302)
-            response.set_cookie(key="user_id", value=str(user['maND']))
-            response.set_cookie(key="username", value=username)
-            response.set_cookie(key="role", value=user['vaiTro'])
-            return response
-        else:
-            return templates.TemplateResponse("login.html", {
-                "request": request,
-                "error": "Tên đăng nhập hoặc mật khẩu không đúng"
-            })
-    except Error as e:
-        print(f"Error: {e}")
+        ok, needs_rehash = await password_hasher.verify(user['matKhau'] if user else None, password)
+    except PasswordHasherBusy:
         return templates.TemplateResponse("login.html", {
             "request": request,
-            "error": "Đăng nhập thất bại"
+            "error": "Hệ thống đang bận, vui lòng thử lại sau ít giây"
+        }, status_code=503, headers={"Retry-After": str(PASSWORD_RETRY_AFTER)})
+
+    if ok:
+        if needs_rehash:
+            # Mật khẩu thô (hoặc băm với tham số cũ): lưu lại bằng hash mới
+            try:
+                new_hash = await password_hasher.hash(password)
+                if await run_db(queries.update_password_hash, user['maND'], user['matKhau'], new_hash):
+                    password_hasher.record_rehash()
+            except (Error, PasswordHasherBusy) as e:
+                print(f"Error rehashing password: {e}")
+        response = RedirectResponse(url="/", status_code=302)
+        sessions.start_session(response, user['maND'], user['tenDangNhap'], user['vaiTro'])
+        return response
+    else:
+        return templates.TemplateResponse("login.html", {
+            "request": request,
+            "error": "Tên đăng nhập hoặc mật khẩu không đúng"
         })
-    finally:
-        if db.is_connected():
-            db.close()
 
 
 @app.get("/register", response_class=HTMLResponse)
@@ -256,54 +592,37 @@ async def register(
             "error": "Mật khẩu xác nhận không khớp"
         })
 
-    db = get_db_connection()
-    if not db:
+    try:
+        password_hash = await password_hasher.hash(password)
+    except PasswordHasherBusy:
         return templates.TemplateResponse("register.html", {
             "request": request,
-            "error": "Database connection failed"
-        })
+            "error": "Hệ thống đang bận, vui lòng thử lại sau ít giây"
+        }, status_code=503, headers={"Retry-After": str(PASSWORD_RETRY_AFTER)})
 
     try:
-        cursor = db.cursor()
-
-        cursor.execute("SELECT maND FROM nguoidung WHERE tenDangNhap = %s", (username,))
-        if cursor.fetchone():
-            return templates.TemplateResponse("register.html", {
-                "request": request,
-                "error": "Tên đăng nhập đã tồn tại"
-            })
-
-        cursor.execute("""
-                       INSERT INTO nguoidung (tenDangNhap, matKhau, ten, soDienThoai, vaiTro)
-                       VALUES (%s, %s, %s, %s, 'USER')
-                       """, (username, password, fullname, phone))
-
-        user_id = cursor.lastrowid
-        cursor.execute("INSERT INTO khachhang (maND) VALUES (%s)", (user_id,))
-
-        db.commit()
-
-        response = RedirectResponse(url="/login", status_code=302)
-        return response
-
+        user_id = await run_db(queries.create_user, username, password_hash, fullname, phone)
     except Error as e:
-        db.rollback()
         print(f"Error: {e}")
         return templates.TemplateResponse("register.html", {
             "request": request,
             "error": "Đăng ký thất bại"
         })
-    finally:
-        if db.is_connected():
-            db.close()
+
+    if user_id is None:
+        return templates.TemplateResponse("register.html", {
+            "request": request,
+            "error": "Tên đăng nhập đã tồn tại"
+        })
+
+    response = RedirectResponse(url="/login", status_code=302)
+    return response
 
 
 @app.get("/logout")
 async def logout():
     response = RedirectResponse(url="/", status_code=302)
-    response.delete_cookie("user_id")
-    response.delete_cookie("username")
-    response.delete_cookie("role")
+    sessions.end_session(response)
     return response
 
 
@@ -315,23 +634,11 @@ async def profile_page(request: Request):
         return RedirectResponse(url="/login", status_code=302)
 
     user_details = None
-    db = get_db_connection()
-    if db:
-        try:
-            cursor = db.cursor(dictionary=True)
-
-            # 2. Lấy thông tin chi tiết của người dùng từ database
-            cursor.execute(
-                "SELECT tenDangNhap, ten, soDienThoai, vaiTro FROM nguoidung WHERE maND = %s",
-                (current_user['user_id'],)
-            )
-            user_details = cursor.fetchone()
-            cursor.close()
-        except Error as e:
-            print(f"Error fetching user profile: {e}")
-        finally:
-            if db.is_connected():
-                db.close()
+    try:
+        # 2. Lấy thông tin chi tiết của người dùng từ database
+        user_details = await load_profile(current_user['user_id'])
+    except Error as e:
+        print(f"Error fetching user profile: {e}")
 
     if not user_details:
         # Nếu không tìm thấy thông tin (dù đã đăng nhập) thì báo lỗi
@@ -353,22 +660,11 @@ async def edit_profile_page(request: Request):
         return RedirectResponse(url="/login", status_code=302)
 
     user_details = None
-    db = get_db_connection()
-    if db:
-        try:
-            cursor = db.cursor(dictionary=True)
-            # Lấy thông tin hiện tại để điền vào form
-            cursor.execute(
-                "SELECT ten, soDienThoai FROM nguoidung WHERE maND = %s",
-                (current_user['user_id'],)
-            )
-            user_details = cursor.fetchone()
-            cursor.close()
-        except Error as e:
-            print(f"Lỗi khi lấy thông tin user để sửa: {e}")
-        finally:
-            if db.is_connected():
-                db.close()
+    try:
+        # Lấy thông tin hiện tại để điền vào form
+        user_details = await load_profile(current_user['user_id'])
+    except Error as e:
+        print(f"Lỗi khi lấy thông tin user để sửa: {e}")
 
     if not user_details:
         raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
@@ -391,81 +687,54 @@ async def handle_edit_profile(
     if not current_user:
         return RedirectResponse(url="/login", status_code=302)
 
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Lỗi kết nối database")
-
     try:
-        cursor = db.cursor()
-        # Câu lệnh UPDATE để cập nhật database
-        cursor.execute(
-            "UPDATE nguoidung SET ten = %s, soDienThoai = %s WHERE maND = %s",
-            (fullname, phone, current_user['user_id'])
-        )
-        db.commit()  # Lưu thay đổi
-        cursor.close()
+        await run_db(queries.update_user_contact, current_user['user_id'], fullname, phone)
+        profile_cache.invalidate(current_user['user_id'])
     except Error as e:
+        # Giao dịch dở dang đã được pool rollback
         print(f"Lỗi khi cập nhật profile: {e}")
-        db.rollback()  # Hoàn tác nếu có lỗi
-    finally:
-        if db.is_connected():
-            db.close()
 
     # Sau khi cập nhật xong, chuyển hướng người dùng về trang profile
     return RedirectResponse(url="/profile", status_code=302)
 
 
-@app.get("/cart", response_class=HTMLResponse)
-async def cart_page(request: Request):
-    current_user = get_current_user(request)
-    if not current_user:
-        return RedirectResponse(url="/login")
+CHECKOUT_ERRORS = {
+    "out_of_stock": "Sản phẩm trong giỏ không còn đủ hàng, vui lòng giảm số lượng",
+    "busy": "Hệ thống đang bận, vui lòng thử lại sau ít giây",
+    "expired": "Đã hết thời gian giữ hàng, vui lòng thanh toán lại",
+    "failed": "Không thể thanh toán lúc này, vui lòng thử lại",
+}
 
+
+async def _render_cart(request, current_user, error=None, ordered=False, status_code=200, headers=None):
     cart_items = []
     total = 0
 
-    db = get_db_connection()
-    if db:
-        try:
-            cursor = db.cursor(dictionary=True)
-
-            cursor.execute("""
-                           SELECT gh.maGH
-                           FROM giohang gh
-                                    JOIN khachhang kh ON gh.maKH = kh.maKH
-                                    JOIN nguoidung nd ON kh.maND = nd.maND
-                           WHERE nd.maND = %s
-                             AND gh.trangThai = 'Đang mua'
-                           """, (current_user['user_id'],))
-            cart = cursor.fetchone()
-
-            if cart:
-                cursor.execute("""
-                               SELECT ctgh.*, sp.ten, sp.gia, sp.hinhAnh, sp.soLuong as stock
-                               FROM chitietgiohang ctgh
-                                        JOIN sanpham sp ON ctgh.maSP = sp.maSP
-                               WHERE ctgh.maGH = %s
-                               """, (cart['maGH'],))
-                cart_items = cursor.fetchall()
-
-                for item in cart_items:
-                    item['subtotal'] = item['soLuong'] * item['gia']
-                    total += item['subtotal']
-
-            cursor.close()
+    try:
+        cart_items = await run_db_read(cart.fetch_cart_items, current_user['user_id'])
+    except Error as e:
+        print(f"Error fetching cart: {e}")
 
-        except Error as e:
-            print(f"Error fetching cart: {e}")
-        finally:
-            if db.is_connected():
-                db.close()
+    for item in cart_items:
+        item['subtotal'] = item['soLuong'] * item['gia']
+        total += item['subtotal']
 
     return templates.TemplateResponse("cart.html", {
         "request": request,
         "current_user": current_user,
         "cart_items": cart_items,
-        "total": total
-    })
+        "total": total,
+        "error": CHECKOUT_ERRORS.get(error),
+        "ordered": ordered
+    }, status_code=status_code, headers=headers)
+
+
+@app.get("/cart", response_class=HTMLResponse)
+async def cart_page(request: Request, error: Optional[str] = None, ordered: bool = False):
+    current_user = get_current_user(request)
+    if not current_user:
+        return RedirectResponse(url="/login")
+    return await _render_cart(request, current_user, error, ordered)
 
 
 @app.post("/cart/add/{product_id}")
@@ -478,48 +747,12 @@ async def add_to_cart(
     if not current_user:
         return RedirectResponse(url="/login")
 
-    db = get_db_connection()
-    if db:
-        try:
-            cursor = db.cursor()
-
-            cursor.execute("SELECT maKH FROM khachhang WHERE maND = %s", (current_user['user_id'],))
-            customer = cursor.fetchone()
-            if not customer:
-                cursor.close()
-                raise HTTPException(status_code=404, detail="Customer not found")
-
-            customer_id = customer[0]
-
-            cursor.execute("SELECT maGH FROM giohang WHERE maKH = %s AND trangThai = 'Đang mua'", (customer_id,))
-            cart = cursor.fetchone()
-
-            if not cart:
-                cursor.execute("INSERT INTO giohang (maKH) VALUES (%s)", (customer_id,))
-                cart_id = cursor.lastrowid
-            else:
-                cart_id = cart[0]
-
-            cursor.execute("SELECT maCTGH, soLuong FROM chitietgiohang WHERE maGH = %s AND maSP = %s",
-                           (cart_id, product_id))
-            existing_item = cursor.fetchone()
-
-            if existing_item:
-                new_quantity = existing_item[1] + quantity
-                cursor.execute("UPDATE chitietgiohang SET soLuong = %s WHERE maCTGH = %s",
-                               (new_quantity, existing_item[0]))
-            else:
-                cursor.execute("INSERT INTO chitietgiohang (maGH, maSP, soLuong) VALUES (%s, %s, %s)",
-                               (cart_id, product_id, quantity))
-
-            db.commit()
-            cursor.close()
-
-        except Error as e:
-            print(f"Error adding to cart: {e}")
-        finally:
-            if db.is_connected():
-                db.close()
+    try:
+        await run_db(cart.add_cart_item, current_user['user_id'], product_id, quantity)
+    except cart.CartNotFound:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    except Error as e:
+        print(f"Error adding to cart: {e}")
 
     return RedirectResponse(url="/cart", status_code=302)
 
@@ -534,48 +767,14 @@ async def update_cart_item(
     if not current_user:
         return RedirectResponse(url="/login", status_code=302)
 
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
     try:
-        cursor = db.cursor(dictionary=True)
-
-        # Lấy số lượng hiện tại của item và số lượng tồn kho (stock)
-        cursor.execute("""
-                       SELECT ctgh.soLuong, sp.soLuong as stock
-                       FROM chitietgiohang ctgh
-                                JOIN sanpham sp ON ctgh.maSP = sp.maSP
-                       WHERE ctgh.maCTGH = %s
-                       """, (cart_item_id,))
-        item = cursor.fetchone()
-
-        if not item:
-            raise HTTPException(status_code=404, detail="Item not found")
-
-        new_quantity = item['soLuong']
-
-        # Logic tăng/giảm
-        if action == "increase" and item['soLuong'] < item['stock']:
-            new_quantity += 1
-        elif action == "decrease" and item['soLuong'] > 1:
-            new_quantity -= 1
-
-        # Cập nhật số lượng mới vào database
-        cursor.execute(
-            "UPDATE chitietgiohang SET soLuong = %s WHERE maCTGH = %s",
-            (new_quantity, cart_item_id)
-        )
-
-        db.commit()
-        cursor.close()
-
+        updated = await run_db(cart.change_cart_item_quantity, current_user['user_id'], cart_item_id, action)
     except Error as e:
         print(f"Error updating cart: {e}")
-        db.rollback()
-    finally:
-        if db.is_connected():
-            db.close()
+    else:
+        if not updated:
+            raise HTTPException(status_code=404, detail="Item not found")
+        sales_aggregates.cart_changed()
 
     # Tải lại trang giỏ hàng
     return RedirectResponse(url="/cart", status_code=302)
@@ -590,47 +789,377 @@ async def remove_from_cart(
     if not current_user:
         return RedirectResponse(url="/login", status_code=302)
 
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    try:
+        removed = await run_db(cart.delete_cart_item, current_user['user_id'], cart_item_id)
+    except Error as e:
+        print(f"Error removing from cart: {e}")
+    else:
+        if removed:
+            sales_aggregates.cart_changed()
+
+    # Tải lại trang giỏ hàng
+    return RedirectResponse(url="/cart", status_code=302)
+
+
+def _record_stock_changes(stock):
+    """Tồn kho mới sau khi giữ/trả hàng: tin cho lần từ chối sớm."""
+    checkout.stock_hints.update(stock)
+
+
+@app.post("/checkout")
+async def start_checkout(request: Request):
+    current_user = get_current_user(request)
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=302)
+    user_id = current_user['user_id']
 
     try:
-        cursor = db.cursor()
+        pending, lines = await run_db(checkout.prepare_checkout, user_id)
+    except Error as e:
+        print(f"Error preparing checkout: {e}")
+        return RedirectResponse(url="/cart?error=failed", status_code=302)
+    if pending is not None:
+        # Đang có giỏ chờ thanh toán: xác nhận hoặc hủy giỏ đó trước
+        return RedirectResponse(url="/checkout", status_code=302)
+    if not lines:
+        return RedirectResponse(url="/cart", status_code=302)
+    if checkout.stock_hints.short(lines) is not None:
+        return RedirectResponse(url="/cart?error=out_of_stock", status_code=302)
 
-        # Xóa thẳng item khỏi chi tiết giỏ hàng
-        cursor.execute("DELETE FROM chitietgiohang WHERE maCTGH = %s", (cart_item_id,))
+    try:
+        async with checkout.sku_queue.hold(product_id for product_id, _ in lines):
+            reservation = await run_db(checkout.reserve_cart, user_id)
+    except checkout.CheckoutBusy:
+        return await _render_cart(request, current_user, "busy", status_code=503,
+                                  headers={"Retry-After": str(checkout.CHECKOUT_RETRY_AFTER)})
+    except checkout.OutOfStock as e:
+        checkout.stock_hints.update({e.product_id: e.available})
+        return RedirectResponse(url="/cart?error=out_of_stock", status_code=302)
+    except Error as e:
+        print(f"Error reserving stock: {e}")
+        return RedirectResponse(url="/cart?error=failed", status_code=302)
 
-        db.commit()
-        cursor.close()
+    if reservation is None:
+        return RedirectResponse(url="/cart", status_code=302)
+    _record_stock_changes(reservation['stock'])
+    return RedirectResponse(url="/checkout", status_code=302)
 
+
+@app.get("/checkout", response_class=HTMLResponse)
+async def checkout_page(request: Request):
+    current_user = get_current_user(request)
+    if not current_user:
+        return RedirectResponse(url="/login")
+
+    try:
+        pending = await run_db(checkout.fetch_checkout, current_user['user_id'])
     except Error as e:
-        print(f"Error removing from cart: {e}")
-        db.rollback()
-    finally:
-        if db.is_connected():
-            db.close()
+        print(f"Error fetching checkout: {e}")
+        pending = None
+    if pending is None:
+        return RedirectResponse(url="/cart", status_code=302)
 
-    # Tải lại trang giỏ hàng
+    total = 0
+    for item in pending['items']:
+        item['subtotal'] = item['soLuong'] * item['gia']
+        total += item['subtotal']
+
+    return templates.TemplateResponse("checkout.html", {
+        "request": request,
+        "current_user": current_user,
+        "checkout": pending,
+        "total": total
+    })
+
+
+@app.post("/checkout/confirm")
+async def confirm_checkout(request: Request):
+    current_user = get_current_user(request)
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=302)
+
+    try:
+        lines = await run_db(checkout.confirm_order, current_user['user_id'])
+    except Error as e:
+        print(f"Error confirming order: {e}")
+        return RedirectResponse(url="/checkout", status_code=302)
+    if lines is None:
+        return RedirectResponse(url="/cart?error=expired", status_code=302)
+
+    for line in lines:
+        # Trang chi tiết hiển thị số đã bán
+        page_cache.invalidate_tags(f"product:{line['maSP']}")
+    return RedirectResponse(url="/cart?ordered=1", status_code=302)
+
+
+@app.post("/checkout/cancel")
+async def cancel_checkout(request: Request):
+    current_user = get_current_user(request)
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=302)
+
+    try:
+        stock = await run_db(checkout.release_checkout, current_user['user_id'])
+    except Error as e:
+        print(f"Error releasing checkout: {e}")
+    else:
+        _record_stock_changes(stock)
+        sales_aggregates.cart_changed()
     return RedirectResponse(url="/cart", status_code=302)
 
 
-def find_available_port(start_port=8000, max_port=8010):
-    for port in range(start_port, max_port + 1):
+@app.get("/img/{product_id}/{width}")
+async def product_image(request: Request, product_id: int, width: int):
+    """Ảnh sản phẩm thu nhỏ (WebP/JPEG), tạo lần đầu rồi lấy từ cache trên đĩa."""
+    if width not in images.IMAGE_WIDTHS:
+        raise HTTPException(status_code=404, detail="Unsupported image width")
+
+    found, hinh_anh = images.thumbnails.cached_source(product_id)
+    if not found:
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.bind(('127.0.0.1', port))
-                return port
-        except OSError:
-            continue
-    return start_port
+            hinh_anh = await run_db_read(queries.fetch_product_image, product_id)
+        except Error as e:
+            print(f"Error fetching product image: {e}")
+            raise HTTPException(status_code=503, detail="Image temporarily unavailable")
+        images.thumbnails.remember_source(product_id, hinh_anh)
+
+    fmt = images.negotiate_format(request.headers.get("accept"))
+    location = await run_blocking(images.thumbnails.locate, hinh_anh, width, fmt)
+    if location is None:
+        return images.placeholder_response(width)
+    if location[0] == "url":
+        return RedirectResponse(url=location[1], status_code=302)
+
+    _, source_path, target_path, key, quality = location
+    etag = f'"{key[:32]}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept",
+                                                  "Cache-Control": f"public, max-age={images.IMAGE_MAX_AGE}"})
+    try:
+        await images.thumbnails.ensure(source_path, target_path, width, fmt, quality)
+    except Exception as e:
+        # Ảnh hỏng hoặc không đọc được: gửi ảnh gốc để trang vẫn hiển thị
+        print(f"Error creating thumbnail for product {product_id}: {e}")
+        return FileResponse(source_path, headers={"Cache-Control": "no-cache"})
+    return images.ThumbnailResponse(target_path, fmt, etag)
+
+
+@app.get("/api/products/export.{fmt}")
+async def export_products(fmt: str, since: Optional[int] = None):
+    """Xuất toàn bộ sản phẩm (NDJSON hoặc CSV) theo luồng; `since` là maSP đã nhận lần trước."""
+    if fmt not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=404, detail="Unsupported export format")
+
+    await admit_current()
+    return StreamingResponse(
+        export.stream_products(fmt, since),
+        media_type=export.EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="products.{fmt}"'}
+    )
+
+
+# ===== QUẢN TRỊ =====
+
+def get_admin_user(request: Request):
+    current_user = get_current_user(request)
+    if current_user and current_user['role'] == 'ADMIN':
+        return current_user
+    return None
+
+
+def _sales_dashboard(db):
+    return sales_aggregates.snapshot(db, reference_data.categories(db), reference_data.brands(db))
+
+
+@app.get("/admin", response_class=HTMLResponse)
+async def admin_dashboard(request: Request):
+    current_user = get_admin_user(request)
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=302)
+
+    sales = None
+    try:
+        sales = await run_db_read(_sales_dashboard)
+    except Error as e:
+        print(f"Error loading sales dashboard: {e}")
+
+    return templates.TemplateResponse("admin/dashboard.html", {
+        "request": request,
+        "current_user": current_user,
+        "sales": sales,
+    })
+
+
+@app.get("/admin/products", response_class=HTMLResponse)
+async def admin_products(request: Request):
+    current_user = get_admin_user(request)
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=302)
+
+    return templates.TemplateResponse("admin/products.html", {
+        "request": request,
+        "current_user": current_user,
+        "jobs": importer.import_jobs.recent(),
+        "batch_rows": importer.IMPORT_BATCH_ROWS,
+        "commit_rows": importer.IMPORT_COMMIT_ROWS,
+    })
+
+
+def _spool_upload(upload, suffix):
+    """Chép file upload ra file tạm của riêng job (FastAPI đóng file upload khi request kết thúc)."""
+    with tempfile.NamedTemporaryFile(prefix="import-", suffix=suffix, delete=False) as spooled:
+        shutil.copyfileobj(upload.file, spooled, 1024 * 1024)
+        return spooled.name
+
+
+async def _run_import_job(job, path):
+    # Task chép context của request đã tạo nó: job chạy ngoài admission control
+    current_ticket.set(None)
+    try:
+        with open(path, "rb") as stream:
+            await run_db(importer.run_import, job, stream)
+    except Error as e:
+        print(f"Error importing products: {e}")
+    finally:
+        os.unlink(path)
+
+
+@app.post("/admin/products/import", status_code=202)
+async def admin_import_products(request: Request, file: UploadFile = File(...)):
+    """Nhận file CSV/JSON/NDJSON và nhập ở nền; theo dõi qua GET /admin/products/import/{id}."""
+    if not get_admin_user(request):
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    fmt = importer.detect_format(file.filename)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Expected a .csv, .json or .ndjson file")
+
+    path = await run_blocking(_spool_upload, file, "." + fmt)
+    job = importer.import_jobs.create(file.filename, fmt)
+    job.task = asyncio.create_task(_run_import_job(job, path))
+    return job.to_dict()
+
+
+@app.get("/admin/products/import/{job_id}")
+async def admin_import_status(request: Request, job_id: str):
+    if not get_admin_user(request):
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    status = importer.import_jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return status
+
+
+ADMIN_ORDERS_PAGE_SIZE = 50
+
+
+@app.get("/admin/orders", response_class=HTMLResponse)
+async def admin_orders(
+        request: Request,
+        status: Optional[List[str]] = Query(None),
+        date_from: Optional[datetime.date] = None,
+        date_to: Optional[datetime.date] = None,
+        after: Optional[int] = None
+):
+    current_user = get_admin_user(request)
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=302)
+
+    statuses = [s for s in status or [] if s]
+    orders_list = []
+    next_after = None
+    known_statuses = []
+    try:
+        orders_list, next_after = await run_db(
+            orders.fetch_orders, statuses, date_from, date_to, after, ADMIN_ORDERS_PAGE_SIZE
+        )
+        known_statuses = await run_db_read(sales_aggregates.order_statuses)
+    except Error as e:
+        print(f"Error fetching orders: {e}")
+
+    next_url = None
+    if next_after is not None:
+        next_url = str(request.url.include_query_params(after=next_after))
+    filters = request.url.remove_query_params("after").query
+
+    return templates.TemplateResponse("admin/orders.html", {
+        "request": request,
+        "current_user": current_user,
+        "orders": orders_list,
+        # Trạng thái có trong số liệu bán hàng (không cần quét bảng giohang)
+        "statuses": sorted(set(known_statuses) | set(statuses)),
+        "selected_statuses": statuses,
+        "date_from": date_from,
+        "date_to": date_to,
+        "is_first_page": after is None,
+        "first_page_url": str(request.url.remove_query_params("after")),
+        "next_page_url": next_url,
+        "export_url": "/admin/orders/export.csv" + ("?" + filters if filters else ""),
+    })
+
+
+@app.get("/admin/orders/export.csv")
+async def admin_export_orders(
+        request: Request,
+        status: Optional[List[str]] = Query(None),
+        date_from: Optional[datetime.date] = None,
+        date_to: Optional[datetime.date] = None
+):
+    """Xuất các đơn khớp bộ lọc ra CSV theo luồng (một dòng cho mỗi sản phẩm trong đơn)."""
+    if not get_admin_user(request):
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    statuses = [s for s in status or [] if s]
+    await admit_current()
+    return StreamingResponse(
+        orders.stream_orders_csv(statuses, date_from, date_to),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="orders.csv"'}
+    )
+
+
+class CartOperation(BaseModel):
+    op: Literal["add", "update", "remove"]
+    product_id: Optional[int] = None
+    item_id: Optional[int] = None
+    quantity: int = 1
+
+
+class CartBatch(BaseModel):
+    operations: List[CartOperation]
+
+
+@app.post("/api/cart/batch")
+async def cart_batch(request: Request, batch: CartBatch):
+    """Áp dụng nhiều thao tác thêm/sửa/xóa giỏ hàng trong một giao dịch."""
+    current_user = get_current_user(request)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+
+    operations = []
+    for operation in batch.operations:
+        if operation.op == "add" and operation.product_id is None:
+            raise HTTPException(status_code=400, detail="'add' requires product_id")
+        if operation.op in ("update", "remove") and operation.item_id is None:
+            raise HTTPException(status_code=400, detail=f"'{operation.op}' requires item_id")
+        operations.append(operation.dict())
+
+    try:
+        result = await run_db(cart.apply_cart_operations, current_user['user_id'], operations)
+    except cart.CartNotFound:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    except Error as e:
+        print(f"Error applying cart batch: {e}")
+        raise HTTPException(status_code=500, detail="Cart update failed")
+
+    if result is False:
+        raise HTTPException(status_code=409, detail="Cart is no longer open")
+    sales_aggregates.cart_changed()
+    return result
 
 
 if __name__ == "__main__":
-    port = find_available_port()
-    print(f"   Starting Clothing Shop on http://localhost:{port}")
-    print(f"   Available routes:")
-    print(f"   http://localhost:{port} - Trang chủ")
-    print(f"   http://localhost:{port}/products - Sản phẩm")
-    print(f"   http://localhost:{port}/login - Đăng nhập")
-    print(f"   http://localhost:{port}/register - Đăng ký")
-    uvicorn.run(app, host="127.0.0.1", port=port, reload=True)
\ No newline at end of file
+    # Chạy qua launcher (serve.py): python main.py --workers 4 --port 8000
+    from serve import main as serve_main
+    serve_main()
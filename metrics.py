@@ -0,0 +1,229 @@
+"""
+Số đo theo định dạng văn bản của Prometheus, chỉ dùng thư viện chuẩn.
+
+- `MetricsMiddleware` (ASGI): số request theo route/method/status và
+  histogram thời gian xử lý theo route (route là mẫu đường dẫn, vd.
+  "/product/{product_id}", để số nhãn không tăng theo dữ liệu).
+- `db_query_seconds` / `db_pool_acquire_seconds`: được ghi trong `db.run_db`
+  cho mỗi hàm truy cập dữ liệu.
+- `template_render_seconds`: `InstrumentedTemplates` đo mỗi lần render.
+
+Mỗi lần ghi chỉ là một tra dict, một `bisect` và vài phép cộng dưới khóa,
+nên có thể bật thường xuyên trên production. GET /metrics gọi `render()`.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi.templating import Jinja2Templates
+
+# Mốc (giây) mặc định cho thời gian request / truy vấn
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [số đếm theo mốc..., tổng, số lần]
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{label_text} {series[-1]}")
+        return lines
+
+
+class GaugeCallback:
+    """Gauge đọc giá trị lúc scrape: `callback()` trả về {nhãn tuple: giá trị}."""
+
+    def __init__(self, name, help_text, labelnames, callback):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.callback().items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "Số request HTTP đã xử lý.", ("method", "route", "status")))
+http_request_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request HTTP.", ("method", "route")))
+http_requests_in_progress = 0
+db_query_seconds = registry.register(Histogram(
+    "db_query_duration_seconds", "Thời gian chạy một hàm truy cập dữ liệu (đã có kết nối).", ("query",)))
+db_query_errors_total = registry.register(Counter(
+    "db_query_errors_total", "Số lần hàm truy cập dữ liệu ném lỗi.", ("query",)))
+db_pool_acquire_seconds = registry.register(Histogram(
+    "db_pool_acquire_seconds", "Thời gian chờ mượn kết nối (gồm cả mở kết nối mới).", ()))
+template_render_seconds = registry.register(Histogram(
+    "template_render_duration_seconds", "Thời gian render template Jinja.", ("template",)))
+registry.register(GaugeCallback(
+    "http_requests_in_progress", "Số request đang được xử lý.", (),
+    lambda: {(): http_requests_in_progress}))
+
+
+def render():
+    return registry.render()
+
+
+# ===== HTTP =====
+
+class MetricsMiddleware:
+    """Middleware ASGI thuần (không qua BaseHTTPMiddleware, để response stream không bị đệm)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = {}  # endpoint -> mẫu đường dẫn
+
+    def _route(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            path = "unmatched"
+            for route in scope["app"].routes:
+                # Route thường giữ `endpoint`, Mount (vd. /static) giữ `app`
+                if getattr(route, "endpoint", None) is endpoint or getattr(route, "app", None) is endpoint:
+                    path = route.path
+                    break
+            self._route_paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global http_requests_in_progress
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_progress += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_progress -= 1
+            route = self._route(scope)
+            method = scope["method"]
+            http_request_seconds.observe(time.perf_counter() - start, method, route)
+            http_requests_total.inc(method, route, str(status))
+
+
+# ===== TEMPLATE =====
+
+class InstrumentedTemplates(Jinja2Templates):
+    """Jinja2Templates đo thời gian render của mỗi TemplateResponse."""
+
+    def TemplateResponse(self, name, *args, **kwargs):
+        with template_render_seconds.time(name):
+            return super().TemplateResponse(name, *args, **kwargs)
@@ -0,0 +1,7 @@
+-- Index phục vụ phân trang keyset trên /products.
+-- Mỗi bộ lọc đi theo (cột lọc, maSP) nên trang tiếp theo chỉ cần đọc
+-- `page_size + 1` dòng trong index, không phụ thuộc số lượng sản phẩm.
+
+ALTER TABLE sanpham
+    ADD INDEX idx_sanpham_dm_masp (maDM, maSP),
+    ADD INDEX idx_sanpham_th_masp (maTH, maSP);
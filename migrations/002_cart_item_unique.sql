@@ -0,0 +1,24 @@
+-- Mỗi sản phẩm chỉ có một dòng trong một giỏ, để cart.py thêm hàng bằng
+-- INSERT ... ON DUPLICATE KEY UPDATE trong một câu lệnh.
+
+-- Gộp các dòng trùng (maGH, maSP) đã có trước khi thêm ràng buộc
+UPDATE chitietgiohang keep
+    JOIN (SELECT maGH, maSP, MIN(maCTGH) AS maCTGH, SUM(soLuong) AS tong
+          FROM chitietgiohang
+          GROUP BY maGH, maSP
+          HAVING COUNT(*) > 1) dup ON keep.maCTGH = dup.maCTGH
+SET keep.soLuong = dup.tong;
+
+DELETE extra
+FROM chitietgiohang extra
+         JOIN chitietgiohang keep
+              ON keep.maGH = extra.maGH
+                  AND keep.maSP = extra.maSP
+                  AND keep.maCTGH < extra.maCTGH;
+
+ALTER TABLE chitietgiohang
+    ADD UNIQUE KEY uq_chitietgiohang_gh_sp (maGH, maSP);
+
+-- Tra giỏ đang mua của một khách hàng
+ALTER TABLE giohang
+    ADD INDEX idx_giohang_kh_trangthai (maKH, trangThai);
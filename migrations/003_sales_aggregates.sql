@@ -0,0 +1,85 @@
+-- Số liệu bán hàng cho dashboard /admin (aggregates.py).
+
+-- Đối soát: lọc giỏ theo trạng thái và tìm sản phẩm sắp hết hàng mà không
+-- quét cả bảng.
+ALTER TABLE giohang
+    ADD INDEX idx_giohang_trangthai (trangThai);
+
+ALTER TABLE sanpham
+    ADD INDEX idx_sanpham_soluong (soLuong);
+
+-- Giá bán của từng dòng, ghi lúc chốt đơn: doanh thu không đổi theo giá
+-- sanpham sau này. Đơn cũ lấy giá hiện tại (không còn giá lúc đặt).
+ALTER TABLE chitietgiohang
+    ADD COLUMN donGia DECIMAL(12, 0) NULL;
+
+UPDATE chitietgiohang ctgh
+    JOIN giohang gh ON gh.maGH = ctgh.maGH
+    JOIN sanpham sp ON sp.maSP = ctgh.maSP
+SET ctgh.donGia = sp.gia
+WHERE gh.trangThai NOT IN ('Đang mua', 'Chờ thanh toán');
+
+-- Bộ đếm cộng dồn trong chính giao dịch ghi, dùng chung cho mọi worker.
+-- nhom: 'sanpham' / 'danhmuc' / 'thuonghieu'; ma: maSP / maDM / maTH
+-- (0 cho sản phẩm chưa có danh mục/thương hiệu).
+CREATE TABLE thongke_banhang
+(
+    nhom     VARCHAR(20)    NOT NULL,
+    ma       INT            NOT NULL,
+    soLuong  INT            NOT NULL DEFAULT 0,
+    doanhThu DECIMAL(15, 0) NOT NULL DEFAULT 0,
+    PRIMARY KEY (nhom, ma),
+    INDEX idx_thongke_banhang_nhom_soluong (nhom, soLuong)
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE thongke_donhang
+(
+    trangThai VARCHAR(50) NOT NULL PRIMARY KEY,
+    soDon     INT         NOT NULL DEFAULT 0
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+-- Số lượng đang nằm trong các giỏ chưa thành đơn
+CREATE TABLE thongke_giohang
+(
+    maSP    INT NOT NULL PRIMARY KEY,
+    soLuong INT NOT NULL DEFAULT 0,
+    INDEX idx_thongke_giohang_soluong (soLuong)
+) ENGINE = InnoDB
+  DEFAULT CHARSET = utf8mb4;
+
+-- Nạp lần đầu từ lịch sử; sau đó aggregates.reconcile() chỉ sửa phần lệch
+INSERT INTO thongke_donhang (trangThai, soDon)
+SELECT trangThai, COUNT(*)
+FROM giohang
+WHERE trangThai NOT IN ('Đang mua', 'Chờ thanh toán')
+GROUP BY trangThai;
+
+INSERT INTO thongke_banhang (nhom, ma, soLuong, doanhThu)
+SELECT 'sanpham', ctgh.maSP, SUM(ctgh.soLuong), COALESCE(SUM(ctgh.soLuong * ctgh.donGia), 0)
+FROM giohang gh
+         JOIN chitietgiohang ctgh ON ctgh.maGH = gh.maGH
+WHERE gh.trangThai NOT IN ('Đang mua', 'Chờ thanh toán')
+GROUP BY ctgh.maSP;
+
+INSERT INTO thongke_banhang (nhom, ma, soLuong, doanhThu)
+SELECT 'danhmuc', COALESCE(sp.maDM, 0), SUM(tk.soLuong), SUM(tk.doanhThu)
+FROM thongke_banhang tk
+         LEFT JOIN sanpham sp ON sp.maSP = tk.ma
+WHERE tk.nhom = 'sanpham'
+GROUP BY COALESCE(sp.maDM, 0);
+
+INSERT INTO thongke_banhang (nhom, ma, soLuong, doanhThu)
+SELECT 'thuonghieu', COALESCE(sp.maTH, 0), SUM(tk.soLuong), SUM(tk.doanhThu)
+FROM thongke_banhang tk
+         LEFT JOIN sanpham sp ON sp.maSP = tk.ma
+WHERE tk.nhom = 'sanpham'
+GROUP BY COALESCE(sp.maTH, 0);
+
+INSERT INTO thongke_giohang (maSP, soLuong)
+SELECT ctgh.maSP, SUM(ctgh.soLuong)
+FROM giohang gh
+         JOIN chitietgiohang ctgh ON ctgh.maGH = gh.maGH
+WHERE gh.trangThai IN ('Đang mua', 'Chờ thanh toán')
+GROUP BY ctgh.maSP;
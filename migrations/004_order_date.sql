@@ -0,0 +1,9 @@
+-- Ngày đặt hàng: thời điểm giỏ rời trạng thái 'Đang mua' (đặt khi thanh toán).
+-- Các đơn cũ để NULL vì không biết ngày đặt thật.
+ALTER TABLE giohang
+    ADD COLUMN ngayDat DATETIME NULL;
+
+-- Danh sách đơn trong /admin/orders: lọc theo trạng thái / ngày rồi xếp theo maGH
+ALTER TABLE giohang
+    ADD INDEX idx_giohang_trangthai_gh (trangThai, maGH),
+    ADD INDEX idx_giohang_ngaydat (ngayDat);
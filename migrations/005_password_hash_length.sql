@@ -0,0 +1,4 @@
+-- matKhau lưu hash scrypt (passwords.py, ~100 ký tự) thay cho mật khẩu thô.
+-- Mật khẩu thô cũ vẫn giữ nguyên và được băm lại khi người dùng đăng nhập.
+ALTER TABLE nguoidung
+    MODIFY COLUMN matKhau VARCHAR(255) NOT NULL;
@@ -0,0 +1,6 @@
+-- Giữ hàng khi thanh toán (checkout.py): giỏ chuyển sang 'Chờ thanh toán' và
+-- tồn kho đã được trừ tới thời điểm hetHanGiu. Quá hạn mà chưa xác nhận thì
+-- tiến trình dọn trả hàng về kho; chỉ mục giúp tìm giỏ quá hạn không quét bảng.
+ALTER TABLE giohang
+    ADD COLUMN hetHanGiu DATETIME NULL,
+    ADD INDEX idx_giohang_trangthai_hethan (trangThai, hetHanGiu);
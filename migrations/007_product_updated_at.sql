@@ -0,0 +1,6 @@
+-- Thời điểm sửa gần nhất của sản phẩm: vòng đồng bộ chỉ mục tìm kiếm/facet
+-- (catalog.py) chỉ đọc lại các dòng đã đổi thay vì chỉ thấy sản phẩm mới.
+-- MySQL tự cập nhật cột khi dòng thay đổi, kể cả khi sửa ngoài ứng dụng.
+ALTER TABLE sanpham
+    ADD COLUMN ngayCapNhat TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
+    ADD INDEX idx_sanpham_ngaycapnhat (ngayCapNhat);
@@ -0,0 +1,163 @@
+"""
+Danh sách đơn hàng cho trang quản trị và xuất CSV theo luồng.
+
+Đơn hàng là các dòng giohang đã rời trạng thái 'Đang mua' (không tính giỏ
+đang giữ hàng chờ thanh toán); ngày đặt nằm ở
+cột giohang.ngayDat (migrations/004). Danh sách phân trang theo maGH giảm
+dần (keyset, `?after=` là maGH cuối trang trước) nên trang sâu không chậm hơn
+trang đầu.
+
+Khi xuất CSV, các dòng được đọc bằng cursor không đệm theo từng khối
+`ORDER_EXPORT_CHUNK_ROWS` dòng. Mỗi khối là một giao dịch đọc ngắn riêng
+(keyset theo maGH, maCTGH), nên xuất cả lịch sử không giữ snapshot hay khóa
+nào trên bảng giỏ hàng trong suốt thời gian tải.
+"""
+import csv
+import datetime
+import io
+import os
+
+from mysql.connector import Error
+
+from cart import NOT_ORDER_STATUSES
+from db import pool
+from export import encode_csv
+
+ORDER_EXPORT_CHUNK_ROWS = int(os.getenv("ORDER_EXPORT_CHUNK_ROWS", "5000"))
+
+ORDER_EXPORT_COLUMNS = ["maGH", "trangThai", "ngayDat", "khachHang", "soDienThoai",
+                        "maSP", "tenSP", "soLuong", "gia", "thanhTien"]
+
+
+def _order_filters(statuses=None, date_from=None, date_to=None):
+    """Điều kiện WHERE chung cho danh sách và file xuất."""
+    conditions = ["gh.trangThai NOT IN (%s, %s)"]
+    params = list(NOT_ORDER_STATUSES)
+    if statuses:
+        conditions.append("gh.trangThai IN (" + ", ".join(["%s"] * len(statuses)) + ")")
+        params.extend(statuses)
+    if date_from is not None:
+        conditions.append("gh.ngayDat >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        # date_to tính trọn ngày
+        conditions.append("gh.ngayDat < %s")
+        params.append(date_to + datetime.timedelta(days=1))
+    return conditions, params
+
+
+def fetch_orders(db, statuses=None, date_from=None, date_to=None, after=None, limit=50):
+    """Một trang đơn hàng (maGH giảm dần) kèm tổng tiền. Trả về (rows, next_after)."""
+    conditions, params = _order_filters(statuses, date_from, date_to)
+    if after is not None:
+        conditions.append("gh.maGH < %s")
+        params.append(after)
+    params.append(limit + 1)
+
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(f"""
+                   SELECT gh.maGH, gh.trangThai, gh.ngayDat, nd.ten AS khachHang, nd.soDienThoai
+                   FROM giohang gh
+                            LEFT JOIN khachhang kh ON kh.maKH = gh.maKH
+                            LEFT JOIN nguoidung nd ON nd.maND = kh.maND
+                   WHERE {" AND ".join(conditions)}
+                   ORDER BY gh.maGH DESC
+                   LIMIT %s
+                   """, params)
+    rows = cursor.fetchall()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1]['maGH']
+
+    if rows:
+        # Tổng tiền chỉ tính cho các đơn của trang này
+        order_ids = [row['maGH'] for row in rows]
+        cursor.execute(f"""
+                       SELECT ctgh.maGH, COUNT(*) AS soDong, SUM(ctgh.soLuong) AS soLuong,
+                              SUM(ctgh.soLuong * ctgh.donGia) AS tongTien
+                       FROM chitietgiohang ctgh
+                       WHERE ctgh.maGH IN ({", ".join(["%s"] * len(order_ids))})
+                       GROUP BY ctgh.maGH
+                       """, order_ids)
+        totals = {row['maGH']: row for row in cursor.fetchall()}
+        for row in rows:
+            total = totals.get(row['maGH'], {})
+            row['soDong'] = total.get('soDong', 0)
+            row['soLuong'] = total.get('soLuong') or 0
+            row['tongTien'] = total.get('tongTien') or 0
+    cursor.close()
+    return rows, next_after
+
+
+def _export_query(conditions, params, after, chunk_rows):
+    """
+    Câu truy vấn một khối dòng sau vị trí `after` = (maGH, maSP). Thứ tự và
+    điều kiện keyset khớp khóa duy nhất (maGH, maSP) của chitietgiohang
+    (migrations/002), nên mỗi khối đọc tiếp trong index thay vì sắp xếp lại
+    phần còn lại của bảng.
+    """
+    conditions = list(conditions)
+    params = list(params)
+    if after is not None:
+        conditions.append("(ctgh.maGH > %s OR (ctgh.maGH = %s AND ctgh.maSP > %s))")
+        params.extend((after[0], after[0], after[1]))
+    params.append(chunk_rows)
+    query = f"""
+            SELECT gh.maGH, gh.trangThai, gh.ngayDat, nd.ten, nd.soDienThoai,
+                   ctgh.maSP, sp.ten, ctgh.soLuong, ctgh.donGia, ctgh.soLuong * ctgh.donGia
+            FROM chitietgiohang ctgh
+                     JOIN giohang gh ON gh.maGH = ctgh.maGH
+                     JOIN sanpham sp ON sp.maSP = ctgh.maSP
+                     LEFT JOIN khachhang kh ON kh.maKH = gh.maKH
+                     LEFT JOIN nguoidung nd ON nd.maND = kh.maND
+            WHERE {" AND ".join(conditions)}
+            ORDER BY ctgh.maGH, ctgh.maSP
+            LIMIT %s
+            """
+    return query, params
+
+
+def stream_orders_csv(statuses=None, date_from=None, date_to=None, chunk_rows=ORDER_EXPORT_CHUNK_ROWS):
+    """
+    Generator đồng bộ cho StreamingResponse: một dòng CSV cho mỗi sản phẩm
+    trong đơn. Kết nối chỉ được mượn khi bắt đầu đọc và luôn được trả lại.
+    """
+    conditions, params = _order_filters(statuses, date_from, date_to)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM để Excel đọc đúng tiếng Việt
+    yield "\ufeff".encode("utf-8") + encode_csv([ORDER_EXPORT_COLUMNS], buffer, writer)
+
+    try:
+        pooled = pool.acquire()
+    except Error as e:
+        print(f"Error starting order export: {e}")
+        return
+
+    finished = False
+    try:
+        db = pooled.conn
+        after = None
+        while True:
+            cursor = db.cursor(buffered=False)
+            cursor.execute(*_export_query(conditions, params, after, chunk_rows))
+            count = 0
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                count += len(rows)
+                after = (rows[-1][0], rows[-1][5])
+                yield encode_csv(rows, buffer, writer)
+            cursor.close()
+            # Kết thúc giao dịch đọc sau mỗi khối: không giữ snapshot suốt lúc tải
+            db.rollback()
+            if count < chunk_rows:
+                break
+        finished = True
+    except Error as e:
+        print(f"Error exporting orders: {e}")
+    finally:
+        pool.release(pooled, broken=not finished)
@@ -0,0 +1,183 @@
+"""
+Bộ nhớ đệm cho HTML đã render (toàn trang hoặc một phần trang).
+
+Mỗi mục được khóa theo route + tham số + vai trò người dùng, giữ kèm ETag
+mạnh (SHA-256 của nội dung) và các tag phụ thuộc dữ liệu, vd. "products"
+hay "product:12". Khi một dòng sanpham thay đổi, gọi `invalidate_tags(...)`
+để đánh dấu các mục liên quan là cũ. Bộ nhớ bị giới hạn bởi `max_bytes`, mục
+ít dùng nhất bị loại trước (LRU).
+
+Mục cũ (đã bị invalidate hoặc quá `ttl`) không được `get()` trả về nhưng vẫn
+được giữ thêm tối đa `stale_ttl` giây: khi DB quá tải (admission.py), route
+có thể gửi bản cũ qua `get_stale()` thay vì trả lỗi.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Giới hạn tuổi của một mục, phòng khi dữ liệu bị sửa từ tiến trình khác
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "300"))
+# Giữ mục cũ thêm bao lâu để gửi khi quá tải (0 = xóa ngay như trước)
+PAGE_CACHE_STALE_TTL = float(os.getenv("PAGE_CACHE_STALE_TTL", "3600"))
+
+
+def make_etag(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(part)
+        digest.update(b"\0")
+    return '"' + digest.hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """So khớp header If-None-Match với một ETag (RFC 9110: so sánh yếu)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "tags", "created_at", "stale")
+
+    def __init__(self, body, tags):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.etag = make_etag(self.body)
+        self.tags = frozenset(tags)
+        self.created_at = time.monotonic()
+        self.stale = False
+
+    @property
+    def text(self):
+        return self.body.decode("utf-8")
+
+
+class PageCache:
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES, ttl=PAGE_CACHE_TTL, stale_ttl=PAGE_CACHE_STALE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_tag = {}  # tag -> set(key)
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._stale_hits = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def _expire(self, key, entry):
+        """Đánh dấu cũ (hoặc xóa nếu không giữ mục cũ / đã quá stale_ttl). Trả về True nếu còn giữ."""
+        age = time.monotonic() - entry.created_at
+        if self.stale_ttl <= 0 or (self.ttl and age > self.ttl + self.stale_ttl):
+            self._drop(key)
+            return False
+        entry.stale = True
+        return True
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not entry.stale and self.ttl \
+                    and time.monotonic() - entry.created_at > self.ttl:
+                self._expire(key, entry)
+            if entry is None or entry.stale:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def get_stale(self, key):
+        """Mục của `key` kể cả khi đã cũ (trong `stale_ttl`), None nếu không còn."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.created_at > (self.ttl or 0) + self.stale_ttl:
+                return None
+            self._stale_hits += 1
+            return entry
+
+    def set(self, key, body, tags=()):
+        entry = CacheEntry(body, tags)
+        size = len(entry.body)
+        with self._lock:
+            self._drop(key)
+            if size > self.max_bytes:
+                return entry
+            self._entries[key] = entry
+            self._bytes += size
+            for tag in entry.tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._evictions += 1
+        return entry
+
+    def invalidate_tags(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._by_tag.get(tag, ())):
+                    entry = self._entries[key]
+                    if not entry.stale:
+                        self._invalidations += 1
+                    if self._expire(key, entry):
+                        # Không cần invalidate lại lần nữa
+                        self._by_tag[tag].discard(key)
+                        if not self._by_tag[tag]:
+                            del self._by_tag[tag]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_tag.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "stale_hits": self._stale_hits,
+            }
+
+
+page_cache = PageCache()
+
+
+def invalidate_product(product_id=None):
+    """Gọi khi một dòng sanpham được thêm/sửa/xóa."""
+    if product_id is None:
+        page_cache.invalidate_tags("products")
+    else:
+        page_cache.invalidate_tags("products", f"product:{product_id}")
@@ -0,0 +1,187 @@
+"""
+Băm và kiểm tra mật khẩu bằng scrypt (hashlib, không cần thư viện ngoài).
+
+scrypt tốn CPU và bộ nhớ có chủ đích (~50 ms, 16 MB mỗi lần với tham số mặc
+định). Chạy thẳng trong route `async def` sẽ treo mọi request khác của
+worker, nên việc băm chạy trong một process pool nhỏ (`PASSWORD_WORKERS`
+tiến trình) và giới hạn số việc đang chờ:
+
+- Tối đa `PASSWORD_WORKERS` việc được gửi vào pool cùng lúc, phần còn lại
+  xếp hàng trong event loop.
+- Hàng chờ quá `PASSWORD_MAX_PENDING` thì ném `PasswordHasherBusy` ngay (route
+  trả 503 + Retry-After) thay vì để đăng nhập dồn lại hàng chục giây.
+- Tiến trình con chết thì pool được tạo lại và việc được chạy lại một lần;
+  vẫn hỏng thì cũng ném `PasswordHasherBusy`.
+
+Chuỗi lưu trong `nguoidung.matKhau`: `scrypt$<n>$<r>$<p>$<salt>$<hash>`
+(base64). Dòng cũ còn mật khẩu thô vẫn đăng nhập được và được băm lại ngay
+khi đăng nhập đúng; dòng băm với tham số cũ cũng vậy.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "64"))
+PASSWORD_RETRY_AFTER = int(os.getenv("PASSWORD_RETRY_AFTER", "2"))
+
+SCHEME = "scrypt"
+SALT_BYTES = 16
+HASH_BYTES = 32
+# Salt cố định cho lần băm "giả" khi không có tài khoản: tốn cùng thời gian như
+# khi kiểm tra thật, để không lộ tên đăng nhập nào tồn tại qua thời gian phản hồi
+_DUMMY_SALT = b"\x00" * SALT_BYTES
+
+
+class PasswordHasherBusy(Exception):
+    """Quá nhiều yêu cầu băm mật khẩu đang chờ."""
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    # maxmem mặc định của OpenSSL (32 MB) không đủ khi tăng n/r
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=HASH_BYTES)
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(SCHEME + "$")
+
+
+def hash_password(password, n=PASSWORD_SCRYPT_N, r=PASSWORD_SCRYPT_R, p=PASSWORD_SCRYPT_P, salt=None):
+    """Chạy trong process pool (hoặc trực tiếp ở script/CLI). `salt` chỉ để sinh dữ liệu lặp lại được."""
+    salt = salt or os.urandom(SALT_BYTES)
+    return f"{SCHEME}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_password(stored, password):
+    """
+    Chạy trong process pool. Trả về (đúng mật khẩu?, cần băm lại?).
+
+    `stored` None (không có tài khoản) vẫn băm một lần rồi trả False.
+    """
+    if not stored:
+        _scrypt(password, _DUMMY_SALT, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+        return False, False
+    if not is_hashed(stored):
+        # Dòng cũ lưu mật khẩu thô
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")), True
+    try:
+        _, n, r, p, salt, expected = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        salt, expected = _unb64(salt), _unb64(expected)
+    except ValueError:
+        return False, False
+    ok = hmac.compare_digest(_scrypt(password, salt, n, r, p), expected)
+    return ok, ok and (n, r, p) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+
+
+class PasswordHasher:
+    def __init__(self, workers=PASSWORD_WORKERS, max_pending=PASSWORD_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pool = None
+        self._slots = None
+        self._running = 0
+        self._waiting = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._restarts = 0
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _discard(self, pool):
+        with self._lock:
+            # Việc khác có thể đã thay pool mới
+            if self._pool is pool:
+                self._pool = None
+                self._restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, fn, *args):
+        if self._running + self._waiting >= self.workers + self.max_pending:
+            self._rejected += 1
+            raise PasswordHasherBusy("Too many password checks in progress")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        self._running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            for attempt in range(2):
+                pool = self._executor()
+                try:
+                    return await loop.run_in_executor(pool, fn, *args)
+                except BrokenProcessPool:
+                    # Tiến trình con chết (OOM, bị kill): bỏ pool hỏng, lần sau tạo pool mới
+                    self._discard(pool)
+            self._rejected += 1
+            raise PasswordHasherBusy("Password worker pool keeps failing")
+        finally:
+            self._running -= 1
+            self._completed += 1
+            self._slots.release()
+
+    async def hash(self, password):
+        return await self._submit(hash_password, password)
+
+    async def verify(self, stored, password):
+        return await self._submit(verify_password, stored, password)
+
+    def record_rehash(self):
+        self._rehashed += 1
+
+    def warm(self):
+        """Khởi động trước các tiến trình con (spawn mất vài trăm ms mỗi tiến trình)."""
+        pool = self._executor()
+        for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "scrypt": {"n": PASSWORD_SCRYPT_N, "r": PASSWORD_SCRYPT_R, "p": PASSWORD_SCRYPT_P},
+            "running": self._running,
+            "waiting": self._waiting,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "rehashed": self._rehashed,
+            "restarts": self._restarts,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,246 @@
+"""
+Ghi lại các câu SQL của từng request (bật theo tỉ lệ lấy mẫu hoặc theo yêu cầu).
+
+Với request được chọn, mỗi câu lệnh chạy qua `run_db` được ghi: câu SQL (đã
+rút gọn khoảng trắng, `IN (%s, %s, ...)` gộp thành `IN (...)`), kiểu tham số
+(không ghi giá trị), thời gian, số dòng và hàm truy cập dữ liệu đã gọi nó.
+Cuối request, profile được kiểm tra và gắn cờ:
+
+- `repeated`: cùng một câu chạy >= PROFILE_REPEAT_THRESHOLD lần (dấu hiệu N+1);
+- `too_many`: request chạy > PROFILE_MAX_QUERIES câu;
+- `slow`: câu chạy lâu hơn PROFILE_SLOW_MS mili giây.
+
+Kết quả được in thành một dòng JSON (`PROFILE {...}`). Admin có thể thêm
+`?_profile=1` vào URL của một trang HTML để xem bảng profile chèn cuối trang.
+PROFILE_SAMPLE_RATE (0..1) là tỉ lệ request được lấy mẫu khi không yêu cầu.
+"""
+import contextvars
+import html
+import json
+import os
+import random
+import re
+import time
+from urllib.parse import parse_qs
+
+from starlette.requests import Request
+
+import sessions
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "100"))
+PROFILE_MAX_QUERIES = int(os.getenv("PROFILE_MAX_QUERIES", "10"))
+PROFILE_REPEAT_THRESHOLD = int(os.getenv("PROFILE_REPEAT_THRESHOLD", "3"))
+
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)", re.IGNORECASE)
+
+
+def normalize_sql(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    query = _WHITESPACE.sub(" ", query).strip()
+    return _IN_LIST.sub("IN (...)", query)
+
+
+def params_shape(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+class RequestProfile:
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.queries = []
+
+    def record(self, function, query, params, duration, rows, many=False):
+        self.queries.append({
+            "function": function,
+            "sql": normalize_sql(query),
+            "params": params_shape(params[0] if many and params else params),
+            "executemany": len(params) if many else None,
+            "ms": round(duration * 1000, 3),
+            "rows": rows,
+        })
+
+    def wrap(self, conn, function):
+        return _ProfiledConnection(conn, self, function)
+
+    def finish(self, status):
+        self.status = status
+        self.duration = time.perf_counter() - self.started
+
+    def findings(self):
+        findings = []
+        counts = {}
+        for query in self.queries:
+            counts[query["sql"]] = counts.get(query["sql"], 0) + 1
+            if query["ms"] >= PROFILE_SLOW_MS:
+                findings.append({"type": "slow", "sql": query["sql"], "ms": query["ms"]})
+        for sql, count in counts.items():
+            if count >= PROFILE_REPEAT_THRESHOLD:
+                findings.append({"type": "repeated", "sql": sql, "count": count})
+        if len(self.queries) > PROFILE_MAX_QUERIES:
+            findings.append({"type": "too_many", "count": len(self.queries)})
+        return findings
+
+    def to_dict(self):
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "ms": round((self.duration or 0) * 1000, 3),
+            "db_ms": round(sum(query["ms"] for query in self.queries), 3),
+            "query_count": len(self.queries),
+            "queries": self.queries,
+            "findings": self.findings(),
+        }
+
+
+class _ProfiledCursor:
+    def __init__(self, cursor, profile, function):
+        self._cursor = cursor
+        self._profile = profile
+        self._function = function
+
+    def execute(self, query, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, params, *args, **kwargs)
+        finally:
+            self._profile.record(self._function, query, params, time.perf_counter() - start,
+                                 self._cursor.rowcount)
+
+    def executemany(self, query, seq_params, *args, **kwargs):
+        seq_params = list(seq_params)
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, seq_params, *args, **kwargs)
+        finally:
+            self._profile.record(self._function, query, seq_params, time.perf_counter() - start,
+                                 self._cursor.rowcount, many=True)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _ProfiledConnection:
+    def __init__(self, conn, profile, function):
+        self._conn = conn
+        self._profile = profile
+        self._function = function
+
+    def cursor(self, *args, **kwargs):
+        return _ProfiledCursor(self._conn.cursor(*args, **kwargs), self._profile, self._function)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+# ===== MIDDLEWARE =====
+
+def _requested(scope):
+    """`?_profile=1` chỉ có hiệu lực với admin đã đăng nhập (cookie phiên có chữ ký)."""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("_profile") != ["1"]:
+        return False
+    user = sessions.current_user(Request(scope))
+    return user is not None and user["role"] == "ADMIN"
+
+
+def render_panel(profile):
+    data = profile.to_dict()
+    rows = []
+    for query in data["queries"]:
+        rows.append(
+            f"<tr><td>{query['ms']}</td><td>{query['rows']}</td><td>{html.escape(query['function'])}</td>"
+            f"<td><code>{html.escape(query['sql'])}</code></td></tr>"
+        )
+    items = []
+    for finding in data["findings"]:
+        if finding["type"] == "slow":
+            text = f"chậm {finding['ms']} ms: {finding['sql']}"
+        elif finding["type"] == "repeated":
+            text = f"lặp {finding['count']} lần (N+1?): {finding['sql']}"
+        else:
+            text = f"quá nhiều câu lệnh: {finding['count']}"
+        items.append(f"<li>{html.escape(text)}</li>")
+    findings = "".join(items) or "<li>Không có cảnh báo.</li>"
+    return (
+        '<div id="profiler-panel" class="container my-4"><div class="card border-warning"><div class="card-body">'
+        f'<h2 class="h6">SQL profile: {data["query_count"]} câu, {data["db_ms"]} ms DB / {data["ms"]} ms tổng</h2>'
+        f'<ul class="small">{findings}</ul>'
+        '<table class="table table-sm small mb-0"><thead><tr><th>ms</th><th>dòng</th><th>hàm</th><th>SQL</th></tr>'
+        f'</thead><tbody>{"".join(rows)}</tbody></table></div></div></div>'
+    )
+
+
+class ProfilerMiddleware:
+    def __init__(self, app, sample_rate=PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = _requested(scope)
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = current_profile.set(profile)
+        start_message = None
+        body = []
+        status = 500
+
+        async def send_profiled(message):
+            nonlocal start_message, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = dict(message.get("headers", ()))
+                if requested and headers.get(b"content-type", b"").startswith(b"text/html"):
+                    # Giữ lại để chèn bảng profile trước </body>
+                    start_message = message
+                    return
+            elif message["type"] == "http.response.body" and start_message is not None:
+                body.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                profile.finish(status)
+                await _send_with_panel(send, start_message, b"".join(body), profile)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            current_profile.reset(token)
+            if profile.duration is None:
+                profile.finish(status)
+            print("PROFILE " + json.dumps(profile.to_dict(), ensure_ascii=False, default=str))
+
+
+async def _send_with_panel(send, start_message, body, profile):
+    panel = render_panel(profile).encode("utf-8")
+    index = body.rfind(b"</body>")
+    body = body[:index] + panel + body[index:] if index != -1 else body + panel
+    headers = [(name, value) for name, value in start_message.get("headers", ())
+               if name not in (b"content-length", b"etag")]
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({**start_message, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,88 @@
+"""
+Bộ nhớ đệm thông tin người dùng (tenDangNhap, ten, soDienThoai, vaiTro) cho
+/profile, /edit_profile và việc đọc lại vai trò khi cấp lại phiên (sessions.py).
+
+Mỗi mục sống tối đa `PROFILE_CACHE_TTL` giây, giữ tối đa `PROFILE_CACHE_SIZE`
+người dùng (LRU). `handle_edit_profile` gọi `invalidate(maND)` sau khi sửa;
+worker khác vẫn có thể thấy dữ liệu cũ tới hết TTL.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import queries
+from db import run_db_read
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+
+class ProfileCache:
+    def __init__(self, ttl=PROFILE_CACHE_TTL, max_size=PROFILE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # maND -> (profile, thời điểm nạp)
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        # Tăng mỗi lần invalidate: kết quả đọc từ DB trước lần sửa thì không được lưu
+        self._epoch = 0
+
+    def epoch(self):
+        """Gọi trước khi đọc DB, truyền lại cho `put()`."""
+        return self._epoch
+
+    def get(self, user_id):
+        """Bản sao profile đã nhớ, None nếu chưa có hoặc đã hết hạn."""
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self._hits += 1
+            return dict(entry[0])
+
+    def put(self, user_id, profile, epoch):
+        if profile is None:
+            return
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries[str(user_id)] = (dict(profile), time.monotonic())
+            self._entries.move_to_end(str(user_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+            self._epoch += 1
+            self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+            }
+
+
+profile_cache = ProfileCache()
+
+
+async def load_profile(user_id):
+    """Profile của maND qua cache, None nếu tài khoản không tồn tại."""
+    profile = profile_cache.get(user_id)
+    if profile is None:
+        epoch = profile_cache.epoch()
+        profile = await run_db_read(queries.fetch_user_profile, user_id)
+        profile_cache.put(user_id, profile, epoch)
+    return profile
@@ -0,0 +1,286 @@
+"""
+Các truy vấn database dùng bởi route.
+
+Mỗi hàm nhận một kết nối `db` làm tham số đầu tiên và chạy đồng bộ; route
+gọi chúng qua `run_db(...)` để việc chờ MySQL diễn ra trên thread pool thay
+vì trên event loop.
+"""
+from refdata import reference_data
+
+
+# ===== SẢN PHẨM =====
+# Tên danh mục/thương hiệu được gắn từ reference_data (refdata.py) thay vì JOIN.
+
+def fetch_featured_products(db, limit=8):
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("""
+                   SELECT sp.*
+                   FROM sanpham sp
+                   ORDER BY sp.maSP DESC LIMIT %s
+                   """, (limit,))
+    rows = cursor.fetchall()
+    cursor.close()
+    return reference_data.attach_names(db, rows)
+
+
+# Các cột cần cho thẻ sản phẩm ở trang danh sách
+PRODUCT_CARD_COLUMNS = "sp.maSP, sp.ten, sp.gia, sp.hinhAnh, sp.maDM, sp.maTH"
+
+
+def _product_filters(db, category, brand, search, min_price, max_price):
+    """
+    Điều kiện WHERE (bắt đầu bằng " AND ...") và tham số cho bộ lọc sản phẩm;
+    None nếu tên danh mục/thương hiệu không tồn tại (không sản phẩm nào khớp).
+    """
+    query = ""
+    params = []
+
+    if category:
+        category_id = reference_data.category_id(db, category)
+        if category_id is None:
+            return None
+        query += " AND sp.maDM = %s"
+        params.append(category_id)
+
+    if brand:
+        brand_id = reference_data.brand_id(db, brand)
+        if brand_id is None:
+            return None
+        query += " AND sp.maTH = %s"
+        params.append(brand_id)
+
+    if search:
+        query += " AND sp.ten LIKE %s"
+        params.append(f"%{search}%")
+
+    if min_price is not None:
+        query += " AND sp.gia >= %s"
+        params.append(min_price)
+
+    if max_price is not None:
+        query += " AND sp.gia < %s"
+        params.append(max_price)
+
+    return query, params
+
+
+def fetch_products(db, category=None, brand=None, search=None, after=None, limit=24,
+                   min_price=None, max_price=None):
+    """
+    Một trang sản phẩm theo keyset trên maSP (giảm dần).
+
+    `after` là maSP của thẻ cuối trang trước; lấy dư một dòng để biết còn
+    trang sau hay không. Trả về (rows, next_after).
+    """
+    filters = _product_filters(db, category, brand, search, min_price, max_price)
+    if filters is None:
+        return [], None
+    where, params = filters
+    query = f"""
+            SELECT {PRODUCT_CARD_COLUMNS}
+            FROM sanpham sp
+            WHERE 1 = 1 \
+            """ + where
+
+    if after is not None:
+        query += " AND sp.maSP < %s"
+        params.append(after)
+
+    query += " ORDER BY sp.maSP DESC LIMIT %s"
+    params.append(limit + 1)
+
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    cursor.close()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1]['maSP']
+    return reference_data.attach_names(db, rows), next_after
+
+
+def count_matching_products(db, category=None, brand=None, search=None,
+                            min_price=None, max_price=None):
+    """Tổng số sản phẩm khớp bộ lọc của fetch_products trên mọi trang."""
+    filters = _product_filters(db, category, brand, search, min_price, max_price)
+    if filters is None:
+        return 0
+    where, params = filters
+    cursor = db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM sanpham sp WHERE 1 = 1" + where, params)
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+def fetch_product(db, product_id):
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("SELECT sp.* FROM sanpham sp WHERE sp.maSP = %s", (product_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    if row:
+        reference_data.attach_names(db, [row])
+    return row
+
+
+def fetch_products_by_ids(db, product_ids):
+    """Thẻ sản phẩm cho danh sách maSP, giữ nguyên thứ tự truyền vào."""
+    if not product_ids:
+        return []
+    cursor = db.cursor(dictionary=True)
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    cursor.execute(f"""
+                   SELECT {PRODUCT_CARD_COLUMNS}
+                   FROM sanpham sp
+                   WHERE sp.maSP IN ({placeholders})
+                   """, list(product_ids))
+    by_id = {row['maSP']: row for row in cursor.fetchall()}
+    cursor.close()
+    rows = [by_id[pid] for pid in product_ids if pid in by_id]
+    return reference_data.attach_names(db, rows)
+
+
+def fetch_product_image(db, product_id):
+    """hinhAnh của một sản phẩm (None nếu không có sản phẩm hoặc không có ảnh)."""
+    cursor = db.cursor()
+    cursor.execute("SELECT hinhAnh FROM sanpham WHERE maSP = %s", (product_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
+
+
+def fetch_catalog_documents(db, after_id=0, product_ids=None, changed_since=None):
+    """
+    Các trường cần cho chỉ mục tìm kiếm và facet (catalog.py): sản phẩm có
+    maSP > `after_id`, hoặc theo `product_ids`, hoặc sửa từ `changed_since`.
+    """
+    query = "SELECT sp.maSP, sp.ten, sp.gia, sp.maDM, sp.maTH FROM sanpham sp"
+    params = []
+    if product_ids is not None:
+        query += " WHERE sp.maSP IN (" + ", ".join(["%s"] * len(product_ids)) + ")"
+        params.extend(product_ids)
+    elif changed_since is not None:
+        query += " WHERE sp.ngayCapNhat >= %s"
+        params.append(changed_since)
+    else:
+        query += " WHERE sp.maSP > %s"
+        params.append(after_id)
+    query += " ORDER BY sp.maSP"
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    return reference_data.attach_names(db, rows)
+
+
+def begin_catalog_snapshot(db):
+    """
+    Mở giao dịch mới với snapshot lấy ngay lúc này và trả về giờ MySQL (cùng
+    đồng hồ với cột ngayCapNhat) đọc ngay trước đó. Mọi câu đọc sau trong giao
+    dịch thấy mọi dòng đã commit trước mốc giờ trả về.
+    """
+    cursor = db.cursor()
+    cursor.execute("SELECT NOW(3)")
+    now = cursor.fetchone()[0]
+    # Tự commit giao dịch cũ (nếu có) trước khi mở giao dịch mới
+    cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+    cursor.close()
+    return now
+
+
+def count_products(db):
+    cursor = db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM sanpham")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+def fetch_filter_options(db):
+    """Tên danh mục và thương hiệu cho bộ lọc."""
+    return (list(reference_data.categories(db).values()),
+            list(reference_data.brands(db).values()))
+
+
+def fetch_products_page(db, category=None, brand=None, search=None, after=None, limit=24,
+                        min_price=None, max_price=None):
+    """
+    Một trang sản phẩm, tổng số sản phẩm khớp bộ lọc và dữ liệu cho bộ lọc,
+    dùng chung một kết nối.
+    """
+    rows, next_after = fetch_products(db, category, brand, search, after, limit, min_price, max_price)
+    total = count_matching_products(db, category, brand, search, min_price, max_price)
+    categories, brands = fetch_filter_options(db)
+    return rows, next_after, total, categories, brands
+
+
+# ===== NGƯỜI DÙNG =====
+
+def fetch_user_by_username(db, username):
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM nguoidung WHERE tenDangNhap = %s", (username,))
+    user = cursor.fetchone()
+    cursor.close()
+    return user
+
+
+def create_user(db, username, password_hash, fullname, phone):
+    """
+    Tạo tài khoản USER kèm bản ghi khách hàng. Trả về None nếu tên đã tồn tại.
+    `password_hash` là chuỗi đã băm bằng passwords.py.
+    """
+    cursor = db.cursor()
+
+    cursor.execute("SELECT maND FROM nguoidung WHERE tenDangNhap = %s", (username,))
+    if cursor.fetchone():
+        cursor.close()
+        return None
+
+    cursor.execute("""
+                   INSERT INTO nguoidung (tenDangNhap, matKhau, ten, soDienThoai, vaiTro)
+                   VALUES (%s, %s, %s, %s, 'USER')
+                   """, (username, password_hash, fullname, phone))
+
+    user_id = cursor.lastrowid
+    cursor.execute("INSERT INTO khachhang (maND) VALUES (%s)", (user_id,))
+
+    db.commit()
+    cursor.close()
+    return user_id
+
+
+def update_password_hash(db, user_id, old_value, new_hash):
+    """
+    Thay mật khẩu thô / hash cũ bằng hash mới sau khi đăng nhập đúng. Chỉ cập
+    nhật nếu cột vẫn là `old_value`, để không ghi đè mật khẩu vừa được đổi.
+    """
+    cursor = db.cursor()
+    cursor.execute("UPDATE nguoidung SET matKhau = %s WHERE maND = %s AND matKhau = %s",
+                   (new_hash, user_id, old_value))
+    updated = cursor.rowcount
+    db.commit()
+    cursor.close()
+    return updated > 0
+
+
+def fetch_user_profile(db, user_id):
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(
+        "SELECT tenDangNhap, ten, soDienThoai, vaiTro FROM nguoidung WHERE maND = %s",
+        (user_id,)
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    return row
+
+
+def update_user_contact(db, user_id, fullname, phone):
+    cursor = db.cursor()
+    cursor.execute(
+        "UPDATE nguoidung SET ten = %s, soDienThoai = %s WHERE maND = %s",
+        (fullname, phone, user_id)
+    )
+    db.commit()
+    cursor.close()
@@ -0,0 +1,98 @@
+"""
+Bộ nhớ đệm cho dữ liệu tham chiếu: danh mục (danhmuc) và thương hiệu (thuonghieu).
+
+Hai bảng này hầu như không đổi, nên được nạp một lần rồi dùng để tra tên
+theo maDM/maTH trong bộ nhớ thay cho LEFT JOIN ở mỗi truy vấn sản phẩm.
+Dữ liệu được nạp lại khi quá `ttl` giây hoặc khi có ai gọi `invalidate()`
+(vd. sau khi admin thêm/sửa danh mục).
+"""
+import os
+import threading
+import time
+
+REFDATA_TTL = float(os.getenv("REFDATA_TTL", "300"))
+
+
+class ReferenceData:
+    def __init__(self, ttl=REFDATA_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._categories = {}  # maDM -> tên
+        self._brands = {}  # maTH -> tên
+        self._category_ids = {}  # tên -> maDM
+        self._brand_ids = {}  # tên -> maTH
+        self._loaded_at = None
+        self._hits = 0
+        self._misses = 0
+        self._reloads = 0
+
+    def _is_fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure(self, db):
+        """Nạp lại từ DB nếu hết hạn hoặc đã bị invalidate."""
+        with self._lock:
+            if self._is_fresh():
+                self._hits += 1
+                return
+            self._misses += 1
+
+            cursor = db.cursor(dictionary=True)
+            cursor.execute("SELECT maDM, ten FROM danhmuc")
+            categories = {row['maDM']: row['ten'] for row in cursor.fetchall()}
+            cursor.execute("SELECT maTH, ten FROM thuonghieu")
+            brands = {row['maTH']: row['ten'] for row in cursor.fetchall()}
+            cursor.close()
+
+            self._categories = categories
+            self._brands = brands
+            self._category_ids = {name: key for key, name in categories.items()}
+            self._brand_ids = {name: key for key, name in brands.items()}
+            self._loaded_at = time.monotonic()
+            self._reloads += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    # ----- tra cứu (gọi trong hàm chạy qua run_db) -----
+
+    def categories(self, db):
+        self._ensure(db)
+        return self._categories
+
+    def brands(self, db):
+        self._ensure(db)
+        return self._brands
+
+    def category_id(self, db, name):
+        self._ensure(db)
+        return self._category_ids.get(name)
+
+    def brand_id(self, db, name):
+        self._ensure(db)
+        return self._brand_ids.get(name)
+
+    def attach_names(self, db, rows):
+        """Gắn ten_danhmuc/ten_thuonghieu vào các dòng sanpham có maDM/maTH."""
+        self._ensure(db)
+        categories, brands = self._categories, self._brands
+        for row in rows:
+            row['ten_danhmuc'] = categories.get(row.get('maDM'))
+            row['ten_thuonghieu'] = brands.get(row.get('maTH'))
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                "categories": len(self._categories),
+                "brands": len(self._brands),
+                "fresh": self._is_fresh(),
+                "hits": self._hits,
+                "misses": self._misses,
+                "reloads": self._reloads,
+                "ttl": self.ttl,
+            }
+
+
+reference_data = ReferenceData()
@@ -0,0 +1,339 @@
+"""
+Sản phẩm liên quan cho trang chi tiết: "Khách hàng cũng mua" và "Sản phẩm
+tương tự", tính trước theo chu kỳ rồi đọc từ file.
+
+Tính (NumPy/SciPy, chỉ cần ở tiến trình dựng chỉ mục):
+
+- Ma trận thưa giỏ x sản phẩm B từ các dòng đơn hàng; Bᵀ·B là số đơn có cả
+  hai sản phẩm. Điểm là cosine `đồng_mua / sqrt(đơn_i * đơn_j)`, bỏ các cặp
+  xuất hiện ít hơn `RELATED_MIN_SUPPORT` đơn.
+- "Tương tự": cùng danh mục và thương hiệu trước, rồi cùng danh mục, xếp theo
+  daBan. Sản phẩm mới/ít đơn (chưa đủ K sản phẩm đồng mua) được bù bằng
+  danh sách này.
+
+Kết quả là một mảng int32 `[2, maSP lớn nhất + 1, K]` (0 = trống) ghi ra
+`RELATED_INDEX_PATH` theo định dạng .npy, thay file bằng `os.replace`. Mỗi
+worker mmap file (chỉ đọc, dùng chung page cache của hệ điều hành), tra một
+maSP là cắt một đoạn K số, không cần NumPy ở phía đọc.
+
+Trong ứng dụng, mỗi `RELATED_CHECK_INTERVAL` giây các worker mở lại file nếu
+nó đã đổi; file cũ hơn `RELATED_REBUILD_INTERVAL` thì một worker (giữ khóa
+file) dựng lại. Có thể dựng ngoài ứng dụng (cron):
+
+    python related.py
+"""
+import ast
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khóa giữa các tiến trình
+    fcntl = None
+
+from cart import NOT_ORDER_STATUSES
+
+RELATED_INDEX_PATH = os.getenv("RELATED_INDEX_PATH", os.path.join("cache", "related.npy"))
+RELATED_TOP_K = int(os.getenv("RELATED_TOP_K", "12"))
+RELATED_MIN_SUPPORT = int(os.getenv("RELATED_MIN_SUPPORT", "2"))
+RELATED_REBUILD_INTERVAL = float(os.getenv("RELATED_REBUILD_INTERVAL", "3600"))
+RELATED_CHECK_INTERVAL = float(os.getenv("RELATED_CHECK_INTERVAL", "60"))
+RELATED_FETCH_CHUNK = int(os.getenv("RELATED_FETCH_CHUNK", "50000"))
+
+ALSO_BOUGHT = 0
+SIMILAR = 1
+
+
+# ===== ĐỌC DỮ LIỆU =====
+
+def fetch_related_inputs(db, chunk_rows=RELATED_FETCH_CHUNK):
+    """
+    (sản phẩm, dòng đơn) dưới dạng array('i'):
+    products = (maSP, maDM, maTH, daBan); lines = (maGH, maSP).
+    Dòng đơn đọc theo từng khối keyset theo maCTGH (mỗi khối một truy vấn ngắn).
+    """
+    cursor = db.cursor()
+    cursor.execute("SELECT maSP, COALESCE(maDM, 0), COALESCE(maTH, 0), COALESCE(daBan, 0) FROM sanpham")
+    products = tuple(array('i') for _ in range(4))
+    for row in cursor:
+        for column, value in zip(products, row):
+            column.append(value)
+
+    carts, items = array('i'), array('i')
+    after = 0
+    while True:
+        cursor.execute("""
+                       SELECT ctgh.maCTGH, ctgh.maGH, ctgh.maSP
+                       FROM chitietgiohang ctgh
+                                JOIN giohang gh ON gh.maGH = ctgh.maGH
+                       WHERE ctgh.maCTGH > %s
+                         AND gh.trangThai NOT IN (%s, %s)
+                       ORDER BY ctgh.maCTGH
+                       LIMIT %s
+                       """, (after, *NOT_ORDER_STATUSES, chunk_rows))
+        rows = cursor.fetchall()
+        for _, cart_id, product_id in rows:
+            carts.append(cart_id)
+            items.append(product_id)
+        db.commit()  # kết thúc snapshot đọc của khối này
+        if len(rows) < chunk_rows:
+            break
+        after = rows[-1][0]
+    cursor.close()
+    return products, (carts, items)
+
+
+# ===== TÍNH =====
+
+def _compact(candidates, valid, top_k):
+    """Giữ các ô hợp lệ của mỗi hàng theo thứ tự ban đầu, lấy `top_k` ô đầu (thiếu thì 0)."""
+    import numpy as np
+
+    order = np.argsort(~valid, axis=1, kind="stable")[:, :top_k]
+    return np.take_along_axis(np.where(valid, candidates, 0), order, axis=1)
+
+
+def _group_top(keys, ranked_ids, width):
+    """
+    Với mỗi giá trị khóa, `width` sản phẩm đầu tiên (theo thứ tự `ranked_ids`
+    đã xếp theo khóa rồi độ phổ biến). Trả về (các khóa đã sắp, mảng [nhóm, width]).
+    """
+    import numpy as np
+
+    group_keys, starts, sizes = np.unique(keys, return_index=True, return_counts=True)
+    positions = starts[:, None] + np.arange(width)[None, :]
+    inside = np.arange(width)[None, :] < sizes[:, None]
+    top = np.where(inside, ranked_ids[np.minimum(positions, len(ranked_ids) - 1)], 0)
+    return group_keys, top
+
+
+def compute_related(products, lines, top_k=RELATED_TOP_K, min_support=RELATED_MIN_SUPPORT):
+    """
+    products = (maSP, maDM, maTH, daBan), lines = (maGH, maSP): các dãy số nguyên.
+    Trả về mảng int32 [2, maSP lớn nhất + 1, top_k].
+    """
+    import numpy as np
+    from scipy import sparse
+
+    product_ids, categories, brands, sold = (np.asarray(column, dtype=np.int64) for column in products)
+    size = int(product_ids.max()) + 1 if len(product_ids) else 1
+    index = np.zeros((2, size, top_k), dtype=np.int32)
+    if not len(product_ids):
+        return index
+
+    exists = np.zeros(size, dtype=bool)
+    exists[product_ids] = True
+    popularity = np.zeros(size, dtype=np.int64)
+    popularity[product_ids] = sold
+
+    # --- Tương tự: cùng danh mục + thương hiệu, rồi cùng danh mục ---
+    brand_key = categories * (int(brands.max()) + 1) + brands
+    ranked = np.lexsort((product_ids, -sold, brand_key))
+    pair_keys, pair_top = _group_top(brand_key[ranked], product_ids[ranked], top_k + 1)
+    ranked = np.lexsort((product_ids, -sold, categories))
+    category_keys, category_top = _group_top(categories[ranked], product_ids[ranked], 3 * top_k)
+
+    brand_of = np.zeros(size, dtype=np.int64)
+    brand_of[product_ids] = brands
+    same_pair = pair_top[np.searchsorted(pair_keys, brand_key)]
+    same_category = category_top[np.searchsorted(category_keys, categories)]
+    # Sản phẩm cùng thương hiệu đã nằm ở phần đầu (hoặc xếp sau những sản phẩm ở đó)
+    same_category = np.where(brand_of[same_category] == brands[:, None], 0, same_category)
+    candidates = np.concatenate([same_pair, same_category], axis=1)
+    valid = (candidates != 0) & (candidates != product_ids[:, None])
+    index[SIMILAR, product_ids] = _compact(candidates, valid, top_k)
+
+    # --- Đồng mua ---
+    carts, items = (np.asarray(column, dtype=np.int64) for column in lines)
+    keep = (items < size) & exists[np.minimum(items, size - 1)]
+    carts, items = carts[keep], items[keep]
+    if len(items):
+        _, cart_rows = np.unique(carts, return_inverse=True)
+        basket = sparse.csr_matrix((np.ones(len(items), dtype=np.float32), (cart_rows, items)),
+                                   shape=(int(cart_rows.max()) + 1, size))
+        basket.sum_duplicates()
+        basket.data[:] = 1  # một sản phẩm xuất hiện nhiều dòng trong cùng giỏ chỉ tính một lần
+        orders_per_product = np.asarray(basket.sum(axis=0)).ravel()
+        co = (basket.T @ basket).tocoo()
+        pairs = (co.row != co.col) & (co.data >= min_support)
+        rows, cols, counts = co.row[pairs], co.col[pairs], co.data[pairs]
+        scores = counts / np.sqrt(orders_per_product[rows] * orders_per_product[cols])
+        # Mỗi hàng: điểm giảm dần, hòa thì sản phẩm bán chạy hơn trước
+        order = np.lexsort((cols, -popularity[cols], -scores, rows))
+        rows, cols = rows[order], cols[order]
+        row_starts = np.searchsorted(rows, rows, side="left")
+        rank = np.arange(len(rows)) - row_starts
+        top = rank < top_k
+        index[ALSO_BOUGHT, rows[top], rank[top]] = cols[top]
+
+    # Bù bằng "tương tự" cho sản phẩm ít đơn, bỏ trùng với phần đã có
+    also = index[ALSO_BOUGHT, product_ids]
+    similar = index[SIMILAR, product_ids]
+    duplicate = (similar[:, :, None] == also[:, None, :]).any(axis=2)
+    candidates = np.concatenate([also, similar], axis=1)
+    valid = candidates != 0
+    valid[:, top_k:] &= ~duplicate
+    index[ALSO_BOUGHT, product_ids] = _compact(candidates, valid, top_k)
+    return index
+
+
+def write_related_index(products, lines, path=RELATED_INDEX_PATH, top_k=RELATED_TOP_K,
+                        min_support=RELATED_MIN_SUPPORT):
+    """Tính và ghi chỉ mục ra `path` (thay file nguyên khối). Trả về số sản phẩm."""
+    import numpy as np
+
+    index = compute_related(products, lines, top_k, min_support)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npy.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(index, dtype="<i4"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(products[0])
+
+
+# ===== ĐỌC CHỈ MỤC =====
+
+def _parse_npy_header(buffer):
+    """(offset dữ liệu, shape) của một mảng .npy int32 little-endian, C order."""
+    if buffer[:6] != b"\x93NUMPY":
+        raise ValueError("not a .npy file")
+    major = buffer[6]
+    if major == 1:
+        (header_len,), start = struct.unpack("<H", buffer[8:10]), 10
+    else:
+        (header_len,), start = struct.unpack("<I", buffer[8:12]), 12
+    header = ast.literal_eval(bytes(buffer[start:start + header_len]).decode("latin1"))
+    if header["descr"] != "<i4" or header["fortran_order"] or len(header["shape"]) != 3:
+        raise ValueError(f"unexpected related index layout: {header}")
+    return start + header_len, header["shape"]
+
+
+class RelatedIndex:
+    def __init__(self, path=RELATED_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file_id = None  # (st_ino, st_mtime_ns) của file đang mmap
+        self._map = None
+        self._values = None  # memoryview int32 một chiều trên mmap
+        self._shape = (2, 0, 0)
+        self._loaded_at = None
+        self._lookups = 0
+        self._reloads = 0
+        self._builds = 0
+        self._last_build_seconds = None
+
+    @property
+    def ready(self):
+        return self._values is not None
+
+    def file_age(self):
+        """Số giây từ lần ghi file chỉ mục, None nếu chưa có."""
+        try:
+            return time.time() - os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        """Mmap lại file nếu nó đã được thay. Trả về True nếu đã đổi chỉ mục."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        file_id = (st.st_ino, st.st_mtime_ns)
+        if file_id == self._file_id:
+            return False
+        with open(self.path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset, shape = _parse_npy_header(mapped)
+        values = memoryview(mapped)[offset:].cast("i")
+        if len(values) != shape[0] * shape[1] * shape[2]:
+            raise ValueError("truncated related index")
+        with self._lock:
+            # Mmap cũ được giải phóng khi không còn tham chiếu
+            self._map, self._values, self._shape = mapped, values, tuple(shape)
+            self._file_id = file_id
+            self._loaded_at = time.time()
+            self._reloads += 1
+        return True
+
+    def _lookup(self, kind, product_id, limit):
+        values, (_, size, top_k) = self._values, self._shape
+        self._lookups += 1
+        if values is None or not 0 < product_id < size:
+            return []
+        start = (kind * size + product_id) * top_k
+        return [pid for pid in values[start:start + min(limit, top_k)].tolist() if pid]
+
+    def also_bought(self, product_id, limit=RELATED_TOP_K):
+        return self._lookup(ALSO_BOUGHT, product_id, limit)
+
+    def similar(self, product_id, limit=RELATED_TOP_K):
+        return self._lookup(SIMILAR, product_id, limit)
+
+    def rebuild(self, db, max_age=RELATED_REBUILD_INTERVAL):
+        """
+        Đọc dữ liệu và dựng lại file nếu nó cũ hơn `max_age` giây (gọi qua
+        run_db_read). Chỉ một tiến trình dựng tại một thời điểm; trả về False
+        nếu bỏ qua.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            # Worker khác có thể vừa dựng xong trước khi ta lấy được khóa
+            age = self.file_age()
+            if age is not None and age < max_age:
+                return False
+            started = time.perf_counter()
+            products, lines = fetch_related_inputs(db)
+            write_related_index(products, lines, self.path)
+            self._last_build_seconds = round(time.perf_counter() - started, 3)
+            self._builds += 1
+        return True
+
+    def stats(self):
+        _, size, top_k = self._shape
+        return {
+            "ready": self.ready,
+            "path": self.path,
+            "products": max(size - 1, 0),
+            "top_k": top_k,
+            "file_age": self.file_age(),
+            "loaded_at": self._loaded_at,
+            "lookups": self._lookups,
+            "reloads": self._reloads,
+            "builds": self._builds,
+            "last_build_seconds": self._last_build_seconds,
+        }
+
+
+related_index = RelatedIndex()
+
+
+if __name__ == "__main__":
+    import mysql.connector
+    from db import DB_CONFIG
+
+    db = mysql.connector.connect(**DB_CONFIG)
+    try:
+        started = time.perf_counter()
+        products, lines = fetch_related_inputs(db)
+        print(f"Đọc {len(products[0])} sản phẩm, {len(lines[0])} dòng đơn trong {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+    started = time.perf_counter()
+    write_related_index(products, lines)
+    print(f"Ghi {RELATED_INDEX_PATH} trong {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,231 @@
+"""
+Chỉ mục tìm kiếm sản phẩm trong bộ nhớ.
+
+Thay cho `sp.ten LIKE '%...%'` (quét toàn bảng): mỗi sản phẩm được tách từ
+trên tên, thương hiệu và danh mục sau khi bỏ dấu tiếng Việt, rồi đưa vào
+inverted index `token -> {maSP: trọng số}`. Truy vấn khớp theo tiền tố nên
+"ao th" tìm được "Áo thun", và kết quả được xếp hạng theo trường khớp.
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Trọng số theo trường: khớp ở tên sản phẩm quan trọng hơn thương hiệu/danh mục
+FIELD_WEIGHTS = {
+    "ten": 3.0,
+    "thuonghieu": 1.5,
+    "danhmuc": 1.0,
+}
+
+# Khớp tiền tố được tính điểm thấp hơn khớp nguyên từ
+PREFIX_FACTOR = 0.5
+
+# Giới hạn số từ được mở rộng từ một tiền tố quá ngắn (vd. "a")
+MAX_PREFIX_EXPANSIONS = 64
+
+# Số kết quả xếp hạng được giữ lại để phân trang tiếp mà không phải tính lại
+RANK_CACHE_SIZE = 128
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fold(text):
+    """Chữ thường, bỏ dấu tiếng Việt: "Áo Đầm" -> "ao dam"."""
+    if not text:
+        return ""
+    text = text.lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(fold(text))
+
+
+class ProductSearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}  # token -> {maSP: trọng số}
+        self._vocab = []  # danh sách token đã sắp xếp, dùng cho khớp tiền tố
+        self._docs = {}  # maSP -> (tokens, danh mục, thương hiệu)
+        self.max_id = 0
+        self.ready = False
+        self._version = 0  # tăng mỗi khi chỉ mục thay đổi
+        self._rank_cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._docs)
+
+    # ----- cập nhật -----
+
+    def _add_token(self, token, product_id, weight):
+        posting = self._postings.get(token)
+        if posting is None:
+            posting = self._postings[token] = {}
+            bisect.insort(self._vocab, token)
+        if weight > posting.get(product_id, 0):
+            posting[product_id] = weight
+
+    def _remove_doc(self, product_id):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        for token in doc[0]:
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(product_id, None)
+            if not posting:
+                del self._postings[token]
+                index = bisect.bisect_left(self._vocab, token)
+                if index < len(self._vocab) and self._vocab[index] == token:
+                    del self._vocab[index]
+
+    def upsert(self, product_id, name, category=None, brand=None):
+        """Thêm mới hoặc cập nhật một sản phẩm trong chỉ mục."""
+        fields = {
+            "ten": tokenize(name),
+            "thuonghieu": tokenize(brand),
+            "danhmuc": tokenize(category),
+        }
+        with self._lock:
+            self._remove_doc(product_id)
+            tokens = set()
+            for field, field_tokens in fields.items():
+                for token in field_tokens:
+                    self._add_token(token, product_id, FIELD_WEIGHTS[field])
+                    tokens.add(token)
+            self._docs[product_id] = (tokens, category, brand)
+            if product_id > self.max_id:
+                self.max_id = product_id
+            self._version += 1
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove_doc(product_id)
+            self._version += 1
+
+    def load(self, documents):
+        """Nạp lại toàn bộ từ các dòng (maSP, ten, ten_danhmuc, ten_thuonghieu)."""
+        fresh = ProductSearchIndex()
+        for row in documents:
+            fresh.upsert(row['maSP'], row['ten'], row['ten_danhmuc'], row['ten_thuonghieu'])
+        with self._lock:
+            self._postings = fresh._postings
+            self._vocab = fresh._vocab
+            self._docs = fresh._docs
+            self.max_id = fresh.max_id
+            self._version += 1
+            self.ready = True
+
+    # ----- truy vấn -----
+
+    def _expand(self, token):
+        """Các token trong từ điển có tiền tố `token`, kèm hệ số điểm."""
+        matches = []
+        if token in self._postings:
+            matches.append((token, 1.0))
+        start = bisect.bisect_left(self._vocab, token)
+        for candidate in self._vocab[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+            if not candidate.startswith(token):
+                break
+            if candidate != token:
+                matches.append((candidate, PREFIX_FACTOR))
+        return matches
+
+    def rank(self, query, category=None, brand=None):
+        """Toàn bộ maSP khớp mọi từ trong `query`, xếp theo điểm rồi maSP giảm dần."""
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            expansions = []
+            for token in query_tokens:
+                matches = [(self._postings[c], factor) for c, factor in self._expand(token)]
+                if not matches:
+                    return []
+                expansions.append((sum(len(p) for p, _ in matches), matches))
+            # Bắt đầu từ từ hiếm nhất để tập ứng viên nhỏ ngay từ đầu
+            expansions.sort(key=lambda item: item[0])
+
+            scores = {}
+            for posting, factor in expansions[0][1]:
+                for product_id, weight in posting.items():
+                    score = weight * factor
+                    if score > scores.get(product_id, 0):
+                        scores[product_id] = score
+
+            for _, matches in expansions[1:]:
+                # Chỉ tra các ứng viên còn lại thay vì duyệt cả posting list
+                narrowed = {}
+                for product_id, total in scores.items():
+                    best = 0
+                    for posting, factor in matches:
+                        weight = posting.get(product_id)
+                        if weight and weight * factor > best:
+                            best = weight * factor
+                    if best:
+                        narrowed[product_id] = total + best
+                scores = narrowed
+                if not scores:
+                    return []
+
+            if category or brand:
+                docs = self._docs
+                scores = {
+                    pid: s for pid, s in scores.items()
+                    if (not category or docs[pid][1] == category)
+                    and (not brand or docs[pid][2] == brand)
+                }
+
+        return sorted(scores, key=lambda pid: (-scores[pid], -pid))
+
+    def ranked(self, query, category=None, brand=None):
+        """Như rank() nhưng dùng lại kết quả đã tính nếu chỉ mục chưa đổi."""
+        key = (fold(query).strip(), category, brand)
+        with self._lock:
+            cached = self._rank_cache.get(key)
+            if cached is not None and cached[0] == self._version:
+                self._rank_cache.move_to_end(key)
+                return cached[1]
+            version = self._version
+
+        ranked = self.rank(query, category, brand)
+        with self._lock:
+            self._rank_cache[key] = (version, ranked)
+            self._rank_cache.move_to_end(key)
+            while len(self._rank_cache) > RANK_CACHE_SIZE:
+                self._rank_cache.popitem(last=False)
+        return ranked
+
+    def search(self, query, category=None, brand=None, after=None, limit=24):
+        """
+        Một trang kết quả. `after` là maSP cuối của trang trước trong thứ tự
+        xếp hạng. Trả về (danh sách maSP, next_after).
+        """
+        ranked = self.ranked(query, category, brand)
+        start = 0
+        if after is not None:
+            try:
+                start = ranked.index(after) + 1
+            except ValueError:
+                start = 0
+        page = ranked[start:start + limit]
+        next_after = page[-1] if start + limit < len(ranked) else None
+        return page, next_after
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "documents": len(self._docs),
+                "tokens": len(self._postings),
+                "max_id": self.max_id,
+            }
+
+
+search_index = ProductSearchIndex()
+
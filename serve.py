@@ -0,0 +1,403 @@
+"""
+Chạy ứng dụng cho production: một tiến trình master và N worker uvicorn.
+
+    python run.py --workers 4 --host 0.0.0.0 --port 8000
+    python run.py --reload              # phát triển: một tiến trình, tự nạp lại code
+
+- Mặc định (pre-fork): master bind và listen socket một lần rồi chia cho mọi
+  worker; kernel giao kết nối cho worker nào đang accept. Với `--reuse-port`
+  mỗi worker tự mở socket SO_REUSEPORT của mình (chỉ Linux/BSD) sau khi đã
+  khởi động xong.
+- Địa chỉ/cổng cố định: nếu cổng đang bận thì báo lỗi và thoát, không tự
+  chuyển sang cổng khác.
+- Worker nạp sẵn pool kết nối, chỉ mục tìm kiếm/facet, danh mục/thương hiệu
+  và biên dịch template trước khi nhận request. Không nạp
+  được (DB lỗi) thì worker thoát và master mở lại sau 1, 2, 4... giây (tối đa
+  SERVE_RESPAWN_DELAY_MAX); khi đang restart, worker cũ vẫn phục vụ.
+- `kill -HUP <master>`: khởi động lại lần lượt từng worker; worker cũ chỉ
+  được dừng (SIGTERM, uvicorn phục vụ nốt request đang dở trong
+  `--graceful-timeout` giây) sau khi worker mới đã sẵn sàng.
+- `--max-requests`: worker tự nghỉ sau khoảng đó request (cộng thêm ngẫu
+  nhiên tới `--max-requests-jitter` để các worker không nghỉ cùng lúc);
+  master mở worker thay thế ngay khi worker cũ báo sắp nghỉ.
+- SIGTERM/SIGINT vào master: dừng mọi worker một cách êm rồi thoát.
+- Trước khi mở worker, master build file tĩnh (assets.py); `--reload` dùng
+  thẳng file gốc trong static/.
+
+Mỗi worker có pool kết nối, page cache và số liệu /metrics riêng (số liệu bán
+hàng nằm trong DB, dùng chung); số kết nối MySQL tối đa là workers × DB_POOL_MAX.
+"""
+import argparse
+import multiprocessing
+import multiprocessing.connection
+import os
+import random
+import secrets
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+SERVE_APP = os.getenv("SERVE_APP", "main:app")
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+SERVE_REUSE_PORT = os.getenv("SERVE_REUSE_PORT", "0") == "1"
+SERVE_BACKLOG = int(os.getenv("SERVE_BACKLOG", "2048"))
+# 0 = không giới hạn số request của một worker
+SERVE_MAX_REQUESTS = int(os.getenv("SERVE_MAX_REQUESTS", "0"))
+SERVE_MAX_REQUESTS_JITTER = int(os.getenv("SERVE_MAX_REQUESTS_JITTER", "0"))
+SERVE_GRACEFUL_TIMEOUT = float(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+SERVE_WARMUP = os.getenv("SERVE_WARMUP", "1") == "1"
+
+# Worker chết trước khi sẵn sàng (vd. không warm up được vì DB lỗi): chờ trước
+# khi mở lại, gấp đôi sau mỗi lần liên tiếp tới RESPAWN_DELAY_MAX
+RESPAWN_DELAY = 1.0
+RESPAWN_DELAY_MAX = float(os.getenv("SERVE_RESPAWN_DELAY_MAX", "30"))
+# Mã thoát của worker không warm up được
+WARMUP_FAILED = 3
+
+
+def bind_socket(host, port, backlog=SERVE_BACKLOG, reuse_port=False, listen=True):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        if listen:
+            sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    sock.set_inheritable(True)
+    return sock
+
+
+def warm_up(app_path):
+    """
+    Nạp module ứng dụng và các cache dùng chung trước khi worker nhận request.
+    Trả về False nếu không nạp được từ DB: worker không được nhận request khi
+    còn lạnh.
+    """
+    module_name, _, _ = app_path.partition(":")
+    module = __import__(module_name)
+
+    from mysql.connector import Error
+    from catalog import rebuild_catalog_indexes
+    from db import pool
+    from passwords import password_hasher
+    from refdata import reference_data
+
+    for attr in ("templates", "streamed_templates"):
+        templates = getattr(module, attr, None)
+        if templates is not None:
+            for name in templates.env.list_templates(extensions=["html"]):
+                templates.env.get_template(name)
+
+    started = time.perf_counter()
+    try:
+        pool.warm()
+        with pool.connection() as db:
+            reference_data.categories(db)
+            rebuild_catalog_indexes(db)
+    except Error as e:
+        print(f"Error warming up worker {os.getpid()}: {e}")
+        return False
+    # Sau DB: worker thoát vì DB lỗi thì không còn tiến trình băm mật khẩu nào phải chờ
+    password_hasher.warm()
+    print(f"Worker {os.getpid()} warmed up in {time.perf_counter() - started:.2f}s")
+    return True
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn.Server báo cho master khi đã sẵn sàng và khi sắp nghỉ vì đủ số request."""
+
+    def __init__(self, config, conn):
+        super().__init__(config)
+        self.conn = conn
+        self.retiring = False
+
+    def _notify(self, message):
+        try:
+            self.conn.send((message, os.getpid()))
+        except OSError:
+            pass
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            self._notify("ready")
+
+    async def on_tick(self, counter):
+        should_exit = await super().on_tick(counter)
+        if should_exit and not self.should_exit and not self.retiring:
+            self.retiring = True
+            self._notify("retiring")
+        return should_exit
+
+
+def run_worker(conn, sock, options):
+    if options["warmup"] and not warm_up(options["app"]):
+        # Master mở lại worker sau một khoảng chờ; worker cũ (nếu đang restart) vẫn phục vụ
+        sys.exit(WARMUP_FAILED)
+    if sock is None:
+        # SO_REUSEPORT: chỉ mở socket sau khi đã warm up, kernel mới chia kết nối cho worker này
+        sock = bind_socket(options["host"], options["port"], options["backlog"], reuse_port=True)
+
+    max_requests = options["max_requests"]
+    if max_requests and options["max_requests_jitter"]:
+        max_requests += random.randint(0, options["max_requests_jitter"])
+    config = uvicorn.Config(
+        options["app"],
+        backlog=options["backlog"],
+        limit_max_requests=max_requests or None,
+        timeout_graceful_shutdown=options["graceful_timeout"],
+        log_level=options["log_level"],
+        access_log=options["access_log"],
+    )
+    WorkerServer(config, conn).run(sockets=[sock])
+
+
+class _Worker:
+    __slots__ = ("process", "conn", "ready", "retiring", "replaces")
+
+    def __init__(self, process, conn, replaces=None):
+        self.process = process
+        self.conn = conn
+        self.ready = False
+        self.retiring = False
+        self.replaces = replaces  # worker cũ sẽ bị dừng khi worker này sẵn sàng
+
+
+class Master:
+    def __init__(self, app=SERVE_APP, host=SERVE_HOST, port=SERVE_PORT, workers=SERVE_WORKERS,
+                 reuse_port=SERVE_REUSE_PORT, backlog=SERVE_BACKLOG, max_requests=SERVE_MAX_REQUESTS,
+                 max_requests_jitter=SERVE_MAX_REQUESTS_JITTER, graceful_timeout=SERVE_GRACEFUL_TIMEOUT,
+                 warmup=SERVE_WARMUP, log_level="info", access_log=False):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        if reuse_port and not hasattr(socket, "SO_REUSEPORT"):
+            raise ValueError("SO_REUSEPORT is not supported on this platform")
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.options = {
+            "app": app, "host": host, "port": port, "backlog": backlog, "warmup": warmup,
+            "max_requests": max_requests, "max_requests_jitter": max_requests_jitter,
+            "graceful_timeout": graceful_timeout, "log_level": log_level, "access_log": access_log,
+        }
+        self.reuse_port = reuse_port
+        self.context = multiprocessing.get_context("spawn")
+        self.sock = None
+        self.children = []
+        self.restart_queue = []
+        self.respawns = []  # [(thời điểm, worker cũ mà worker mới sẽ thay)] đang chờ mở lại
+        self.startup_failures = 0
+        self.stopping = False
+        self.reload_requested = False
+
+    def log(self, message):
+        print(f"[master {os.getpid()}] {message}", flush=True)
+
+    # ----- worker -----
+
+    def spawn(self, replaces=None):
+        parent_conn, child_conn = self.context.Pipe(duplex=False)
+        sock = None if self.reuse_port else self.sock
+        process = self.context.Process(target=run_worker, args=(child_conn, sock, self.options),
+                                       name="clothing-shop-worker")
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn, replaces)
+        self.children.append(worker)
+        return worker
+
+    def _stop_worker(self, worker):
+        if worker.process.is_alive():
+            os.kill(worker.process.pid, signal.SIGTERM)
+
+    def _handle_message(self, worker):
+        try:
+            message, _ = worker.conn.recv()
+        except (EOFError, OSError):
+            return
+        if message == "ready":
+            worker.ready = True
+            self.startup_failures = 0
+            self.log(f"worker {worker.process.pid} ready")
+            if worker.replaces is not None:
+                self.log(f"stopping worker {worker.replaces.process.pid}")
+                worker.replaces.retiring = True
+                self._stop_worker(worker.replaces)
+                worker.replaces = None
+        elif message == "retiring" and not self.stopping:
+            worker.retiring = True
+            self.log(f"worker {worker.process.pid} reached max requests, starting a replacement")
+            self.spawn()
+
+    def _reap(self):
+        for worker in list(self.children):
+            if worker.process.is_alive():
+                continue
+            worker.process.join()
+            worker.conn.close()
+            self.children.remove(worker)
+            if worker in self.restart_queue:
+                self.restart_queue.remove(worker)
+            if self.stopping:
+                continue
+            replaced_by = [w for w in self.children if w.replaces is worker]
+            if worker.retiring or replaced_by:
+                # Đã có worker thay thế
+                for w in replaced_by:
+                    w.replaces = None
+                continue
+            if any(old is worker for _, old in self.respawns):
+                # Worker cũ chết khi worker thay nó còn chờ mở lại: worker đó sẽ là worker thường
+                self.respawns = [(due, None if old is worker else old) for due, old in self.respawns]
+                continue
+            if not worker.ready:
+                self.startup_failures += 1
+                delay = min(RESPAWN_DELAY_MAX, RESPAWN_DELAY * 2 ** (self.startup_failures - 1))
+                self.log(f"worker {worker.process.pid} exited during startup "
+                         f"(code {worker.process.exitcode}), retrying in {delay:.0f}s")
+                # Worker mới của một lần restart chết khi đang khởi động: thử lại, worker cũ vẫn chạy
+                self.respawns.append((time.monotonic() + delay, worker.replaces))
+            else:
+                self.log(f"worker {worker.process.pid} exited (code {worker.process.exitcode})")
+                self.spawn(replaces=worker.replaces)
+
+    def _respawn_due(self):
+        now = time.monotonic()
+        due = [entry for entry in self.respawns if entry[0] <= now]
+        self.respawns = [entry for entry in self.respawns if entry[0] > now]
+        for _, replaces in due:
+            if replaces is not None and not replaces.process.is_alive():
+                replaces = None
+            self.spawn(replaces=replaces)
+
+    def _rolling_restart(self):
+        """Mỗi lần chỉ thay một worker: mở worker mới, dừng worker cũ khi mới đã sẵn sàng."""
+        if any(w.replaces is not None for w in self.children) or any(old for _, old in self.respawns):
+            return
+        while self.restart_queue:
+            old = self.restart_queue.pop(0)
+            if old in self.children and old.process.is_alive():
+                self.spawn(replaces=old)
+                return
+
+    # ----- vòng lặp chính -----
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def run(self):
+        host, port = self.options["host"], self.options["port"]
+        # Với SO_REUSEPORT master vẫn giữ một socket đã bind (không listen) để giữ cổng
+        self.sock = bind_socket(host, port, self.options["backlog"], reuse_port=self.reuse_port,
+                                listen=not self.reuse_port)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._on_reload)
+
+        mode = "SO_REUSEPORT" if self.reuse_port else "pre-fork"
+        self.log(f"listening on http://{host}:{port} with {self.workers} workers ({mode})")
+        for _ in range(self.workers):
+            self.spawn()
+
+        try:
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.log("rolling restart")
+                    self.restart_queue = [w for w in self.children if not w.retiring]
+                ready = multiprocessing.connection.wait(
+                    [w.conn for w in self.children] + [w.process.sentinel for w in self.children],
+                    timeout=0.5)
+                for worker in list(self.children):
+                    if worker.conn in ready:
+                        self._handle_message(worker)
+                self._reap()
+                self._respawn_due()
+                if self.restart_queue:
+                    self._rolling_restart()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.stopping = True
+        self.log("stopping workers")
+        for worker in self.children:
+            self._stop_worker(worker)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        for worker in self.children:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+        self.children = []
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clothing Shop server")
+    parser.add_argument("--app", default=SERVE_APP)
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--reuse-port", action="store_true", default=SERVE_REUSE_PORT,
+                        help="mỗi worker có socket SO_REUSEPORT riêng thay vì dùng chung socket của master")
+    parser.add_argument("--backlog", type=int, default=SERVE_BACKLOG)
+    parser.add_argument("--max-requests", type=int, default=SERVE_MAX_REQUESTS)
+    parser.add_argument("--max-requests-jitter", type=int, default=SERVE_MAX_REQUESTS_JITTER)
+    parser.add_argument("--graceful-timeout", type=float, default=SERVE_GRACEFUL_TIMEOUT)
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", default=SERVE_WARMUP)
+    parser.add_argument("--no-build-assets", dest="build_assets", action="store_false",
+                        help="không build lại static/dist khi khởi động")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--reload", action="store_true", help="phát triển: một tiến trình, tự nạp lại khi code đổi")
+    args = parser.parse_args(argv)
+
+    if not os.getenv("SESSION_SECRET"):
+        # Mọi worker (và các lần nạp lại) phải ký phiên bằng cùng một khóa
+        print("Warning: SESSION_SECRET is not set, using a random key: sessions end when the server restarts")
+        os.environ["SESSION_SECRET"] = secrets.token_urlsafe(32)
+
+    print(f"   Starting Clothing Shop on http://{args.host}:{args.port}")
+    print("   Available routes:")
+    print(f"   http://{args.host}:{args.port} - Trang chủ")
+    print(f"   http://{args.host}:{args.port}/products - Sản phẩm")
+    print(f"   http://{args.host}:{args.port}/login - Đăng nhập")
+    print(f"   http://{args.host}:{args.port}/register - Đăng ký")
+
+    if args.reload:
+        os.environ["ASSETS_FINGERPRINT"] = "0"
+        uvicorn.run(args.app, host=args.host, port=args.port, reload=True, log_level=args.log_level)
+        return
+
+    if args.build_assets:
+        import assets
+        assets.build()
+
+    try:
+        master = Master(app=args.app, host=args.host, port=args.port, workers=args.workers,
+                        reuse_port=args.reuse_port, backlog=args.backlog, max_requests=args.max_requests,
+                        max_requests_jitter=args.max_requests_jitter, graceful_timeout=args.graceful_timeout,
+                        warmup=args.warmup, log_level=args.log_level, access_log=args.access_log)
+        master.run()
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Error starting server on {args.host}:{args.port}: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
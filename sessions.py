@@ -0,0 +1,200 @@
+"""
+Phiên đăng nhập bằng một cookie ký HMAC, thay cho ba cookie user_id /
+username / role mà ai cũng sửa được.
+
+Cookie `session` = `v1.<payload>.<chữ ký>` (base64url), payload là
+[maND, tenDangNhap, vaiTro, thời điểm cấp, hạn dùng]. Kiểm tra chỉ cần
+tính lại HMAC-SHA256 và so sánh thời gian hằng (hmac.compare_digest), không
+cần truy vấn DB.
+
+- Hết `SESSION_TTL` giây thì phải đăng nhập lại.
+- Phiên cũ hơn `SESSION_ROTATE_AFTER` giây được cấp token mới (hạn mới)
+  trong response của request kế tiếp, nên người dùng thường xuyên không bị
+  đăng xuất; token ký bằng khóa cũ cũng được cấp lại bằng khóa mới. Trước
+  khi cấp lại, vai trò được đọc lại từ profile: tài khoản đã xóa thì phiên bị
+  hủy, vai trò đã đổi thì token mới mang vai trò mới. Vai trò trong token vì
+  thế chậm hơn DB tối đa `SESSION_ROTATE_AFTER` giây.
+- `SESSION_SECRET` có thể là nhiều khóa cách nhau bởi dấu phẩy: khóa đầu dùng
+  để ký, các khóa sau chỉ để chấp nhận token cũ khi đổi khóa. Đổi khóa đầu
+  và bỏ hết khóa cũ là cách thu hồi mọi phiên.
+
+Không đặt `SESSION_SECRET` thì mỗi lần khởi động sinh khóa ngẫu nhiên
+(serve.py sinh một khóa chung cho mọi worker): phiên mất khi khởi động lại.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+
+SESSION_COOKIE = os.getenv("SESSION_COOKIE", "session")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_ROTATE_AFTER = int(os.getenv("SESSION_ROTATE_AFTER", str(24 * 3600)))
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "0") == "1"
+
+TOKEN_VERSION = "v1"
+# Cookie cũ trước khi có phiên ký: xóa khi đăng nhập/đăng xuất
+LEGACY_COOKIES = ("user_id", "username", "role")
+
+# Khóa của request trong scope ASGI
+_USER_KEY = "session.user"
+_REFRESH_KEY = "session.refresh"
+
+
+def _load_secrets():
+    configured = [key.strip() for key in os.getenv("SESSION_SECRET", "").split(",") if key.strip()]
+    if configured:
+        return [key.encode("utf-8") for key in configured]
+    print("Warning: SESSION_SECRET is not set, sessions will not survive a restart")
+    return [secrets.token_bytes(32)]
+
+
+SESSION_SECRETS = _load_secrets()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(key, message):
+    return hmac.new(key, message, hashlib.sha256).digest()
+
+
+def create_token(user_id, username, role, now=None):
+    issued_at = int(now if now is not None else time.time())
+    payload = json.dumps([str(user_id), username, role, issued_at, issued_at + SESSION_TTL],
+                         separators=(",", ":"), ensure_ascii=False)
+    message = f"{TOKEN_VERSION}.{_b64encode(payload.encode('utf-8'))}"
+    return f"{message}.{_b64encode(_sign(SESSION_SECRETS[0], message.encode('ascii')))}"
+
+
+def verify_token(token, now=None):
+    """
+    Trả về (user, cần cấp lại?) với user dạng {"user_id", "username", "role"},
+    hoặc (None, False) nếu token sai chữ ký, sai định dạng hoặc đã hết hạn.
+    """
+    try:
+        version, payload, signature = token.split(".")
+        if version != TOKEN_VERSION:
+            return None, False
+        message = f"{version}.{payload}".encode("ascii")
+        signature = _b64decode(signature)
+    except (ValueError, UnicodeEncodeError):
+        return None, False
+
+    key_index = None
+    for index, key in enumerate(SESSION_SECRETS):
+        # So sánh với mọi khóa, không dừng sớm, để thời gian không phụ thuộc khóa nào khớp
+        if hmac.compare_digest(_sign(key, message), signature) and key_index is None:
+            key_index = index
+    if key_index is None:
+        return None, False
+
+    try:
+        user_id, username, role, issued_at, expires_at = json.loads(_b64decode(payload))
+    except ValueError:
+        return None, False
+    now = now if now is not None else time.time()
+    if now >= expires_at:
+        return None, False
+    user = {"user_id": user_id, "username": username, "role": role}
+    return user, key_index > 0 or now - issued_at >= SESSION_ROTATE_AFTER
+
+
+def current_user(request):
+    """Người dùng của request (đã kiểm tra chữ ký), None nếu chưa đăng nhập. Chỉ kiểm tra một lần mỗi request."""
+    scope = request.scope
+    if _USER_KEY not in scope:
+        user, refresh = None, False
+        token = request.cookies.get(SESSION_COOKIE)
+        if token:
+            user, refresh = verify_token(token)
+        scope[_USER_KEY] = user
+        scope[_REFRESH_KEY] = refresh
+    return scope[_USER_KEY]
+
+
+def _cookie_header(value, max_age):
+    cookie = f"{SESSION_COOKIE}={value}; HttpOnly; Max-Age={max_age}; Path=/; SameSite=lax"
+    if SESSION_COOKIE_SECURE:
+        cookie += "; Secure"
+    return cookie
+
+
+def _set_cookie(response, value, max_age):
+    response.set_cookie(SESSION_COOKIE, value, max_age=max_age, httponly=True,
+                        samesite="lax", secure=SESSION_COOKIE_SECURE)
+
+
+def start_session(response, user_id, username, role):
+    """Gắn cookie phiên vào response đăng nhập."""
+    _set_cookie(response, create_token(user_id, username, role), SESSION_TTL)
+    for name in LEGACY_COOKIES:
+        response.delete_cookie(name)
+
+
+def end_session(response):
+    response.delete_cookie(SESSION_COOKIE)
+    for name in LEGACY_COOKIES:
+        response.delete_cookie(name)
+
+
+class SessionMiddleware:
+    """
+    Cấp lại token khi phiên đã cũ hoặc ký bằng khóa cũ, sau khi đọc lại vai
+    trò qua `load_profile(maND)` (coroutine trả về profile có `vaiTro`, None
+    nếu tài khoản không còn). Việc đọc lại làm trước khi chạy route, nên chính
+    request đó đã thấy người dùng bị đăng xuất hoặc vai trò mới. Response tự
+    đặt cookie phiên (đăng nhập, đăng xuất) được giữ nguyên.
+    """
+
+    def __init__(self, app, load_profile):
+        self.app = app
+        self.load_profile = load_profile
+
+    async def _reissue(self, scope):
+        """Header Set-Cookie thay cho token cũ, None nếu chưa cấp lại được."""
+        user = scope[_USER_KEY]
+        try:
+            profile = await self.load_profile(user["user_id"])
+        except Exception as e:
+            # Giữ token cũ, request sau thử lại
+            print(f"Error re-reading session role: {e}")
+            return None
+        if profile is None:
+            scope[_USER_KEY] = None
+            return _cookie_header('""', 0)
+        if profile["vaiTro"] != user["role"] or profile["tenDangNhap"] != user["username"]:
+            user = dict(user, username=profile["tenDangNhap"], role=profile["vaiTro"])
+            scope[_USER_KEY] = user
+        return _cookie_header(create_token(user["user_id"], user["username"], user["role"]), SESSION_TTL)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        current_user(Request(scope))
+        cookie = await self._reissue(scope) if scope[_REFRESH_KEY] else None
+        if cookie is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_refresh(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                prefix = f"{SESSION_COOKIE}="
+                if not any(value.startswith(prefix) for value in headers.getlist("set-cookie")):
+                    headers.append("set-cookie", cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_with_refresh)
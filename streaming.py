@@ -0,0 +1,59 @@
+"""
+Render template theo luồng (Template.generate_async) cho các trang lớn.
+
+`TemplateResponse` của Starlette render cả trang thành một chuỗi rồi mới gửi
+byte đầu tiên. `TemplateStreamer.TemplateResponse` gửi từng khối ngay khi
+render xong: khối được đẩy đi khi đủ `STREAM_FLUSH_BYTES` hoặc khi template
+gọi `{{ flush() }}` (vd. ngay sau phần đầu trang và form lọc, trước khi chờ
+DB lấy thẻ sản phẩm). Biến trong context có thể là async iterator, template
+lặp qua bằng `{% for %}` như list bình thường.
+
+Template dùng chung loader và biến toàn cục (url_for...) với `templates`;
+khi render thường, `flush()` không in gì.
+"""
+import os
+
+from jinja2 import pass_context
+from markupsafe import Markup
+from starlette.responses import StreamingResponse
+
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", "16384"))
+
+FLUSH_MARKER = Markup("<!--flush-->")
+
+
+@pass_context
+def flush(context):
+    return FLUSH_MARKER if context.environment.is_async else ""
+
+
+class TemplateStreamer:
+    def __init__(self, templates, flush_bytes=STREAM_FLUSH_BYTES):
+        templates.env.globals["flush"] = flush
+        # Bản async của env: cache riêng vì template async được biên dịch khác
+        self.env = templates.env.overlay(enable_async=True, cache_size=400)
+        self.flush_bytes = flush_bytes
+
+    def TemplateResponse(self, name, context, status_code=200, headers=None):
+        template = self.env.get_template(name)
+        return StreamingResponse(self._chunks(template, context), status_code=status_code,
+                                 media_type="text/html", headers=headers)
+
+    async def _chunks(self, template, context):
+        buffer = []
+        size = 0
+        async for part in template.generate_async(context):
+            if FLUSH_MARKER in part:
+                buffer.append(part.replace(FLUSH_MARKER, ""))
+                size = self.flush_bytes
+            else:
+                buffer.append(part)
+                size += len(part)
+            if size >= self.flush_bytes:
+                chunk = "".join(buffer)
+                buffer = []
+                size = 0
+                if chunk:
+                    yield chunk.encode("utf-8")
+        if buffer:
+            yield "".join(buffer).encode("utf-8")